@@ -1,10 +1,26 @@
-from flask import Flask, Blueprint, jsonify, request, send_from_directory
+from flask import Flask, Blueprint, jsonify, request, url_for
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
 from extensions import db, migrate
 from werkzeug.utils import secure_filename
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_jwt_extended import JWTManager  # Import JWTManager
 from auth.authentication import token_required
+from auth.principal_cache import principal_cache
+from auth.revocation import revocation_store
+from auth.password_hasher import password_hasher, HasherOverloaded
+from services.response_cache import response_cache
+from services.media_store import media_store
+from services.background import background_jobs
+from services.db_pool import enforce_sqlite_foreign_keys
+from routes.helper import allowed_image
+from services.search import search_index
+from services.facets import ensure_facet_counts, rebuild_facet_counts
+from services.geo import geocoder
+from services.metrics import metrics, PROMETHEUS_MIMETYPE
+from services.admission import admission
+from services.replicas import replica_router
+from services.popularity import view_counter, popular_posts
 from datetime import timedelta
 import sys
 import os
@@ -26,11 +42,35 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)  # Set expiration to 24 hours
     app.config['UPLOAD_FOLDER'] = 'static/uploads'
 
+    # request.remote_addr and scheme of the client rather than of the proxy in front
+    if app.config.get('TRUSTED_PROXIES'):
+        proxies = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies)
+
 
     # Initialize the database and migration
     db.init_app(app)
     migrate.init_app(app, db)
+    replica_router.init_app(app)
+    with app.app_context():
+        enforce_sqlite_foreign_keys(db.engine)  # posts.user_id cascades on user deletion
+    metrics.init_app(app)
+    admission.init_app(app)  # after metrics, so rejected requests are timed and counted too
+    search_index.init_app(app)
+    principal_cache.init_app(app)
+    revocation_store.init_app(app)
+    password_hasher.init_app(app)
+    response_cache.init_app(app)
+    media_store.init_app(app)
+    background_jobs.init_app(app)
+    geocoder.init_app(app)
+    view_counter.init_app(app)
+    popular_posts.init_app(app)
     jwt = JWTManager(app)
+
+    @jwt.token_in_blocklist_loader
+    def check_if_token_revoked(jwt_header, jwt_payload):
+        return revocation_store.is_revoked(jwt_payload["jti"])
     CORS(app)
 
     # Register blueprints
@@ -43,12 +83,32 @@ def create_app():
     app.register_blueprint(home_bp)
 
 
+    @app.errorhandler(HasherOverloaded)
+    def hasher_overloaded(e):
+        return jsonify({"error": "Server is busy, please retry"}), 503, {'Retry-After': str(e.retry_after)}
+
+
     # Add a default route for the root URL
     @app.route('/splash', methods=['GET'])
     def splash():
         return jsonify({"message": "Welcome to Renty"}), 200
 
 
+    @app.route('/stats/principal-cache', methods=['GET'])
+    def principal_cache_stats():
+        return jsonify(principal_cache.stats()), 200
+
+
+    @app.route('/stats/response-cache', methods=['GET'])
+    def response_cache_stats():
+        return jsonify(response_cache.stats()), 200
+
+
+    @app.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return metrics.render(), 200, {'Content-Type': PROMETHEUS_MIMETYPE}
+
+
     @app.route('/upload', methods=['POST'])
     def upload_file():
         if 'file' not in request.files:
@@ -58,19 +118,79 @@ def create_app():
             return 'No selected file', 400
         if file:
             filename = secure_filename(file.filename)  # Make sure the filename is safe
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-            return {'filename': filename}, 200
+            if not allowed_image(filename):
+                return 'File must be a png, jpg or jpeg image', 400
+            # Stored under the hash of its content; variants are rendered in the background
+            stored_name = media_store.save(file.stream, filename.rsplit('.', 1)[1])
+            variants = {'original': stored_name, **media_store.variant_names(stored_name)}
+            return {
+                'filename': stored_name,
+                'variants': {key: url_for('uploaded_file', filename=name, _external=True)
+                             for key, name in variants.items()}
+            }, 200
 
 
 # Endpoint to serve the uploaded images
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-
-
-    # Create tables
-    with app.app_context():
-        db.create_all()
+        try:
+            return media_store.send(secure_filename(filename))
+        except FileNotFoundError:
+            return 'File not found', 404
+
+
+    @app.cli.command('geocode-posts')
+    def geocode_posts():
+        """Fill latitude/longitude/geohash of posts created before geocoding"""
+        from models.post import Post
+        done = 0
+        for location, in db.session.query(Post.location).filter(Post.geohash.is_(None)).distinct().all():
+            coordinates = geocoder.coordinates(location)
+            if coordinates['geohash']:
+                done += Post.query.filter(Post.location == location, Post.geohash.is_(None)) \
+                    .update(coordinates, synchronize_session=False)
+        db.session.commit()
+        print(f'Geocoded {done} posts')
+
+
+    @app.cli.command('register-uploads')
+    def register_uploads():
+        """Record the files already in the upload folder in the image registry"""
+        names = list(media_store.stored_names())
+        done = sum(media_store.register(names[start:start + 500]) for start in range(0, len(names), 500))
+        print(f'Registered {done} uploads')
+
+
+    @app.cli.command('prune-tombstones')
+    def prune_post_tombstones():
+        """Drop tombstones older than CHANGE_FEED_TOMBSTONE_DAYS"""
+        from services.changes import prune_tombstones
+        print(f'Pruned {prune_tombstones(app.config["CHANGE_FEED_TOMBSTONE_DAYS"])} tombstones')
+
+
+    @app.cli.command('rebuild-facet-counts')
+    def rebuild_facets():
+        """Recount the facet counters from the posts table"""
+        rebuild_facet_counts()
+        print('Facet counters rebuilt')
+
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index():
+        """Reindex every post in the search backend"""
+        search_index.rebuild()
+        db.session.commit()
+        print(f'Search index ({search_index.backend.name}) rebuilt')
+
+
+    # Create tables, unless the schema is managed by migrations (`flask db upgrade`)
+    if app.config.get('CREATE_TABLES', True):
+        with app.app_context():
+            db.create_all()
+            search_index.create_tables()
+            db.session.commit()
+            ensure_facet_counts()
+            media_store.ensure_registered()
 
     return app  # Return the app instance here, outside the `with` block
 
@@ -0,0 +1,156 @@
+"""
+ASGI entry point: the read endpoints run as async handlers on async
+SQLAlchemy sessions, everything else is the regular Flask app.
+
+    uvicorn asgi:create_asgi_app --factory --workers 4
+
+GET /home/search, /home/category, /home/posts/<id> and /users/user/posts are
+answered by routes/async_routes.py with the same JSON as the blueprints,
+without holding a thread while the database works. Other requests are handed
+to the WSGI app on a thread pool (ASGI_WSGI_THREADS).
+
+Needs a2wsgi and an async driver: aiomysql for MySQL, aiosqlite for SQLite.
+ASYNC_DATABASE_URL overrides the URL derived from SQLALCHEMY_DATABASE_URI.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import io
+
+from a2wsgi import WSGIMiddleware
+from flask import jsonify
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import Map, Rule
+from app import create_app
+from routes.async_routes import ASYNC_ROUTES, NDJSONStream, authenticate
+from services.db_pool import MeteredAsyncQueuePool
+from services.metrics import metrics
+from services.serialization import ndjson_chunk, NDJSON_MIMETYPE
+
+# Sync driver -> its asyncio counterpart
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "mysql": "mysql+aiomysql"}
+
+
+def async_database_url(url):
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def _environ(scope):
+    """Minimal WSGI environ of a bodiless ASGI request, enough for a Flask request context"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": "HTTP/" + scope.get("http_version", "1.1"),
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name, value = name.decode("latin-1"), value.decode("latin-1")
+        key = {"content-type": "CONTENT_TYPE", "content-length": "CONTENT_LENGTH"}.get(
+            name, "HTTP_" + name.upper().replace("-", "_"))
+        environ[key] = environ[key] + "," + value if key in environ else value
+    return environ
+
+
+class AsyncReadApp:
+    """ASGI application routing the async read handlers, the Flask app for the rest"""
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        config = flask_app.config
+        url = config.get("ASYNC_DATABASE_URL") or async_database_url(config["SQLALCHEMY_DATABASE_URI"])
+        options = {"poolclass": MeteredAsyncQueuePool, **config.get("ASYNC_ENGINE_OPTIONS", {})}
+        self.engine = create_async_engine(url, **options)
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        if metrics.enabled:
+            metrics.instrument_engine(self.engine.sync_engine)
+            metrics.instrument_pool(self.engine.sync_engine, "async")
+        self.routes = Map([Rule(path, endpoint=handler, methods=["GET"]) for path, handler in ASYNC_ROUTES.items()])
+        self.wsgi = WSGIMiddleware(flask_app, workers=config.get("ASGI_WSGI_THREADS", 10))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] == "http":
+            try:
+                handler, view_args = self.routes.bind("").match(scope["path"], method=scope["method"])
+            except (NotFound, MethodNotAllowed):
+                pass
+            else:
+                return await self._dispatch(handler, view_args, scope, send)
+        return await self.wsgi(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _dispatch(self, handler, view_args, scope, send):
+        # The request context lives in this task's contextvars, so it is safe across awaits
+        with self.flask_app.request_context(_environ(scope)):
+            async with self.sessions() as session:
+                try:
+                    # before_request hooks (metrics) run as they would in the Flask app
+                    rv = self.flask_app.preprocess_request()
+                    if rv is None:
+                        user_id, rv = await authenticate(session)
+                    if rv is None:
+                        rv = await handler(session, user_id=user_id, **view_args)
+                except SQLAlchemyError as e:
+                    rv = jsonify({'error': str(e)}), 500
+
+                if isinstance(rv, NDJSONStream):
+                    response = self.flask_app.response_class(mimetype=NDJSON_MIMETYPE)
+                    response = self.flask_app.process_response(response)
+                    del response.headers["Content-Length"]  # length unknown, the body is streamed
+                    await self._start(send, response)
+                    await self._body(send, ndjson_chunk(rv.first, rv.fields), more=True)
+                    try:
+                        async for partition in rv.partitions:
+                            await self._body(send, ndjson_chunk(partition, rv.fields), more=True)
+                    finally:
+                        await rv.result.close()
+                    await self._body(send, b"")
+                    return
+
+                # after_request hooks (CORS) run as they would in the Flask app
+                response = self.flask_app.process_response(self.flask_app.make_response(rv))
+                await self._start(send, response)
+                await self._body(send, response.get_data())
+
+    @staticmethod
+    async def _start(send, response):
+        await send({
+            "type": "http.response.start",
+            "status": response.status_code,
+            "headers": [(key.lower().encode("latin-1"), value.encode("latin-1"))
+                        for key, value in response.headers.items()],
+        })
+
+    @staticmethod
+    async def _body(send, body, more=False):
+        await send({"type": "http.response.body", "body": body, "more_body": more})
+
+
+def create_asgi_app():
+    return AsyncReadApp(create_app())
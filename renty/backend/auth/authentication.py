@@ -2,64 +2,92 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 from functools import wraps
-from flask import request, jsonify
+from flask import g, request, jsonify
 import jwt
 from models.user import User
+from auth.principal_cache import principal_cache
+from auth.revocation import revocation_store
 
 # Encodes and decodes JWT tokens
 SECRET_KEY = os.getenv('JWT_SECRET_KEY', '123456789')
-revoked_tokens = set()  # Tracks invalid tokens
+
+class AuthError(Exception):
+    """Why a request could not be authenticated, answered with 401"""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+def verify_token_header(auth_header):
+    """
+    User id of a valid, unrevoked 'Bearer <token>' header, raises AuthError.
+
+    Only checks the token itself; callers still make sure the user exists
+    (see user_exists() below and the async handlers in asgi.py).
+    """
+    # Check if 'Authorization' header is present
+    if auth_header is None:
+        raise AuthError("Authorization header missing")
+
+    try:
+        token = auth_header.split(" ")[1]  # Extract token after 'Bearer'
+    except IndexError:
+        raise AuthError("Authorization header is invalid. Bearer token missing")
+
+    if not token:
+        raise AuthError("Token not found")
+
+    try:
+        # Decode the token using the same secret key
+        data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        jti = data['jti']  # Ensure your JWT includes a 'jti' claim
+    except jwt.ExpiredSignatureError:
+        raise AuthError("Token has expired")
+    except jwt.InvalidTokenError:
+        raise AuthError("Invalid token")
+
+    if revocation_store.is_revoked(jti):
+        raise AuthError("Token has been revoked")
+    return data['sub']
+
+
+def request_user_id():
+    """
+    verify_token_header() of the current request's Authorization header.
+
+    Decoded once per request and kept on g, admission control and
+    token_required both need it.
+    """
+    if 'token_identity' not in g:
+        try:
+            g.token_identity = verify_token_header(request.headers.get('Authorization'))
+        except AuthError as e:
+            g.token_identity = e
+    if isinstance(g.token_identity, AuthError):
+        raise g.token_identity
+    return g.token_identity
+
+
+def user_exists(user_id):
+    # Verify the user exists, the cache spares the lookup on repeat requests
+    if not principal_cache.contains(user_id):
+        if User.query.get(user_id) is None:
+            return False
+        principal_cache.add(user_id)
+    return True
+
 
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-
-        # Check if 'Authorization' header is present
-        if 'Authorization' in request.headers:
-            auth_header = request.headers['Authorization']
-            # Debug: Print the Authorization header
-            print(f"Authorization header received: {auth_header}")
-            try:
-                token = auth_header.split(" ")[1]  # Extract token after 'Bearer'
-            except IndexError:
-                # Debug: Missing Bearer token format
-                print("Error: Token missing after Bearer")
-                return jsonify({"error": "Authorization header is invalid. Bearer token missing"}), 401
-        else:
-            # Debug: No Authorization header present
-            print("Error: No Authorization header found")
-            return jsonify({"error": "Authorization header missing"}), 401
-
-        if not token:
-            # Debug: No token was extracted from the header
-            print("Error: No token extracted from header")
-            return jsonify({"error": "Token not found"}), 401
-
         try:
-            # Decode the token using the same secret key
-            data = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
-            jti = data['jti']  # Ensure your JWT includes a 'jti' claim
-
-            if jti in revoked_tokens:
-                return jsonify({"error": "Token has been revoked"}), 401
-
-            user_id = data['sub']
-            # Verify the user exists
-            user = User.query.get(user_id)
-            if not user:
-                # Debug: User not found in the database
-                print("Error: User not found")
-                return jsonify({"error": "User not found"}), 401
-
-        except jwt.ExpiredSignatureError:
-            # Debug: Token has expired
-            print("Error: Token has expired")
-            return jsonify({"error": "Token has expired"}), 401
-        except jwt.InvalidTokenError:
-            # Debug: Token is invalid
-            print("Error: Invalid token")
-            return jsonify({"error": "Invalid token"}), 401
+            user_id = request_user_id()
+        except AuthError as e:
+            return jsonify({"error": e.message}), 401
+        g.user_id = user_id  # read-your-writes routing, see services/replicas.py
+        if not user_exists(user_id):
+            return jsonify({"error": "User not found"}), 401
 
         # Pass the user_id to the decorated function
         return f(user_id=user_id, *args, **kwargs)
@@ -0,0 +1,99 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+
+class HasherOverloaded(Exception):
+    """Raised when too many hash jobs are already queued, or one outlived the timeout; callers answer 503"""
+    retry_after = 1
+
+
+# Run inside the pool processes, so they have to be importable top level functions
+def _hashpw(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+class PasswordHasher:
+    """
+    bcrypt hashing on a bounded process pool.
+
+    At most `queue_limit` jobs are in flight; the next one raises
+    HasherOverloaded immediately instead of piling up behind a login burst.
+    A job holds its slot until the pool is done with it, even when its
+    caller gave up after `timeout` seconds with HasherOverloaded too.
+    With workers=0 hashing runs inline in the calling thread.
+    """
+
+    def __init__(self, rounds=12, workers=0, queue_limit=None, timeout=30):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+
+    def init_app(self, app):
+        self.shutdown()
+        self.rounds = app.config.get('BCRYPT_ROUNDS', self.rounds)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers)
+        self.queue_limit = app.config.get('PASSWORD_HASH_QUEUE_LIMIT') or max(self.workers, 1) * 4
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', self.timeout)
+        self._slots = threading.BoundedSemaphore(self.queue_limit)
+        app.extensions['password_hasher'] = self
+
+    def _executor(self):
+        # Created on first use so every (forked) web worker gets its own pool
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        slots = self._slots
+        if slots is not None and not slots.acquire(blocking=False):
+            raise HasherOverloaded()
+        try:
+            future = self._executor().submit(fn, *args)
+        except BaseException:
+            if slots is not None:
+                slots.release()
+            raise
+        if slots is not None:
+            future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()  # only possible while still queued, a running job keeps its slot to the end
+            raise HasherOverloaded() from None
+
+    def hash(self, password):
+        return self._run(_hashpw, password.encode('utf-8'), self.rounds).decode('utf-8')
+
+    def verify(self, password, hashed):
+        return self._run(_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed):
+        """True when the hash was made with a different cost than BCRYPT_ROUNDS"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+
+password_hasher = PasswordHasher()
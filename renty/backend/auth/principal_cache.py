@@ -0,0 +1,169 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from services.shared_memory import HostLock, map_file, shared_memory_path
+
+
+# Eviction sequence at the last miss of the request (thread or task): add() checks what was evicted since
+_missed_at = ContextVar('principal_cache_missed_at', default=None)
+
+
+def _key(user_id):
+    return hashlib.blake2b(str(user_id).encode('utf-8'), digest_size=16).digest()
+
+
+class EvictionLog:
+    """
+    Ring of the last `slots` user ids evicted, behind a sequence number.
+
+    Layout: [sequence][slots keys of 16 bytes]; eviction n is in slot n % slots.
+    With a `shm_name` the ring lives in a memory-mapped file, so an eviction
+    written by one worker is read by every worker on the host. Writers are
+    serialized by a HostLock; readers take no lock and check the sequence
+    again after reading, in case a writer lapped them.
+    """
+    SEQUENCE = struct.Struct('<Q')
+    KEY_SIZE = 16
+
+    def __init__(self, shm_name=None, slots=1024):
+        self.slots = slots
+        size = self.SEQUENCE.size + slots * self.KEY_SIZE
+        if shm_name:
+            path = shared_memory_path(shm_name)
+            self._buffer = map_file(path, size)
+            self._lock = HostLock(path + '.lock')
+        else:
+            self._buffer = bytearray(size)
+            self._lock = HostLock()
+
+    @property
+    def sequence(self):
+        return self.SEQUENCE.unpack_from(self._buffer, 0)[0]
+
+    def _slot(self, sequence):
+        return self.SEQUENCE.size + sequence % self.slots * self.KEY_SIZE
+
+    def append(self, key):
+        with self._lock():
+            sequence = self.sequence + 1
+            # The key before the sequence: a reader that sees the new sequence finds it
+            offset = self._slot(sequence)
+            self._buffer[offset:offset + self.KEY_SIZE] = key
+            self.SEQUENCE.pack_into(self._buffer, 0, sequence)
+
+    def since(self, seen):
+        """(sequence, keys evicted after `seen`), keys is None when they are no longer all in the ring"""
+        sequence = self.sequence
+        if sequence - seen > self.slots:
+            return sequence, None
+        keys = []
+        for position in range(seen + 1, sequence + 1):
+            offset = self._slot(position)
+            keys.append(bytes(self._buffer[offset:offset + self.KEY_SIZE]))
+        if self.sequence - seen > self.slots:
+            return sequence, None
+        return sequence, keys
+
+
+class PrincipalCache:
+    """
+    Bounded LRU cache of user ids already verified against the database.
+
+    token_required checks it before running User.query.get, so only the first
+    request of a user within `ttl` seconds pays for the lookup. Entries are
+    evicted least recently used once `maxsize` is reached.
+
+    The cache is per worker. update_user and delete_user write the user to
+    an EvictionLog, shared by the workers of the host with
+    PRINCIPAL_CACHE_SHM_NAME, and every worker drops that user, and only
+    that user, at its next request. A worker that fell more than a ring
+    behind starts over.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = EvictionLog()
+        self._entries = OrderedDict()  # key of the user id -> expiry (monotonic seconds)
+        self._seen = 0  # evictions applied to the entries
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.maxsize = app.config.get('PRINCIPAL_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('PRINCIPAL_CACHE_TTL', self.ttl)
+        self.evictions = EvictionLog(app.config.get('PRINCIPAL_CACHE_SHM_NAME'),
+                                     app.config.get('PRINCIPAL_CACHE_EVICTION_SLOTS', 1024))
+        self._seen = self.evictions.sequence
+        self.clear()
+        app.extensions['principal_cache'] = self
+
+    def _apply_evictions(self):
+        # Called with self._lock held; the common case is one memory read
+        if self.evictions.sequence == self._seen:
+            return
+        self._seen, keys = self.evictions.since(self._seen)
+        if keys is None:
+            self._entries.clear()
+            return
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def contains(self, user_id):
+        now = time.monotonic()
+        key = _key(user_id)
+        with self._lock:
+            self._apply_evictions()
+            # add() skips the user if it is evicted while the caller looks it up
+            _missed_at.set(self._seen)
+            expires = self._entries.get(key)
+            if expires is not None and expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True
+            if expires is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False
+
+    def add(self, user_id):
+        key = _key(user_id)
+        missed_at = _missed_at.get()
+        _missed_at.set(None)
+        with self._lock:
+            if missed_at is not None:
+                _, keys = self.evictions.since(missed_at)
+                if keys is None or key in keys:
+                    return
+            self._entries[key] = time.monotonic() + self.ttl
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Forget a user on every worker; call it after the change is committed"""
+        key = _key(user_id)
+        with self._lock:
+            self._entries.pop(key, None)
+        self.evictions.append(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+principal_cache = PrincipalCache()
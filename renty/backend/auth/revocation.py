@@ -0,0 +1,252 @@
+"""
+Token revocation store used by token_required and the flask_jwt_extended
+blocklist loader.
+
+Revoked JTIs are kept with the token's `exp` and are forgotten once the token
+would have expired anyway. Every backend fronts its storage with a Bloom
+filter, so the common "not revoked" answer never leaves process memory:
+
+- 'memory': a dict in the worker, lost on restart and not shared
+- 'sqlite': a SQLite file plus a memory-mapped Bloom bitmap next to it,
+  shared by every worker on the host and kept across restarts
+- 'shm': a fixed-size hash table and Bloom bitmap in one memory-mapped file
+  under /dev/shm, shared by every worker on the host
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import math
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import closing
+from services.shared_memory import HostLock, map_file, shared_memory_path
+
+
+def _hashes(jti):
+    """The two 64-bit hashes of a JTI, the first never 0; the Bloom filter and the shm table both use them"""
+    digest = hashlib.blake2b(jti.encode('utf-8'), digest_size=16).digest()
+    h1, h2 = struct.unpack('<QQ', digest)
+    return h1 | 1, h2
+
+
+class BloomFilter:
+    """Bloom filter over any writable buffer (bytearray or mmap)"""
+
+    def __init__(self, buffer, num_hashes):
+        self.buffer = buffer
+        self.num_bits = len(buffer) * 8
+        self.num_hashes = num_hashes
+
+    @staticmethod
+    def size_for(capacity, error_rate=0.01):
+        """(bytes, hashes) for `capacity` entries at `error_rate` false positives"""
+        bits = math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return (bits + 7) // 8, hashes
+
+    def _positions(self, hashes):
+        h1, h2 = hashes
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    @staticmethod
+    def _set_bits(buffer, positions):
+        for position in positions:
+            buffer[position >> 3] |= 1 << (position & 7)
+
+    def add(self, jti):
+        self._set_bits(self.buffer, self._positions(_hashes(jti)))
+
+    def might_contain(self, jti):
+        buffer = self.buffer
+        return all(buffer[position >> 3] & (1 << (position & 7)) for position in self._positions(_hashes(jti)))
+
+    def rebuild(self, live):
+        """
+        Replace the bitmap with one holding only the `live` entries, given as
+        their _hashes() pairs.
+
+        The new bitmap is built aside and copied over in one go. Every live
+        entry is set in both the old and the new bitmap, so a concurrent reader
+        never gets a false "not revoked" while the copy is in progress.
+        """
+        fresh = bytearray(len(self.buffer))
+        for hashes in live:
+            self._set_bits(fresh, self._positions(hashes))
+        self.buffer[:] = fresh
+
+
+class InProcessRevocationBackend:
+    name = 'memory'
+
+    def __init__(self, capacity):
+        size, self.bloom_hashes = BloomFilter.size_for(capacity)
+        self.bloom_buffer = bytearray(size)
+        self.lock = HostLock()
+        self._entries = {}  # jti -> exp
+
+    def add(self, jti, exp):
+        self._entries[jti] = exp
+
+    def contains(self, jti, now):
+        exp = self._entries.get(jti)
+        return exp is not None and exp > now
+
+    def purge(self, now):
+        """Drop expired entries and return the hashes of the JTIs still revoked"""
+        self._entries = {jti: exp for jti, exp in self._entries.items() if exp > now}
+        return [_hashes(jti) for jti in self._entries]
+
+
+class SQLiteRevocationBackend:
+    name = 'sqlite'
+
+    def __init__(self, path, capacity):
+        self.path = path
+        size, self.bloom_hashes = BloomFilter.size_for(capacity)
+        self.bloom_buffer = map_file(path + '.bloom', size)
+        self.lock = HostLock(path + '.lock')
+        self._local = threading.local()
+        # Set up on a connection of its own: one left in this thread would be
+        # inherited by workers forked from a preloaded app
+        with self.lock(), closing(self._connect()) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS revoked_tokens (jti TEXT PRIMARY KEY, exp INTEGER NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_revoked_tokens_exp ON revoked_tokens (exp)')
+            # The bitmap file may be new while the table is not: repopulate it
+            live = [_hashes(row[0]) for row in connection.execute('SELECT jti FROM revoked_tokens WHERE exp > ?',
+                                                         (int(time.time()),))]
+            BloomFilter(self.bloom_buffer, self.bloom_hashes).rebuild(live)
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def add(self, jti, exp):
+        self._connection().execute('INSERT OR REPLACE INTO revoked_tokens (jti, exp) VALUES (?, ?)', (jti, int(exp)))
+
+    def contains(self, jti, now):
+        row = self._connection().execute('SELECT exp FROM revoked_tokens WHERE jti = ?', (jti,)).fetchone()
+        return row is not None and row[0] > now
+
+    def purge(self, now):
+        connection = self._connection()
+        connection.execute('DELETE FROM revoked_tokens WHERE exp <= ?', (int(now),))
+        return [_hashes(row[0]) for row in connection.execute('SELECT jti FROM revoked_tokens')]
+
+
+class SharedMemoryRevocationBackend:
+    """
+    Open-addressing hash table in a memory-mapped file under /dev/shm.
+
+    Layout: [bloom bitmap][capacity slots of (jti hash, second jti hash, exp)].
+    The first hash is the key, 0 marks a never-used slot; slots whose exp has
+    passed are reused by the next insert that probes past them. The second
+    hash is kept so the Bloom bitmap can be rebuilt from the table alone.
+    """
+    name = 'shm'
+    SLOT = struct.Struct('<QQq')
+
+    def __init__(self, name, capacity):
+        path = shared_memory_path(name)
+        # Twice the expected entries keeps probe sequences short
+        self.slots = capacity * 2
+        bloom_size, self.bloom_hashes = BloomFilter.size_for(capacity)
+        self._table_offset = bloom_size
+        self._buffer = map_file(path, bloom_size + self.slots * self.SLOT.size)
+        self.bloom_buffer = memoryview(self._buffer)[:bloom_size]
+        self.lock = HostLock(path + '.lock')
+
+    def _probe(self, key):
+        start = key % self.slots
+        for i in range(self.slots):
+            index = (start + i) % self.slots
+            yield self._table_offset + index * self.SLOT.size
+
+    def add(self, jti, exp):
+        (key, second), now = _hashes(jti), time.time()
+        reusable = None
+        for offset in self._probe(key):
+            slot_key, _, slot_exp = self.SLOT.unpack_from(self._buffer, offset)
+            if slot_key == key:
+                self.SLOT.pack_into(self._buffer, offset, key, second, int(exp))
+                return
+            if reusable is None and (slot_key == 0 or slot_exp <= now):
+                reusable = offset
+            if slot_key == 0:
+                break
+        if reusable is None:
+            raise RuntimeError('Revocation table is full, raise REVOCATION_CAPACITY')
+        self.SLOT.pack_into(self._buffer, reusable, key, second, int(exp))
+
+    def contains(self, jti, now):
+        key = _hashes(jti)[0]
+        for offset in self._probe(key):
+            slot_key, _, slot_exp = self.SLOT.unpack_from(self._buffer, offset)
+            if slot_key == 0:
+                return False
+            if slot_key == key:
+                return slot_exp > now
+        return False
+
+    def purge(self, now):
+        """The hashes of the JTIs still revoked; expired slots stay in place for add() to reuse"""
+        table = memoryview(self._buffer)[self._table_offset:]
+        return [(key, second) for key, second, exp in self.SLOT.iter_unpack(table) if key != 0 and exp > now]
+
+
+class RevocationStore:
+    def __init__(self, app=None):
+        self.backend = None
+        self.bloom = None
+        self.purge_interval = 600
+        self._next_purge = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        kind = app.config.get('REVOCATION_BACKEND', 'memory')
+        capacity = app.config.get('REVOCATION_CAPACITY', 100000)
+        if kind == 'sqlite':
+            self.backend = SQLiteRevocationBackend(app.config['REVOCATION_SQLITE_PATH'], capacity)
+        elif kind == 'shm':
+            self.backend = SharedMemoryRevocationBackend(app.config['REVOCATION_SHM_NAME'], capacity)
+        else:
+            self.backend = InProcessRevocationBackend(capacity)
+        self.bloom = BloomFilter(self.backend.bloom_buffer, self.backend.bloom_hashes)
+        self.purge_interval = app.config.get('REVOCATION_PURGE_INTERVAL', self.purge_interval)
+        self._next_purge = time.monotonic() + self.purge_interval
+        app.extensions['revocation_store'] = self
+
+    def revoke(self, jti, exp):
+        """Revoke a token until its `exp` (unix timestamp)"""
+        with self.backend.lock():
+            self.backend.add(jti, exp)
+            # Set the Bloom bits last: a reader that sees them will find the entry
+            self.bloom.add(jti)
+        if time.monotonic() >= self._next_purge:
+            self.purge()
+
+    def is_revoked(self, jti):
+        # Fast negative path: no lock, no I/O
+        if not self.bloom.might_contain(jti):
+            return False
+        return self.backend.contains(jti, time.time())
+
+    def purge(self):
+        """Forget expired tokens and shrink the Bloom filter back to the live set"""
+        self._next_purge = time.monotonic() + self.purge_interval
+        with self.backend.lock():
+            self.bloom.rebuild(self.backend.purge(time.time()))
+
+
+revocation_store = RevocationStore()
@@ -0,0 +1,105 @@
+"""
+Time to delete an account with N posts: the ORM cascade delete_user used
+to do (load every post, one DELETE per row) against the ON DELETE CASCADE
+path behind DELETE /users/user/<id>.
+
+    python bench/account_delete.py --posts 100 1000 5000
+
+Uses a throwaway SQLite database (DEV_DATABASE_URL) with BACKGROUND_WORKERS
+= 0, so the endpoint time includes the search index and image cleanup it
+would otherwise hand off.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+from sqlalchemy import insert
+
+
+def make_app():
+    os.environ["DEV_DATABASE_URL"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("ADMISSION_ENABLED", "0")  # one client registering many accounts
+    from app import create_app
+    app = create_app()
+    app.config["BACKGROUND_WORKERS"] = 0
+    app.config["ACCOUNT_DELETE_ASYNC_THRESHOLD"] = float("inf")
+    from services.background import background_jobs
+    background_jobs.init_app(app)
+    return app
+
+
+def seed(app, client, n_posts):
+    """A registered user owning n_posts posts, returns (user id, auth headers)"""
+    from extensions import db
+    from models.post import Post
+    from services.facets import rebuild_facet_counts
+    from services.search import search_index
+    email = f"{uuid.uuid4().hex}@example.com"
+    client.post("/home/register", json={"name": "bench", "email": email, "password": "bench123"})
+    token = client.post("/home/login", json={"email": email, "password": "bench123"}).get_json()
+    user_id = token["user_id"]
+    now = datetime.utcnow()
+    with app.app_context():
+        rows = [{
+            "id": str(uuid.uuid4()), "user_id": user_id, "instrument_type": "Guitar", "title": f"Electric guitar {i}",
+            "brand": "Fender", "price": 100 + i % 900, "description": "Solid body electric guitar",
+            "phone_number": "12345678", "status": "for sale", "availability": "available", "location": "Tunis",
+            "created_at": now, "updated_at": now,
+        } for i in range(n_posts)]
+        db.session.execute(insert(Post), rows)
+        search_index.index_posts([SimpleNamespace(**row) for row in rows])
+        db.session.commit()
+        rebuild_facet_counts()
+    return user_id, {"Authorization": "Bearer " + token["access_token"]}
+
+
+def orm_cascade(app, client, user_id, headers):
+    """delete_user before ON DELETE CASCADE, kept here as the baseline"""
+    from extensions import db
+    from models.user import User
+    from services.facets import apply_facet_change, facet_values
+    from services.search import search_index
+    with app.app_context():
+        user = db.session.get(User, user_id)
+        post_ids = [post.id for post in user.posts]
+        for post in user.posts:
+            apply_facet_change(facet_values(post), [])
+        for post in list(user.posts):
+            db.session.delete(post)  # what cascade='all, delete' did at flush
+        db.session.delete(user)
+        for post_id in post_ids:
+            search_index.remove_post(post_id)
+        db.session.commit()
+
+
+def database_cascade(app, client, user_id, headers):
+    assert client.delete(f"/users/user/{user_id}", headers=headers).status_code == 200
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, nargs="+", default=[100, 1000, 5000])
+    args = parser.parse_args()
+
+    app = make_app()
+    client = app.test_client()
+    print(f"{'posts':>8}{'ORM cascade ms':>17}{'ON DELETE CASCADE ms':>23}{'speedup':>9}")
+    for n_posts in args.posts:
+        timings = []
+        for fn in (orm_cascade, database_cascade):
+            user_id, headers = seed(app, client, n_posts)
+            t0 = time.perf_counter()
+            fn(app, client, user_id, headers)
+            timings.append((time.perf_counter() - t0) * 1000)
+        print(f"{n_posts:>8}{timings[0]:>17.1f}{timings[1]:>23.1f}{timings[0] / timings[1]:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Throughput and tail latency of the read endpoints with many concurrent
+clients, threaded WSGI server (what app.py runs) against asgi.py on uvicorn.
+
+    python bench/asgi_vs_wsgi.py --clients 500 --duration 20
+
+Both servers run as one process on a throwaway SQLite database seeded with
+--posts rows. The response cache is switched off so every request reaches
+the database. Each client keeps one connection open and sends GETs back to
+back; the mix is paged /home/search and /home/posts/<id>.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import asyncio
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    "wsgi (threaded)": [sys.executable, "-c",
+                        "import logging, sys; from werkzeug.serving import run_simple; from app import create_app; "
+                        "logging.getLogger('werkzeug').setLevel(logging.ERROR); "
+                        "run_simple('127.0.0.1', int(sys.argv[1]), create_app(), threaded=True)"],
+    "asgi (uvicorn)": [sys.executable, "-m", "uvicorn", "asgi:create_asgi_app", "--factory",
+                       "--host", "127.0.0.1", "--log-level", "warning", "--no-access-log", "--port"],
+}
+
+
+def seed(n_posts):
+    from app import create_app
+    from extensions import db
+    from models.post import Post
+    app = create_app()
+    client = app.test_client()
+    client.post("/home/register", json={"name": "bench", "email": "bench@example.com", "password": "bench123"})
+    login = client.post("/home/login", json={"email": "bench@example.com", "password": "bench123"}).get_json()
+    items = [{
+        "instrument_type": "Drums", "title": f"Drum kit {i}", "brand": "Pearl", "price": 300 + i % 500,
+        "description": "Five piece kit, cymbals included", "phone_number": "12345678", "image": None,
+        "status": "for rental", "location": "Tunis",
+    } for i in range(n_posts)]
+    headers = {"Authorization": "Bearer " + login["access_token"]}
+    for start in range(0, n_posts, 1000):
+        client.post("/posts/bulk", headers=headers, json={"create": items[start:start + 1000]})
+    with app.app_context():
+        post_ids = [post_id for post_id, in db.session.query(Post.id)]
+    return login["access_token"], post_ids
+
+
+async def client_loop(port, token, paths, deadline, latencies, errors):
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        errors.append("connect")
+        return
+    try:
+        while time.perf_counter() < deadline:
+            path = random.choice(paths)
+            request = (f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAuthorization: Bearer {token}\r\n"
+                       f"Connection: keep-alive\r\n\r\n")
+            t0 = time.perf_counter()
+            writer.write(request.encode())
+            status = (await reader.readline()).split(b" ")[1]
+            length, close = 0, False
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+                elif name.lower() == "connection" and value.strip().lower() == "close":
+                    close = True
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - t0)
+            if status != b"200":
+                errors.append(status.decode())
+            if close:
+                writer.close()
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except (OSError, asyncio.IncompleteReadError, IndexError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+async def load(port, token, paths, clients, duration):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*(client_loop(port, token, paths, deadline, latencies, errors) for _ in range(clients)))
+    return latencies, errors
+
+
+def wait_until_up(port, timeout=30):
+    import socket
+    end = time.time() + timeout
+    while time.time() < end:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--posts", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=5099)
+    args = parser.parse_args()
+
+    os.chdir(BACKEND)
+    os.environ["DEV_DATABASE_URL"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    os.environ["RESPONSE_CACHE_ENABLED"] = "0"
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    token, post_ids = seed(args.posts)
+    pages = max(args.posts // 10, 1)
+    paths = [f"/home/search?page={random.randint(1, pages)}" for _ in range(200)] + \
+            [f"/home/posts/{post_id}" for post_id in random.sample(post_ids, min(200, len(post_ids)))]
+
+    print(f"{'server':<18}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, command in SERVERS.items():
+        server = subprocess.Popen(command + [str(args.port)], env=os.environ, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_up(args.port)
+            latencies, errors = asyncio.run(load(args.port, token, paths, args.clients, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+        latencies.sort()
+        p50 = statistics.median(latencies) * 1000 if latencies else float("nan")
+        p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else float("nan")
+        print(f"{name:<18}{len(latencies) / args.duration:>9.0f}{p50:>9.1f}{p99:>9.1f}{len(errors):>8}")
+
+
+if __name__ == "__main__":
+    main()
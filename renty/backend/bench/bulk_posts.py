@@ -0,0 +1,63 @@
+"""
+Rows per second importing posts one /posts/create call at a time against
+batched /posts/bulk calls, through the whole Flask app.
+
+    python bench/bulk_posts.py --rows 2000 --batch 500
+
+Uses a throwaway SQLite database (DEV_DATABASE_URL) and the test client, so
+it measures the application cost per row, not the network.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import tempfile
+import time
+
+
+def make_client():
+    os.environ["DEV_DATABASE_URL"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    from app import create_app
+    app = create_app()
+    client = app.test_client()
+    client.post("/home/register", json={"name": "bench", "email": "bench@example.com", "password": "bench123"})
+    token = client.post("/home/login", json={"email": "bench@example.com", "password": "bench123"}).get_json()
+    return client, {"Authorization": "Bearer " + token["access_token"]}
+
+
+def payload(i):
+    return {
+        "instrument_type": "Guitar", "title": f"Electric guitar {i}", "brand": "Fender", "price": 350,
+        "description": "Solid body electric guitar, new strings", "phone_number": "12345678", "image": None,
+        "status": "for sale", "location": "Tunis",
+    }
+
+
+def per_item(client, headers, n_rows, batch):
+    for i in range(n_rows):
+        assert client.post("/posts/create", headers=headers, json=payload(i)).status_code == 201
+
+
+def bulk(client, headers, n_rows, batch):
+    for start in range(0, n_rows, batch):
+        items = [payload(i) for i in range(start, min(start + batch, n_rows))]
+        assert client.post("/posts/bulk", headers=headers, json={"create": items}).status_code == 200
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    client, headers = make_client()
+    print(f"{'api':<25}{'rows/s':>12}")
+    for name, fn in (("/posts/create per item", per_item), (f"/posts/bulk x{args.batch}", bulk)):
+        t0 = time.perf_counter()
+        fn(client, headers, args.rows, args.batch)
+        print(f"{name:<25}{args.rows / (time.perf_counter() - t0):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Seeded synthetic data: N users and M posts with a realistic mix of
+instrument types, brands, statuses, prices and cities.
+
+    python bench/datagen.py --users 1000 --posts 100000 --seed 42
+    DEV_DATABASE_URL=mysql+pymysql://... python bench/datagen.py --posts 1000000
+
+Rows go in with multi-row INSERTs, then the facet counters and the search
+index are brought up to date. The same seed always produces the same rows
+(ids included), so runs on different commits start from identical data.
+Every generated user logs in with BENCH_PASSWORD.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from extensions import db
+from models.post import Post
+from models.user import User
+from auth.password_hasher import password_hasher
+from services.facets import rebuild_facet_counts
+from services.geo import geocoder
+from services.search import search_index
+
+BENCH_PASSWORD = "renty-bench"
+BENCH_EPOCH = datetime(2025, 1, 1)
+
+# weight, brands, typical sale price
+INSTRUMENTS = {
+    "Guitar": (40, ("Fender", "Gibson", "Yamaha", "Ibanez", "Epiphone", "Taylor"), 450),
+    "Violin": (25, ("Stentor", "Yamaha", "Eastman", "Hofner"), 300),
+    "Piano": (20, ("Yamaha", "Kawai", "Roland", "Casio", "Steinway"), 1500),
+    "Drums": (15, ("Pearl", "Tama", "Ludwig", "Roland", "Mapex"), 700),
+}
+MODELS = {
+    "Guitar": ("Stratocaster", "Les Paul", "acoustic guitar", "classical guitar", "bass guitar", "Telecaster"),
+    "Violin": ("student violin", "full size violin", "3/4 violin", "electric violin"),
+    "Piano": ("digital piano", "upright piano", "stage piano", "grand piano", "keyboard"),
+    "Drums": ("drum kit", "electronic drum kit", "snare drum", "cajon"),
+}
+CONDITIONS = ("like new", "barely used", "good condition", "well kept", "needs new strings", "with case")
+# weight of each city, most listings come from the big ones
+CITIES = {"Tunis": 30, "Sfax": 12, "Sousse": 10, "Ariana": 8, "La Marsa": 6, "Nabeul": 5, "Bizerte": 5,
+          "Monastir": 4, "Kairouan": 4, "Gabes": 3, "Hammamet": 3, "Djerba": 3, "Gafsa": 2, "Tozeur": 1,
+          "Le Kef": 1, "Beja": 1}
+STATUSES = {"for sale": 60, "for rental": 40}
+# availability weights per status
+AVAILABILITIES = {"for sale": {"available": 80, "sold": 20}, "for rental": {"available": 70, "rented": 30}}
+
+
+def _pick(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def user_rows(rng, n_users, password_hash):
+    for i in range(n_users):
+        created_at = BENCH_EPOCH + timedelta(seconds=rng.randrange(365 * 86400))
+        yield {
+            "id": _uuid(rng), "name": f"user{i}", "email": f"user{i}@bench.renty", "password": password_hash,
+            "image": None, "created_at": created_at, "updated_at": created_at,
+        }
+
+
+def post_row(rng, user_ids, coordinates):
+    instrument_type = _pick(rng, {name: spec[0] for name, spec in INSTRUMENTS.items()})
+    _, brands, typical_price = INSTRUMENTS[instrument_type]
+    brand = rng.choice(brands)
+    model = rng.choice(MODELS[instrument_type])
+    status = _pick(rng, STATUSES)
+    price = typical_price * rng.lognormvariate(0, 0.5)
+    if status == "for rental":
+        price /= 20  # per month
+    location = _pick(rng, CITIES)
+    created_at = BENCH_EPOCH + timedelta(seconds=rng.randrange(365 * 86400))
+    return {
+        "id": _uuid(rng), "user_id": rng.choice(user_ids), "instrument_type": instrument_type, "brand": brand,
+        "title": f"{brand} {model}", "price": round(max(price, 5), 2),
+        "description": f"{brand} {model}, {rng.choice(CONDITIONS)}. Pick up in {location}.",
+        "phone_number": f"{rng.randrange(20000000, 99999999)}", "image": None,
+        "availability": _pick(rng, AVAILABILITIES[status]), "status": status, "location": location,
+        "created_at": created_at, "updated_at": created_at, **coordinates[location],
+    }
+
+
+def generate(n_users, n_posts, seed=42, batch_size=5000, log=print):
+    """Insert the users and posts into the app's database, needs an app context"""
+    rng = random.Random(seed)
+    coordinates = {city: geocoder.coordinates(city) for city in CITIES}
+    search_index.backend  # the in-memory backend indexes whatever is already there, new batches are added below
+
+    t0 = time.perf_counter()
+    users = list(user_rows(rng, n_users, password_hasher.hash(BENCH_PASSWORD)))
+    for start in range(0, len(users), batch_size):
+        db.session.execute(User.__table__.insert(), users[start:start + batch_size])
+    user_ids = [user["id"] for user in users]
+
+    for start in range(0, n_posts, batch_size):
+        rows = [post_row(rng, user_ids, coordinates) for _ in range(min(batch_size, n_posts - start))]
+        db.session.execute(Post.__table__.insert(), rows)
+        search_index.index_posts([SimpleNamespace(**row) for row in rows])
+        db.session.commit()
+        log(f"  {start + len(rows)}/{n_posts} posts")
+
+    rebuild_facet_counts()
+    log(f"Generated {n_users} users and {n_posts} posts in {time.perf_counter() - t0:.1f}s")
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        print(f"Database: {db.engine.url}")
+        generate(args.users, args.posts, args.seed, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
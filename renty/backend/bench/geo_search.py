@@ -0,0 +1,109 @@
+"""
+Latency of a "near me" query as the posts table grows.
+
+    python bench/geo_search.py --sizes 10000,100000,1000000 --radius-km 10
+
+Posts are spread uniformly over Tunisia and queried around random points
+through the geohash index, for the first page of 10. "rings" is the search
+/home/search runs (services.geo.RingSearch: the radius doubles from 1 km
+until the page is filled), "whole radius" loads every post within radius_km
+and grows with the density; a full scan with haversine on every row is
+shown for comparison on the smaller sizes.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from extensions import db
+from models.user import User
+from models.post import Post
+from services.geo import geohash_encode, radius_bbox, posts_in_bbox, sort_by_distance, RingSearch
+
+# Rough bounding box of Tunisia
+MIN_LAT, MIN_LON, MAX_LAT, MAX_LON = 30.2, 7.5, 37.5, 11.6
+COLUMNS = (Post.id, Post.title, Post.price, Post.latitude, Post.longitude)
+
+
+def seed(user_id, start, stop, rng, batch=50000):
+    now = datetime.utcnow()
+    for first in range(start, stop, batch):
+        rows = []
+        for i in range(first, min(first + batch, stop)):
+            lat, lon = rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LON, MAX_LON)
+            rows.append({
+                "id": str(uuid.uuid4()), "user_id": user_id, "instrument_type": "Violin", "brand": "Stentor",
+                "title": f"Violin {i}", "price": 200.0, "description": None, "phone_number": "12345678",
+                "image": None, "availability": "available", "status": "for rental", "location": "Somewhere",
+                "latitude": lat, "longitude": lon, "geohash": geohash_encode(lat, lon),
+                "created_at": now, "updated_at": now,
+            })
+        db.session.execute(Post.__table__.insert(), rows)
+    db.session.commit()
+
+
+def rings(lat, lon, radius_km):
+    search = RingSearch(lat, lon, 11, radius_km=radius_km)
+    while not search.add(posts_in_bbox(Post.query.with_entities(*COLUMNS), *search.box()).all()):
+        pass
+    return search.ranked[:10]
+
+
+def whole_radius(lat, lon, radius_km):
+    query = posts_in_bbox(Post.query.with_entities(*COLUMNS), *radius_bbox(lat, lon, radius_km))
+    return sort_by_distance(query, lat, lon, radius_km)[:10]
+
+
+def full_scan(lat, lon, radius_km):
+    return sort_by_distance(Post.query.with_entities(*COLUMNS), lat, lon, radius_km)[:10]
+
+
+def median_ms(fn, points, radius_km):
+    timings = []
+    for lat, lon in points:
+        t0 = time.perf_counter()
+        fn(lat, lon, radius_km)
+        timings.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--radius-km", type=float, default=10)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--full-scan-limit", type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    db.init_app(app)
+    rng = random.Random(42)
+    points = [(rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LON, MAX_LON)) for _ in range(args.queries)]
+
+    with app.app_context():
+        db.create_all()
+        user = User(name="bench", email="bench@example.com", password="bench")
+        db.session.add(user)
+        db.session.commit()
+
+        print(f"{'posts':>10}{'rings ms':>10}{'whole radius ms':>17}{'full scan ms':>14}")
+        seeded = 0
+        for size in (int(size) for size in args.sizes.split(",")):
+            seed(user.id, seeded, size, rng)
+            seeded = size
+            scan = f"{median_ms(full_scan, points[:5], args.radius_km):>14.1f}" \
+                if size <= args.full_scan_limit else f"{'-':>14}"
+            print(f"{size:>10}{median_ms(rings, points, args.radius_km):>10.2f}"
+                  f"{median_ms(whole_radius, points, args.radius_km):>17.2f}{scan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Compare OFFSET pagination against keyset (cursor) pagination on /home/search.
+
+    python bench/keyset_pagination.py --posts 1000000
+
+Seeds a throwaway SQLite database and times page 1 and a deep page with both
+strategies. With OFFSET the deep page grows with the page number; with the
+cursor it stays flat.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from flask import Flask
+from extensions import db
+from models.user import User
+from models.post import Post
+from services.pagination import keyset_page, encode_cursor
+
+PER_PAGE = 10
+
+
+def seed(n_posts, batch=50000):
+    user = User(name="bench", email="bench@example.com", password="bench")
+    db.session.add(user)
+    db.session.commit()
+
+    start = datetime(2020, 1, 1)
+    rows = []
+    for i in range(n_posts):
+        rows.append({
+            "id": str(uuid.uuid4()), "user_id": user.id, "instrument_type": "Guitar",
+            "brand": "Yamaha", "title": f"Guitar {i}", "price": 100.0, "description": None,
+            "phone_number": "12345678", "image": None, "availability": "available",
+            "status": "for sale", "location": "Tunis",
+            "created_at": start + timedelta(seconds=i), "updated_at": start + timedelta(seconds=i),
+        })
+        if len(rows) == batch:
+            db.session.execute(Post.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Post.__table__.insert(), rows)
+    db.session.commit()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    db.init_app(app)
+
+    with app.app_context():
+        db.create_all()
+        t0 = time.perf_counter()
+        seed(args.posts)
+        print(f"seeded {args.posts} posts in {time.perf_counter() - t0:.1f}s")
+
+        deep_page = args.posts // PER_PAGE - 1
+
+        def offset_page(page):
+            return lambda: Post.query.order_by(Post.created_at.desc(), Post.id.desc()) \
+                .paginate(page=page, per_page=PER_PAGE, error_out=False).items
+
+        # Walk to the deep page once so we have a real cursor to seek from
+        last = Post.query.order_by(Post.created_at.asc(), Post.id.asc()).offset(PER_PAGE).first()
+        deep_cursor = encode_cursor(last.created_at, last.id, "next")
+
+        print(f"{'strategy':<10}{'page':>10}{'ms':>10}")
+        print(f"{'offset':<10}{1:>10}{timed(offset_page(1), args.repeat):>10.2f}")
+        print(f"{'offset':<10}{deep_page:>10}{timed(offset_page(deep_page), args.repeat):>10.2f}")
+        print(f"{'cursor':<10}{1:>10}{timed(lambda: keyset_page(Post.query, None, PER_PAGE), args.repeat):>10.2f}")
+        print(f"{'cursor':<10}{deep_page:>10}"
+              f"{timed(lambda: keyset_page(Post.query, deep_cursor, PER_PAGE), args.repeat):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+In-process load driver replaying realistic user flows against the app.
+
+    python bench/loadgen.py --posts 20000 --workers 4 --iterations 200 --output head.json
+    python bench/report.py base.json head.json
+
+Without --existing-data a throwaway SQLite database is filled by datagen.py
+first; with it the app's configured database (DEV_DATABASE_URL) is used as
+it is, e.g. after running datagen.py against MySQL. Each worker thread is a
+virtual user: it registers and logs in, then picks flows by weight from a
+seeded generator, so two runs with the same arguments send the same
+requests. Latencies are taken around the test client call, which includes
+the whole Flask stack but no network.
+
+BCRYPT_ROUNDS defaults to 4 here so that login measures the app and not
+bcrypt; set it explicitly to measure the production cost. Admission control
+is off by default as well: every virtual user shares one address, so the
+login and search limits would reject most of the load.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from app import create_app
+from datagen import BENCH_PASSWORD, generate
+from extensions import db
+from models.user import User
+from report import build_report, write_report
+
+# weight of each flow in the mix
+FLOWS = {
+    "browse_search": 30,
+    "view_post": 15,
+    "search_posts": 15,
+    "browse_category": 5,
+    "filter": 10,
+    "login": 5,
+    "create_post": 8,
+    "update_post": 6,
+    "change_availability": 6,
+}
+SEARCH_TERMS = ("fender", "yamaha", "piano", "violin", "drum kit", "strat", "les paul", "digital", "roland",
+                "acoustic guitar", "cajon", "like new")
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, operation, latency, ok):
+        with self._lock:
+            self.samples[operation].append(latency)
+            if not ok:
+                self.errors[operation] += 1
+
+
+class VirtualUser:
+    def __init__(self, app, recorder, rng, n_seed_users):
+        self.client = app.test_client()
+        self.recorder = recorder
+        self.rng = rng
+        self.n_seed_users = n_seed_users
+        self.headers = {}
+        self.seen_posts = []
+        self.own_posts = []  # [post_id, status, availability]
+
+    def call(self, operation, method, path, expected=(200, 201), **kwargs):
+        t0 = time.perf_counter()
+        response = self.client.open(path, method=method, headers=self.headers, **kwargs)
+        body = response.get_json(silent=True)
+        self.recorder.record(operation, time.perf_counter() - t0, response.status_code in expected)
+        return body
+
+    def start(self):
+        email = f"vu-{uuid.uuid4().hex[:12]}@bench.renty"
+        self.call("POST /home/register", "POST", "/home/register",
+                  json={"name": "virtual user", "email": email, "password": "virtual-password"})
+        login = self.call("POST /home/login", "POST", "/home/login",
+                          json={"email": email, "password": "virtual-password"})
+        self.headers = {"Authorization": "Bearer " + login["access_token"]}
+
+    def run(self, iterations=None, deadline=None):
+        self.start()
+        flows, weights = list(FLOWS), list(FLOWS.values())
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.perf_counter() < deadline):
+            getattr(self, self.rng.choices(flows, weights=weights)[0])()
+            done += 1
+
+    def _remember(self, body):
+        posts = body.get("posts", []) if isinstance(body, dict) else body or []
+        self.seen_posts = [post["id"] for post in posts if "id" in post][:20] or self.seen_posts
+
+    # Flows
+
+    def browse_search(self):
+        body = self.call("GET /home/search?page", "GET", f"/home/search?page={self.rng.randint(1, 3)}")
+        self._remember(body)
+        first = self.call("GET /home/search?cursor", "GET", "/home/search?cursor=&fields=id,title,price,created_at")
+        next_cursor = (first or {}).get("pagination", {}).get("next_cursor")
+        if next_cursor:
+            self.call("GET /home/search?cursor", "GET", f"/home/search?cursor={next_cursor}&fields=id,title,price")
+
+    def view_post(self):
+        if not self.seen_posts:
+            return self.browse_search()
+        self.call("GET /home/posts/<id>", "GET", f"/home/posts/{self.rng.choice(self.seen_posts)}")
+
+    def search_posts(self):
+        body = self.call("GET /home/posts/search", "GET", "/home/posts/search",
+                         query_string={"q": self.rng.choice(SEARCH_TERMS)}, expected=(200, 404))
+        self._remember(body)
+
+    def browse_category(self):
+        instrument_type = self.rng.choice(("Guitar", "Piano", "Drums", "Violin"))
+        self.call("GET /home/category", "GET", f"/home/category?type={instrument_type}&fields=id,title,price")
+
+    def filter(self):
+        query = {"type": self.rng.choice(("Guitar", "Piano", "Drums", "Violin")),
+                 "status": self.rng.choice(("for sale", "for rental")), "availability": "available"}
+        if self.rng.random() < 0.5:
+            query["max_price"] = self.rng.choice((50, 200, 500, 1000))
+        self._remember(self.call("GET /home/filter", "GET", "/home/filter", query_string=query))
+
+    def login(self):
+        if not self.n_seed_users:
+            return
+        user = self.rng.randrange(self.n_seed_users)
+        client_headers, self.headers = self.headers, {}
+        self.call("POST /home/login", "POST", "/home/login",
+                  json={"email": f"user{user}@bench.renty", "password": BENCH_PASSWORD})
+        self.headers = client_headers
+
+    def _post_payload(self):
+        instrument_type = self.rng.choice(("Guitar", "Piano", "Drums", "Violin"))
+        status = self.rng.choice(("for sale", "for rental"))
+        return {
+            "instrument_type": instrument_type, "title": f"Bench {instrument_type.lower()} {self.rng.randrange(10 ** 6)}",
+            "brand": self.rng.choice(("Yamaha", "Roland", "Fender", "Pearl")), "price": self.rng.randint(20, 2000),
+            "description": "Posted by the load generator", "phone_number": "12345678", "image": None,
+            "status": status, "location": self.rng.choice(("Tunis", "Sfax", "Sousse")),
+        }
+
+    def create_post(self):
+        payload = self._post_payload()
+        body = self.call("POST /posts/create", "POST", "/posts/create", json=payload)
+        if body and "post_id" in body:
+            self.own_posts.append([body["post_id"], payload["status"], "available"])
+
+    def update_post(self):
+        if not self.own_posts:
+            return self.create_post()
+        post = self.rng.choice(self.own_posts)
+        payload = dict(self._post_payload(), status=post[1])
+        self.call("PUT /posts/posts/<id>", "PUT", f"/posts/posts/{post[0]}", json=payload)
+
+    def change_availability(self):
+        # Only transitions the API accepts: sell an available item, rent or return a rental
+        candidates = [post for post in self.own_posts if post[2] != "sold"]
+        if not candidates:
+            return self.create_post()
+        post = self.rng.choice(candidates)
+        if post[1] == "for sale":
+            target = "sold"
+        else:
+            target = "available" if post[2] == "rented" else "rented"
+        self.call("PATCH /posts/<id>/status", "PATCH", f"/posts/{post[0]}/status", json={"availability": target})
+        post[2] = target
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=200, help="flows per worker")
+    parser.add_argument("--duration", type=float, help="seconds to run instead of a fixed number of flows")
+    parser.add_argument("--existing-data", action="store_true", help="use DEV_DATABASE_URL as already seeded")
+    parser.add_argument("--output", default="bench-report.json")
+    args = parser.parse_args()
+
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    os.environ.setdefault("ADMISSION_ENABLED", "0")
+    if not args.existing_data:
+        os.environ["DEV_DATABASE_URL"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+
+    app = create_app()
+    with app.app_context():
+        if not args.existing_data:
+            generate(args.users, args.posts, args.seed, log=lambda message: None)
+        n_seed_users = User.query.filter(User.email.like("user%@bench.renty")).count()
+        database = db.engine.dialect.name
+
+    recorder = Recorder()
+    deadline = time.perf_counter() + args.duration if args.duration else None
+    iterations = None if args.duration else args.iterations
+    workers = [VirtualUser(app, recorder, random.Random(args.seed * 1000 + i), n_seed_users)
+               for i in range(args.workers)]
+    threads = [threading.Thread(target=worker.run, args=(iterations, deadline)) for worker in workers]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    report = build_report(recorder.samples, recorder.errors, elapsed, {
+        "database": database, "users": n_seed_users, "posts": args.posts if not args.existing_data else None,
+        "seed": args.seed, "workers": args.workers, "iterations": iterations, "duration": args.duration,
+        "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+    })
+    write_report(report, args.output)
+
+    print(f"{'operation':<32}{'count':>7}{'err':>5}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for name, summary in list(report["operations"].items()) + [("total", report["total"])]:
+        print(f"{name:<32}{summary['count']:>7}{summary['errors']:>5}{summary['throughput_rps']:>9}"
+              f"{summary['p50_ms']:>9}{summary['p95_ms']:>9}{summary['p99_ms']:>9}")
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
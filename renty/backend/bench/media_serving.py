@@ -0,0 +1,90 @@
+"""
+Requests per second and worker CPU per request for /uploads/<name>.
+
+    python bench/media_serving.py --requests 2000 --size-kb 300
+
+Compares the old send_from_directory route with the MediaStore modes. The
+'revalidate' row is a client sending back the ETag it already has; with the
+immutable Cache-Control most clients do not even send that request.
+The test client has no wsgi.file_wrapper, so 'direct' copies bytes in Python
+here; under gunicorn the same mode goes through sendfile().
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import io
+import tempfile
+import time
+
+from flask import Flask, send_from_directory
+from services.media_store import MediaStore, Image
+
+
+def make_app(upload_folder, mode):
+    app = Flask(__name__)
+    app.config["UPLOAD_FOLDER"] = upload_folder
+    app.config["MEDIA_SERVE_MODE"] = mode
+    store = MediaStore(app)
+
+    @app.route("/legacy/<filename>")
+    def legacy(filename):
+        return send_from_directory(upload_folder, filename)
+
+    @app.route("/uploads/<filename>")
+    def uploaded_file(filename):
+        return store.send(filename)
+
+    return app, store
+
+
+def make_payload(size_kb):
+    if Image is None:
+        return os.urandom(size_kb * 1024)
+    # A real (noisy, hard to compress) JPEG, so the variant renderer accepts it
+    side = int((size_kb * 1024 / 1.5) ** 0.5)
+    buffer = io.BytesIO()
+    Image.frombytes("RGB", (side, side), os.urandom(side * side * 3)).save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+
+def run(client, url, n, headers=None):
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(n):
+        response = client.get(url, headers=headers)
+        response.get_data()
+        response.close()
+    return n / (time.perf_counter() - wall), (time.process_time() - cpu) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--size-kb", type=int, default=300)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    payload = make_payload(args.size_kb)
+    with open(os.path.join(folder, "photo.jpg"), "wb") as legacy_file:
+        legacy_file.write(payload)
+
+    print(f"{'mode':<20}{'req/s':>10}{'cpu us/req':>12}")
+    for label, mode, route, revalidate in (
+        ("legacy", "direct", "legacy", False),
+        ("direct", "direct", "uploads", False),
+        ("revalidate (304)", "direct", "uploads", True),
+        ("x-sendfile", "x-sendfile", "uploads", False),
+        ("x-accel-redirect", "x-accel-redirect", "uploads", False),
+    ):
+        app, store = make_app(folder, mode)
+        with app.test_request_context():
+            name = store.save(io.BytesIO(payload), "jpg")
+        store.wait()
+        filename = "photo.jpg" if route == "legacy" else name
+        headers = {"If-None-Match": f'"{name}"'} if revalidate else None
+        rate, cpu = run(app.test_client(), f"/{route}/{filename}", args.requests, headers)
+        print(f"{label:<20}{rate:>10.0f}{cpu:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Cost of the request metrics: requests per second through the whole app with
+METRICS_ENABLED on and off.
+
+    python bench/metrics_overhead.py --requests 5000
+
+Each mode runs in its own interpreter (the setting is read at import) on a
+throwaway SQLite database, with the response cache off so every request runs
+its queries.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import subprocess
+import tempfile
+import time
+
+PATHS = ["/home/search?page=1", "/home/category?type=Violin&fields=id,title", "/users/user/posts"]
+
+
+def run_mode(n_requests):
+    from app import create_app
+    app = create_app()
+    client = app.test_client()
+    client.post("/home/register", json={"name": "bench", "email": "bench@example.com", "password": "bench123"})
+    token = client.post("/home/login", json={"email": "bench@example.com", "password": "bench123"}).get_json()
+    headers = {"Authorization": "Bearer " + token["access_token"]}
+    items = [{
+        "instrument_type": "Violin", "title": f"Student violin {i}", "brand": "Stentor", "price": 150,
+        "description": "Full size, bow and case included", "phone_number": "12345678", "image": None,
+        "status": "for sale", "location": "Sousse",
+    } for i in range(50)]
+    client.post("/posts/bulk", headers=headers, json={"create": items})
+
+    for path in PATHS:  # warm up
+        client.get(path, headers=headers)
+    t0 = time.perf_counter()
+    for i in range(n_requests):
+        client.get(PATHS[i % len(PATHS)], headers=headers)
+    return n_requests / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(run_mode(args.requests))
+        return
+
+    print(f"{'metrics':<10}{'req/s':>10}")
+    rates = {}
+    for enabled in ("0", "1"):
+        env = dict(os.environ, METRICS_ENABLED=enabled, RESPONSE_CACHE_ENABLED="0", BCRYPT_ROUNDS="4",
+                   DEV_DATABASE_URL="sqlite:///" + tempfile.mktemp(suffix=".db"))
+        output = subprocess.run([sys.executable, "-W", "ignore", __file__, "--child", "--requests", str(args.requests)],
+                                env=env, capture_output=True, text=True, check=True).stdout
+        rates[enabled] = float(output.strip().splitlines()[-1])
+        print(f"{'on' if enabled == '1' else 'off':<10}{rates[enabled]:>10.0f}")
+    print(f"overhead {(rates['0'] / rates['1'] - 1) * 100:.1f}% "
+          f"({(1 / rates['1'] - 1 / rates['0']) * 1e6:.0f} us/request)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Peak Python memory of a full post listing, one JSON document against an
+Accept: application/x-ndjson stream.
+
+    python bench/ndjson_streaming.py --rows 500000
+
+The JSON peak grows with the number of rows; the NDJSON peak stays around
+one batch (NDJSON_BATCH_SIZE rows) however large the table is.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import tempfile
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from extensions import db
+from models.user import User
+from models.post import Post
+from services.serialization import POST_FIELDS, project_posts, rows_to_dicts, json_response, ndjson_response
+
+
+def seed(n_rows, batch=50000):
+    user = User(name="bench", email="bench@example.com", password="bench")
+    db.session.add(user)
+    db.session.commit()
+    now = datetime.utcnow()
+    for start in range(0, n_rows, batch):
+        db.session.execute(Post.__table__.insert(), [{
+            "id": str(uuid.uuid4()), "user_id": user.id, "instrument_type": "Drums", "brand": "Pearl",
+            "title": f"Drum kit {i}", "price": 400.0, "description": "Five piece kit with cymbals",
+            "phone_number": "12345678", "image": None, "availability": "available", "status": "for rental",
+            "location": "Sfax", "created_at": now, "updated_at": now,
+        } for i in range(start, min(start + batch, n_rows))])
+    db.session.commit()
+
+
+def json_listing():
+    body = json_response(rows_to_dicts(project_posts(Post.query, POST_FIELDS).all(), POST_FIELDS)).get_data()
+    return len(body)
+
+
+def ndjson_listing():
+    response = ndjson_response(project_posts(Post.query, POST_FIELDS), POST_FIELDS)
+    # Consume the stream the way the WSGI server does, chunk by chunk
+    return sum(len(chunk) for chunk in response.response)
+
+
+def measure(fn):
+    db.session.expunge_all()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    db.init_app(app)
+
+    with app.test_request_context():
+        db.create_all()
+        seed(args.rows)
+
+        print(f"{'format':<10}{'body MB':>10}{'peak MB':>10}{'seconds':>10}")
+        for name, fn in (("json", json_listing), ("ndjson", ndjson_listing)):
+            size, peak, elapsed = measure(fn)
+            print(f"{name:<10}{size / 2 ** 20:>10.1f}{peak / 2 ** 20:>10.1f}{elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Logins per second per core for the password hasher.
+
+    python bench/password_hashing.py --rounds 12 --workers 4 --logins 200
+
+Each login is one bcrypt verify, issued from as many threads as a web worker
+would run. Compares hashing inline with hashing on the process pool.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from auth.password_hasher import PasswordHasher, HasherOverloaded
+
+
+def run(hasher, hashed, logins, threads):
+    rejected = 0
+
+    def login(_):
+        nonlocal rejected
+        try:
+            hasher.verify("correct horse", hashed)
+        except HasherOverloaded:
+            rejected += 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(login, range(logins)))
+    return time.perf_counter() - t0, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=100)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'cores':>6}{'logins/s':>12}{'per core':>12}{'rejected':>10}")
+    for mode, workers in (("inline", 0), ("pool", args.workers)):
+        hasher = PasswordHasher(rounds=args.rounds, workers=workers, timeout=300)
+        hashed = hasher.hash("correct horse")
+        hasher.verify("correct horse", hashed)  # warm up the pool
+        elapsed, rejected = run(hasher, hashed, args.logins, args.threads)
+        hasher.shutdown()
+        rate = (args.logins - rejected) / elapsed
+        # bcrypt releases the GIL, so inline hashing spreads over the request threads
+        cores = workers or min(args.threads, os.cpu_count())
+        print(f"{mode:<10}{cores:>6}{rate:>12.1f}{rate / cores:>12.1f}{rejected:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Latency/throughput reports of bench/loadgen.py, and their comparison.
+
+    python bench/report.py base.json head.json --threshold 10
+
+A report is JSON with sorted keys, one entry per operation (count, errors,
+throughput and p50/p95/p99 in milliseconds) plus the commit and parameters
+it was produced with, so two reports diff cleanly. The comparison prints the
+change of every metric and exits with status 1 when a percentile got slower,
+or throughput lower, by more than --threshold percent. Operations with fewer
+than --min-count samples on either side are shown but never flagged, their
+tail percentiles are a handful of requests.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(round(p / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """Summary of one operation from its latencies in seconds"""
+    latencies = sorted(latencies)
+    summary = {
+        "count": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        summary[f"p{p}_ms"] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+
+def git_commit():
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=backend, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=backend,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def build_report(samples, errors, elapsed, parameters):
+    """samples: operation -> latencies in seconds, errors: operation -> count"""
+    commit, dirty = git_commit()
+    every = [latency for latencies in samples.values() for latency in latencies]
+    return {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "elapsed_s": round(elapsed, 3),
+            **parameters,
+        },
+        "operations": {name: summarize(latencies, errors.get(name, 0), elapsed)
+                       for name, latencies in sorted(samples.items())},
+        "total": summarize(every, sum(errors.values()), elapsed),
+    }
+
+
+def write_report(report, path):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def _change(base, head):
+    if base in (None, 0) or head is None:
+        return None
+    return (head - base) / base * 100
+
+
+def compare(base, head, threshold, min_count=0):
+    """Print a base -> head table, returns the regressions beyond threshold percent"""
+    regressions = []
+    metrics = [f"p{p}_ms" for p in PERCENTILES] + ["throughput_rps"]
+    print(f"base {base['meta'].get('commit') or '?'}  head {head['meta'].get('commit') or '?'}")
+    print(f"{'operation':<32}" + "".join(f"{metric:>22}" for metric in metrics))
+    rows = sorted(set(base["operations"]) | set(head["operations"])) + ["total"]
+    for name in rows:
+        old = base["total"] if name == "total" else base["operations"].get(name, {})
+        new = head["total"] if name == "total" else head["operations"].get(name, {})
+        cells = []
+        enough = min(old.get("count", 0), new.get("count", 0)) >= min_count
+        for metric in metrics:
+            change = _change(old.get(metric), new.get(metric))
+            cells.append(f"{new.get(metric) or '-':>12} ({change:+6.1f}%)" if change is not None
+                         else f"{new.get(metric) or '-':>22}")
+            worse = -change if metric == "throughput_rps" and change is not None else change
+            if enough and worse is not None and worse > threshold:
+                regressions.append((name, metric, change))
+        print(f"{name:<32}" + "".join(f"{cell:>22}" for cell in cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("base")
+    parser.add_argument("head")
+    parser.add_argument("--threshold", type=float, default=10, help="percent change counted as a regression")
+    parser.add_argument("--min-count", type=int, default=50, help="samples needed before an operation is judged")
+    args = parser.parse_args()
+
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.head) as f:
+        head = json.load(f)
+    regressions = compare(base, head, args.threshold, args.min_count)
+    for name, metric, change in regressions:
+        print(f"REGRESSION {name} {metric} {change:+.1f}%")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
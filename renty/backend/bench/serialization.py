@@ -0,0 +1,85 @@
+"""
+Rows per second for a 10k-row post listing, ORM + to_dict() + jsonify against
+column projection (+ orjson when installed).
+
+    python bench/serialization.py --rows 10000
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from flask import Flask, jsonify
+from extensions import db
+from models.user import User
+from models.post import Post
+from services.serialization import POST_FIELDS, project_posts, rows_to_dicts, json_response, orjson
+
+
+def seed(n_rows):
+    user = User(name="bench", email="bench@example.com", password="bench")
+    db.session.add(user)
+    db.session.commit()
+    now = datetime.utcnow()
+    db.session.execute(Post.__table__.insert(), [{
+        "id": str(uuid.uuid4()), "user_id": user.id, "instrument_type": "Piano", "brand": "Yamaha",
+        "title": f"Upright piano {i}", "price": 950.0, "description": "Well kept upright piano, tuned last month",
+        "phone_number": "12345678", "image": "piano.jpg", "availability": "available", "status": "for sale",
+        "location": "Tunis", "created_at": now, "updated_at": now,
+    } for i in range(n_rows)])
+    db.session.commit()
+
+
+def orm_to_dict():
+    db.session.expunge_all()
+    return jsonify([post.to_dict() for post in Post.query.all()]).get_data()
+
+
+def projection(fields):
+    def run():
+        return json_response(rows_to_dicts(project_posts(Post.query, fields).all(), fields)).get_data()
+    return run
+
+
+def measure(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    db.init_app(app)
+
+    with app.app_context(), app.test_request_context():
+        db.create_all()
+        seed(args.rows)
+
+        cases = [("to_dict + jsonify", False, orm_to_dict)]
+        for use_orjson in ([False, True] if orjson else [False]):
+            encoder = "orjson" if use_orjson else "stdlib"
+            cases.append((f"projection, all fields, {encoder}", use_orjson, projection(POST_FIELDS)))
+            cases.append((f"projection, fields=id,title,price, {encoder}", use_orjson,
+                          projection(("id", "title", "price"))))
+
+        print(f"{'path':<45}{'rows/s':>12}")
+        for name, use_orjson, fn in cases:
+            app.config["USE_ORJSON"] = use_orjson
+            print(f"{name:<45}{measure(fn, args.rows, args.repeat):>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
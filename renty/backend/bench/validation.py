@@ -0,0 +1,112 @@
+"""
+Validations per second of a post payload: the previous field-by-field helper
+(regex per call, stat() of the upload folder, first error only) against the
+compiled POST_SCHEMA (every error, image names from the registry).
+
+    python bench/validation.py --iterations 100000
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import re
+import tempfile
+import time
+
+from flask import Flask
+from extensions import db
+from routes.helper import POST_SCHEMA, POST_UPDATE_SCHEMA, VALID_INSTRUMENT_TYPES, allowed_image
+from services.media_store import media_store
+
+IMAGE = "3f1b6c0e9d5a4b7e8c2d1f0a9b8c7d6e5f4a3b2c1d0e9f8a7b6c5d4e3f2a1b0c.jpg"
+VALID = {
+    "title": "Yamaha upright piano", "description": "Well kept upright piano, tuned last month", "price": "950",
+    "status": "for sale", "image": IMAGE, "instrument_type": "Piano", "brand": "Yamaha",
+    "phone_number": "12345678", "location": "Tunis",
+}
+INVALID = dict(VALID, title="Pia", price="-3", phone_number="12ab", instrument_type="Harp")
+UPDATE = {"price": "900", "description": "Price lowered, still tuned"}
+
+
+def legacy_post_input_error(title, description, price, status, image, instrument_type, brand, phone_number, location):
+    """The helper as it was before POST_SCHEMA, kept here as the baseline"""
+    if not title or len(title) < 5:
+        return "Title must be at least 5 characters long."
+    if description and len(description) < 10:
+        return "Description must be at least 10 characters long."
+    try:
+        price = float(price)
+    except (ValueError, TypeError):
+        return "Price must be a valid number."
+    if price <= 0:
+        return "Price must be a valid number."
+    if not isinstance(phone_number, str) or not phone_number.isdigit() or len(phone_number) < 8:
+        return "Phone number must be at least 8 digits long and contain only digits."
+    if status not in ['for rental', 'for sale']:
+        return "Status must be 'for rental' or 'for sale'."
+    if image:
+        if re.match(r'^(http|https)://', image):
+            if not allowed_image(image):
+                return "Image URL must point to a valid image format (png, jpg, jpeg)."
+        elif media_store.exists(image):
+            if not allowed_image(image):
+                return "Local image must be in png, jpg or jpeg format."
+        else:
+            return "Image must be a valid URL or a valid local file in the uploads folder."
+    if instrument_type not in VALID_INSTRUMENT_TYPES:
+        return f"Instrument type must be one of: {', '.join(VALID_INSTRUMENT_TYPES)}."
+    if not brand or len(brand) < 3:
+        return "Brand must be at least 3 characters long."
+    if not location or location == "":
+        return "Location is required"
+    return None
+
+
+def legacy(payload):
+    return legacy_post_input_error(*(payload.get(field) for field in (
+        "title", "description", "price", "status", "image", "instrument_type", "brand", "phone_number", "location")))
+
+
+def measure(fn, payload, iterations):
+    fn(payload)
+    t0 = time.perf_counter()
+    for _ in range(iterations):
+        fn(payload)
+    return iterations / (time.perf_counter() - t0)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["UPLOAD_FOLDER"] = tempfile.mkdtemp()
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    media_store.init_app(app)
+    # A stored original in the sharded layout, as /upload leaves it
+    path = media_store.path_for(IMAGE)
+    os.makedirs(os.path.dirname(path))
+    open(path, "wb").close()
+    with app.app_context():
+        db.create_all()
+        media_store.register([IMAGE])
+        assert legacy(VALID) is None and not POST_SCHEMA.errors(VALID)
+
+    cases = [
+        ("valid payload", VALID, legacy, POST_SCHEMA.errors),
+        ("invalid payload (4 errors)", INVALID, legacy, POST_SCHEMA.errors),
+        # The old update path had to validate a full payload, the new one only what changed
+        ("update of 2 fields", UPDATE, lambda payload: legacy(dict(VALID, **payload)), POST_UPDATE_SCHEMA.errors),
+    ]
+    print(f"{'case':<30}{'helper /s':>14}{'schema /s':>14}{'speedup':>9}")
+    with app.app_context():
+        for name, payload, old, new in cases:
+            before = measure(old, payload, args.iterations)
+            after = measure(new, payload, args.iterations)
+            print(f"{name:<30}{before:>14,.0f}{after:>14,.0f}{after / before:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Cost of counting views: one UPDATE and commit per view of a post against
+the write-behind counter of services/popularity.py (record() per view, one
+batched flush for all of them).
+
+    python bench/view_counts.py --posts 1000 --views 20000
+
+Uses a throwaway SQLite database (DEV_DATABASE_URL); the flush is timed
+with the views, as if every view had arrived within one flush interval.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import argparse
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+from sqlalchemy import insert, update
+
+
+def make_app():
+    os.environ["DEV_DATABASE_URL"] = "sqlite:///" + tempfile.mktemp(suffix=".db")
+    from app import create_app
+    return create_app()
+
+
+def seed(app, n_posts):
+    from extensions import db
+    from models.post import Post
+    from models.user import User
+    now = datetime.utcnow()
+    with app.app_context():
+        user = User(name="bench", email=f"{uuid.uuid4().hex}@example.com", password="x")
+        db.session.add(user)
+        db.session.flush()
+        rows = [{
+            "id": str(uuid.uuid4()), "user_id": user.id, "instrument_type": "Guitar", "title": f"Electric guitar {i}",
+            "brand": "Fender", "price": 100, "description": "Solid body electric guitar", "phone_number": "12345678",
+            "status": "for sale", "availability": "available", "location": "Tunis", "created_at": now, "updated_at": now,
+        } for i in range(n_posts)]
+        db.session.execute(insert(Post), rows)
+        db.session.commit()
+        return [row["id"] for row in rows]
+
+
+def per_view_update(app, views):
+    """What get_single_post would do with a synchronous counter"""
+    from extensions import db
+    from models.post import Post
+    with app.app_context():
+        for post_id in views:
+            db.session.execute(update(Post).where(Post.id == post_id)
+                               .values(view_count=Post.view_count + 1, updated_at=Post.updated_at))
+            db.session.commit()
+
+
+def write_behind(app, views):
+    from services.popularity import view_counter
+    for post_id in views:
+        view_counter.record(post_id)
+    view_counter.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--views", type=int, default=20000)
+    args = parser.parse_args()
+
+    app = make_app()
+    post_ids = seed(app, args.posts)
+    # Views follow a long tail: a few posts get most of them
+    views = random.choices(post_ids, weights=[1 / (rank + 1) for rank in range(len(post_ids))], k=args.views)
+
+    print(f"{'counter':>14}{'ms':>10}{'views/s':>12}")
+    for name, fn in (("per view", per_view_update), ("write-behind", write_behind)):
+        t0 = time.perf_counter()
+        fn(app, views)
+        elapsed = time.perf_counter() - t0
+        print(f"{name:>14}{elapsed * 1000:>10.1f}{len(views) / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,10 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
+from services.db_pool import MeteredQueuePool, RoutingSession
 
 
-db = SQLAlchemy()
+# Pool checkouts are timed for /metrics; in-memory SQLite keeps its StaticPool.
+# Reads of GET requests may go to a replica, see services/replicas.py
+db = SQLAlchemy(engine_options={'poolclass': MeteredQueuePool}, session_options={'class_': RoutingSession})
 migrate = Migrate()
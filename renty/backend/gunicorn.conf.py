@@ -0,0 +1,24 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))  # keep at or below DB_POOL_SIZE + DB_MAX_OVERFLOW
+# Build the app once in the master, workers are forked from it
+preload_app = True
+# Recycle workers now and then, staggered so they never restart together
+max_requests = 10000
+max_requests_jitter = 1000
+timeout = 30
+graceful_timeout = 30
+
+
+def on_starting(server):
+    from wsgi import check_workers
+    check_workers(server.cfg.workers)
+
+
+def post_fork(server, worker):
+    from wsgi import after_fork
+    after_fork()
@@ -0,0 +1,33 @@
+"""binary geohash collation
+
+posts.geohash compares byte by byte on MySQL, so the [cell, cell~) prefix
+ranges of services/geo.py match under any server default collation.
+SQLite already compares strings as binary.
+
+Revision ID: 7b221ffb1759
+Revises: 2b0895e6d8b0
+Create Date: 2026-10-18 14:39:09.382192
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+# revision identifiers, used by Alembic.
+revision = '7b221ffb1759'
+down_revision = '2b0895e6d8b0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        op.alter_column('posts', 'geohash', existing_type=sa.String(length=12), existing_nullable=True,
+                        type_=mysql.VARCHAR(12, charset='ascii', collation='ascii_bin'))
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'mysql':
+        op.alter_column('posts', 'geohash', existing_type=mysql.VARCHAR(12, charset='ascii', collation='ascii_bin'),
+                        existing_nullable=True, type_=sa.String(length=12))
@@ -0,0 +1,47 @@
+"""cascade user posts
+
+posts.user_id deletes with its user (ON DELETE CASCADE), so deleting an
+account is one statement however many posts it has.
+
+Revision ID: a5acaa5b49f7
+Revises: deb4428c973a
+Create Date: 2026-10-18 14:15:59.270210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5acaa5b49f7'
+down_revision = 'deb4428c973a'
+branch_labels = None
+depends_on = None
+
+
+# SQLite foreign keys have no name: batch mode recreates the table and names them with this
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+FK_NAME = 'fk_posts_user_id_users'
+
+
+def _user_fk_name():
+    for fk in sa.inspect(op.get_bind()).get_foreign_keys('posts'):
+        if fk['referred_table'] == 'users' and fk['constrained_columns'] == ['user_id']:
+            return fk['name'] or FK_NAME  # MySQL: posts_ibfk_1
+    return None
+
+
+def _replace_user_fk(**options):
+    name = _user_fk_name()
+    with op.batch_alter_table('posts', schema=None, naming_convention=NAMING_CONVENTION) as batch_op:
+        if name:
+            batch_op.drop_constraint(name, type_='foreignkey')
+        batch_op.create_foreign_key(FK_NAME, 'users', ['user_id'], ['id'], **options)
+
+
+def upgrade():
+    _replace_user_fk(ondelete='CASCADE')
+
+
+def downgrade():
+    _replace_user_fk()
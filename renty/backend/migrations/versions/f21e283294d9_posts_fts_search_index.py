@@ -0,0 +1,41 @@
+"""posts_fts search index
+
+The FTS5 table of the SQLite search backend (services/search.py), filled
+from the posts already there. MySQL has its FULLTEXT index instead, and a
+SQLite built without FTS5 falls back to the in-memory index.
+
+Revision ID: f21e283294d9
+Revises: bb2c2538e126
+Create Date: 2026-10-18 16:02:41.517203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f21e283294d9'
+down_revision = 'bb2c2538e126'
+branch_labels = None
+depends_on = None
+
+
+def _has_fts5(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return 'ENABLE_FTS5' in bind.execute(sa.text('PRAGMA compile_options')).scalars().all()
+
+
+def upgrade():
+    bind = op.get_bind()
+    if not _has_fts5(bind):
+        return
+    op.execute('CREATE VIRTUAL TABLE IF NOT EXISTS posts_fts USING fts5(post_id UNINDEXED, title, brand, description)')
+    op.execute('DELETE FROM posts_fts')
+    op.execute("INSERT INTO posts_fts (post_id, title, brand, description) "
+               "SELECT id, title, brand, COALESCE(description, '') FROM posts")
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS posts_fts')
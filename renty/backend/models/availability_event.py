@@ -0,0 +1,36 @@
+from datetime import datetime
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, String, DateTime, Integer, Enum
+from extensions import db
+
+
+AVAILABILITY = Enum("sold", "rented", "available")
+
+
+class AvailabilityEvent(db.Model):
+    """One availability transition of a post, appended by the /status routes for auditing"""
+    __tablename__ = 'post_availability_events'
+    __table_args__ = (
+        db.Index('ix_post_availability_events_post_id', 'post_id', 'id'),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # No foreign key: the history outlives the post
+    post_id = Column(String(36), nullable=False)
+    user_id = Column(String(36), nullable=False)
+    from_availability = Column(AVAILABILITY, nullable=False)
+    to_availability = Column(AVAILABILITY, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "post_id": self.post_id,
+            "user_id": self.user_id,
+            "from": self.from_availability,
+            "to": self.to_availability,
+            "created_at": self.created_at.isoformat(),
+        }
@@ -0,0 +1,20 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, String, Integer
+from extensions import db
+
+
+class PostFacetCount(db.Model):
+    """Number of posts per facet value, kept up to date by the post write routes"""
+    __tablename__ = 'post_facet_counts'
+
+    facet = Column(String(30), primary_key=True)  # e.g. 'instrument_type', 'price_bucket'
+    value = Column(String(30), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __init__(self, facet, value, count=0):
+        self.facet = facet
+        self.value = value
+        self.count = count
@@ -0,0 +1,18 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, Integer, Double
+from extensions import db
+
+
+class PopularityEpoch(db.Model):
+    """
+    One row, the unix time posts.popularity is relative to (see
+    services/popularity.py). Moved forward, with every score rescaled, long
+    before the weights of new views could overflow.
+    """
+    __tablename__ = 'popularity_epoch'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    epoch = Column(Double, nullable=False)
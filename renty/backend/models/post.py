@@ -3,7 +3,8 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
-from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Float, Enum
+from sqlalchemy import Column, String, DateTime, Integer, ForeignKey, Float, Double, Enum
+from sqlalchemy.dialects import mysql
 from sqlalchemy.orm import relationship
 from extensions import db
 import uuid
@@ -11,9 +12,32 @@ import uuid
 
 class Post(db.Model):
     __tablename__ = 'posts'
+    __table_args__ = (
+        # Backs the keyset pagination on /home/search (newest first)
+        db.Index('ix_posts_created_at_id', 'created_at', 'id'),
+        # Backs the change feed on /home/posts/changes (oldest change first)
+        db.Index('ix_posts_updated_at_id', 'updated_at', 'id'),
+        # Access paths of /home/filter: equality filters first, then its keyset order, so a page is read
+        # in order without a sort and a price range is checked on the way
+        db.Index('ix_posts_type_status_availability_created', 'instrument_type', 'status', 'availability',
+                 'created_at', 'id'),
+        db.Index('ix_posts_status_availability_created', 'status', 'availability', 'created_at', 'id'),
+        db.Index('ix_posts_brand_created', 'brand', 'created_at', 'id'),
+        # Prefix ranges of the geohash back the radius/bounding-box search
+        db.Index('ix_posts_geohash', 'geohash'),
+        # The popular rankings of services/popularity.py, overall and per type
+        db.Index('ix_posts_popularity', 'popularity', 'id'),
+        db.Index('ix_posts_type_popularity', 'instrument_type', 'popularity', 'id'),
+        # References to an upload, checked before it is purged
+        db.Index('ix_posts_image', 'image'),
+        # Used by the MySQL backend of services/search.py
+        db.Index('ix_posts_fulltext', 'title', 'brand', 'description',
+                 mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
 
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = Column(String(36), ForeignKey('users.id'), nullable=False)
+    # The database deletes a user's posts with the user
+    user_id = Column(String(36), ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
     instrument_type = Column(Enum("Guitar", "Piano", "Violin", "Drums"), nullable=False)
 
     brand = Column(String(100), nullable=False)  # Brand of the instrument
@@ -25,8 +49,21 @@ class Post(db.Model):
     availability = Column(Enum("sold", "rented", "available"), nullable=False)  # Availability can be 'available', 'sold', etc.
     status = Column(Enum("for sale", "for rental"), nullable=False)
     location = Column(String(300), nullable=False)
+    # Filled from location by services.geo.geocoder, NULL when it is not a known place
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    # Binary collation on MySQL: the prefix ranges of services.geo.within_cells need '~' to sort
+    # after every geohash character, which utf8mb4_0900_ai_ci does not do
+    geohash = Column(String(12).with_variant(mysql.VARCHAR(12, charset='ascii', collation='ascii_bin'), 'mysql'),
+                     nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every write, the ETag checked by PATCH If-Match
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    # Written in batches by services.popularity.view_counter, never by an edit; not in to_dict(),
+    # which cached responses are made of
+    view_count = Column(Integer, nullable=False, default=0, server_default='0')
+    popularity = Column(Double, nullable=False, default=0, server_default='0')  # decayed views, see there
 
 
     user = relationship('User', back_populates='posts')
@@ -59,6 +96,9 @@ class Post(db.Model):
             "availability": self.availability,
             "status": self.status,
             "location": self.location,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
             "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "updated_at": self.updated_at.isoformat(),
+            "version": self.version
         }
@@ -0,0 +1,17 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, Integer, Double
+from extensions import db
+
+
+class ReplicaHeartbeat(db.Model):
+    """
+    One row, stamped on the primary with the unix time every few seconds.
+    Read back from a replica it tells how far that replica has replayed.
+    """
+    __tablename__ = 'replica_heartbeat'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    beat_at = Column(Double, nullable=False)  # unix time, FLOAT would round it to minutes
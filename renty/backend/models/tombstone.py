@@ -0,0 +1,21 @@
+from datetime import datetime
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, String, DateTime
+from extensions import db
+
+
+class PostTombstone(db.Model):
+    """A deleted post, so /home/posts/changes can tell clients to drop it"""
+    __tablename__ = 'post_tombstones'
+    __table_args__ = (
+        # Position of the tombstone in the change feed
+        db.Index('ix_post_tombstones_deleted_at_post_id', 'deleted_at', 'post_id'),
+    )
+
+    # No foreign key: the post is gone
+    post_id = Column(String(36), primary_key=True)
+    user_id = Column(String(36), nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
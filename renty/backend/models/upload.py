@@ -0,0 +1,15 @@
+from datetime import datetime
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from sqlalchemy import Column, String, DateTime
+from extensions import db
+
+
+class UploadedImage(db.Model):
+    """A name in the upload store, so checking a post's image needs no filesystem access"""
+    __tablename__ = 'uploaded_images'
+
+    name = Column(String(255), primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
@@ -1,13 +1,13 @@
 from datetime import datetime
 import sys
 import os
-import bcrypt
 sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
 
 import uuid
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, Integer
 from sqlalchemy.orm import relationship
 from extensions import db
+from auth.password_hasher import password_hasher
 
 
 class User(db.Model):
@@ -17,11 +17,14 @@ class User(db.Model):
     name = Column(String(50), nullable=False)
     email = Column(String(100), unique=True, nullable=False)
     password = Column(String(255), nullable=False)
-    image = Column(String(255), nullable=True)  # Store URL or path to the image
+    image = Column(String(255), nullable=True, index=True)  # Store URL or path to the image
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped by every profile write, the ETag checked by PATCH If-Match
+    version = Column(Integer, nullable=False, default=1, server_default='1')
 
-    posts = relationship('Post', back_populates='user', cascade='all, delete')  # User's posts
+    # User's posts; passive_deletes leaves their removal to ON DELETE CASCADE instead of loading them
+    posts = relationship('Post', back_populates='user', cascade='all, delete', passive_deletes=True)
 
 
     def __init__(self, name, email, password, image=None):
@@ -39,18 +42,22 @@ class User(db.Model):
             "password": self.password,
             "image": self.image,
             "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "version": self.version
         }
 
 
     def _hash_password(self, password):
         """Hash the password using bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        return password_hasher.hash(password)
 
     def verify_password(self, password):
         """Verify if the provided password matches the stored hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), self.password.encode('utf-8'))
+        return password_hasher.verify(password, self.password)
+
+    def needs_rehash(self):
+        """Whether the stored hash uses an outdated bcrypt cost"""
+        return password_hasher.needs_rehash(self.password)
 
     def set_password(self, password):
         """Update the user's password"""
@@ -0,0 +1,164 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+from flask import jsonify, request
+from sqlalchemy import func, select
+from models.post import Post
+from models.user import User
+from auth.authentication import AuthError, request_user_id
+from auth.principal_cache import principal_cache
+from services.geo import posts_in_bbox
+from services.pagination import keyset_query, keyset_result, InvalidCursor
+from services.serialization import parse_fields, project_posts, rows_to_dicts, json_response, InvalidFields, \
+    wants_ndjson, ndjson_items_response, NDJSON_BATCH_SIZE
+from services.popularity import popular_posts, view_counter
+from routes.home_routes import POSTS_PER_PAGE, KEYSET_COLUMNS, _page_response, _cursor_response, _near_query, \
+    _near_response, _popular_query, _popular_response
+
+# Async versions of the read endpoints, served by asgi.py. Each handler gets an
+# AsyncSession and runs inside a Flask request context built from the ASGI
+# scope, so queries are built with the same helpers as the blueprints and
+# only their execution is awaited.
+
+
+class NDJSONStream:
+    """A streamed NDJSON body: the first batch of rows and the partitions left"""
+
+    def __init__(self, result, first, partitions, fields):
+        self.result = result
+        self.first = first
+        self.partitions = partitions
+        self.fields = fields
+
+
+async def authenticate(session):
+    """(user_id, None) for the request's bearer token, or (None, 401 response)"""
+    try:
+        user_id = request_user_id()
+    except AuthError as e:
+        return None, (jsonify({"error": e.message}), 401)
+    if not principal_cache.contains(user_id):
+        if (await session.execute(select(User.id).where(User.id == user_id))).first() is None:
+            return None, (jsonify({"error": "User not found"}), 401)
+        principal_cache.add(user_id)
+    return user_id, None
+
+
+async def _all(session, query):
+    return (await session.execute(query.statement)).all()
+
+
+async def _count(session, query):
+    return await session.scalar(select(func.count()).select_from(query.order_by(None).statement.subquery()))
+
+
+async def _ndjson_stream(session, query, fields):
+    """NDJSONStream over a server-side cursor, None when the query is empty"""
+    result = await session.stream(query.statement)
+    partitions = result.partitions(NDJSON_BATCH_SIZE)
+    first = await anext(partitions, None)
+    if first is None:
+        await result.close()
+        return None
+    return NDJSONStream(result, first, partitions, fields)
+
+
+async def get_paginated_posts(session, user_id):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    if 'sort' in request.args:
+        # The rankings are held in memory, reread every POPULAR_REFRESH_SECONDS on this session
+        if popular_posts.due():
+            await popular_posts.refresh_async(session)
+        query, ranking, page, error = _popular_query(fields)
+        if error:
+            return error
+        return _popular_response(await _all(session, query), ranking, page, fields)
+
+    if 'near' in request.args or 'bbox' in request.args:
+        query, search, error = _near_query(fields)
+        if error:
+            return error
+        done = False
+        while not done:
+            box = search.box()
+            done = search.add(await _all(session, posts_in_bbox(query, *box)) if box else [])
+        return _near_response(search, fields)
+
+    if 'cursor' in request.args:
+        cursor = request.args.get('cursor') or None
+        try:
+            query, direction = keyset_query(project_posts(Post.query, fields, extra=KEYSET_COLUMNS),
+                                            cursor=cursor, per_page=POSTS_PER_PAGE)
+        except InvalidCursor:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        rows, next_cursor, prev_cursor = keyset_result(await _all(session, query), cursor, direction, POSTS_PER_PAGE)
+        total = await _count(session, Post.query) if request.args.get('include_total', type=int) else None
+        return _cursor_response(rows, next_cursor, prev_cursor, fields, total)
+
+    page = request.args.get('page', 1, type=int)
+    query = project_posts(Post.query, fields)
+    if page is None:
+        return json_response(rows_to_dicts(await _all(session, query), fields))
+
+    page = max(page, 1)
+    total = await _count(session, query)
+    rows = await _all(session, query.limit(POSTS_PER_PAGE).offset((page - 1) * POSTS_PER_PAGE))
+    return _page_response(rows, page, total, fields)
+
+
+async def get_single_post(session, user_id, post_id):
+    post = await session.get(Post, post_id)
+    if not post:
+        return jsonify({'message': 'Post not found.'}), 404
+    view_counter.record(post_id)
+    return jsonify(post.to_dict()), 200
+
+
+async def get_by_category(session, user_id):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    instrument_type = request.args.get('type')
+    query = project_posts(Post.query, fields)
+    if instrument_type:
+        query = query.filter_by(instrument_type=instrument_type)
+
+    if wants_ndjson():
+        return await _ndjson_stream(session, query, fields) or ndjson_items_response([])
+
+    return json_response(rows_to_dicts(await _all(session, query), fields))
+
+
+async def get_user_posts(session, user_id):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = project_posts(Post.query.filter_by(user_id=user_id), fields)
+    if wants_ndjson():
+        stream = await _ndjson_stream(session, query, fields)
+        if stream is None:
+            return jsonify({'message': 'No posts found for this user.'}), 404
+        return stream
+
+    user_posts = await _all(session, query)
+    if not user_posts:
+        return jsonify({'message': 'No posts found for this user.'}), 404
+
+    return json_response(rows_to_dicts(user_posts, fields))
+
+
+# path -> handler; view arguments come from the ASGI router in asgi.py
+ASYNC_ROUTES = {
+    "/home/search": get_paginated_posts,
+    "/home/category": get_by_category,
+    "/home/posts/<string:post_id>": get_single_post,
+    "/users/user/posts": get_user_posts,
+}
@@ -1,75 +1,61 @@
 from flask import jsonify
 from auth.authentication import token_required
 from models.post import Post
-from werkzeug.utils import secure_filename
+from services.media_store import media_store
+from services.validation import Schema, Text, Number, Choice, Check
 import re
-import os
-from typing import Union
 
 
-UPLOAD_FOLDER = 'static/uploads'
-
 # Allowed extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
 VALID_INSTRUMENT_TYPES = ["Guitar", "Piano", "Drums", "Violin"]
 
-def validate_post_input(title: str, description: str, price: Union[str, float], status: str, image: str,
-                        instrument_type: str, brand: str, phone_number: str, location: str):
-    # Validate title
-    if not title or len(title) < 5:
-        return jsonify({"error": "Title must be at least 5 characters long."}), 400
-
-    # Validate description
-    if description and len(description) < 10:
-        return jsonify({"error": "Description must be at least 10 characters long."}), 400
-
-    # Convert price to float
-    try:
-        price = float(price)
-    except (ValueError, TypeError):
-        return jsonify({"error": "Price must be a valid number."}), 400
-
-    # Validate price
-    if price <= 0:
-        return jsonify({"error": "Price must be a valid number."}), 400
-
-    # Validate phone number (Ensure it's a string and check if it contains only digits)
-    if not phone_number.isdigit() or len(phone_number) < 8:
-        return jsonify({"error": "Phone number must be at least 8 digits long and contain only digits."}), 400
-
-    # Validate status
-    if status not in ['for rental', 'for sale']:
-        return jsonify({"error": "Status must be 'for rental' or 'for sale'."}), 400
-
-    # If an image is provided, validate it
-    if image:
-        # Validate if image is a URL
-        if re.match(r'^(http|https)://', image):
-            # Ensure the URL points to a file with a valid image extension
-            if not allowed_image(image):
-                return jsonify({"error": "Image URL must point to a valid image format (png, jpg, jpeg)."}), 400
-
-        # Validate if image is a local file path
-        elif os.path.isfile(os.path.join(UPLOAD_FOLDER, secure_filename(image))):
-            # Check if the file is in the correct upload folder and has an allowed extension
-            if not allowed_image(image):
-                return jsonify({"error": "Local image must be in png, jpg or jpeg format."}), 400
-        else:
-            return jsonify({"error": "Image must be a valid URL or a valid local file in the uploads folder."}), 400
-
-    # Validate instrument type
-    if instrument_type not in VALID_INSTRUMENT_TYPES:
-        return jsonify({"error": f"Instrument type must be one of: {', '.join(VALID_INSTRUMENT_TYPES)}."}), 400
-
-    # Validate brand
-    if not brand or len(brand) < 3:
-        return jsonify({"error": "Brand must be at least 3 characters long."}), 400
-
-    # Validate location
-    if not location or location == "":
-        return jsonify({"error": "Location is required"}), 400
-
+URL_RE = re.compile(r'^(http|https)://')
+
+
+def image_error(image):
+    # An image is either a URL or the name of a file in the upload store
+    if not isinstance(image, str):
+        return "Image must be a URL or the name of an uploaded file."
+    if URL_RE.match(image):
+        # Ensure the URL points to a file with a valid image extension
+        if not allowed_image(image):
+            return "Image URL must point to a valid image format (png, jpg, jpeg)."
+    elif media_store.is_uploaded(image):
+        if not allowed_image(image):
+            return "Local image must be in png, jpg or jpeg format."
+    else:
+        return "Image must be a valid URL or a valid local file in the uploads folder."
+    return None
+
+
+# Compiled once; fields are checked in this order, so errors come out in it too
+POST_SCHEMA = Schema({
+    'title': Text("Title must be at least 5 characters long.", min_length=5),
+    'description': Text("Description must be at least 10 characters long.", min_length=10, required=False),
+    'price': Number("Price must be a valid number.", positive=True),
+    'phone_number': Text("Phone number must be at least 8 digits long and contain only digits.", pattern=r'\d{8,}'),
+    'status': Choice(['for rental', 'for sale'], "Status must be 'for rental' or 'for sale'."),
+    'image': Check(image_error, required=False),
+    'instrument_type': Choice(VALID_INSTRUMENT_TYPES,
+                              f"Instrument type must be one of: {', '.join(VALID_INSTRUMENT_TYPES)}."),
+    'brand': Text("Brand must be at least 3 characters long.", min_length=3),
+    'location': Text("Location is required"),
+})
+POST_UPDATE_SCHEMA = POST_SCHEMA.partial()
+
+
+def post_input_errors(data, partial=False):
+    """Every validation error of a post payload as {field: message}, empty when it is valid"""
+    return (POST_UPDATE_SCHEMA if partial else POST_SCHEMA).errors(data)
+
+
+def validate_post_input(data, partial=False):
+    """400 response listing every invalid field, None when the payload is valid"""
+    errors = post_input_errors(data, partial)
+    if errors:
+        return jsonify({"error": next(iter(errors.values())), "fields": errors}), 400
     return None  # No validation errors
 
 
@@ -1,9 +1,23 @@
-from flask import Blueprint, jsonify, request, url_for
+import math
+import time
+from datetime import datetime, timezone
+from flask import Blueprint, current_app, g, jsonify, request, url_for
 from flask_jwt_extended import create_access_token, get_jwt, jwt_required
-from auth.authentication import token_required, revoked_tokens
+from auth.authentication import token_required
+from auth.revocation import revocation_store
+from auth.password_hasher import HasherOverloaded
 from extensions import db
 from models.user import User
 from models.post import Post
+from services.pagination import keyset_page, InvalidCursor
+from services.search import search_index
+from services.facets import get_facet_counts
+from services.changes import START, InvalidToken, changes_since, decode_token, encode_token, tombstone_horizon
+from services.geo import geocoder, posts_in_bbox, RingSearch
+from services.response_cache import response_cache
+from services.popularity import INSTRUMENT_TYPES, popular_posts, view_counter
+from services.serialization import parse_fields, project_posts, rows_to_dicts, json_response, InvalidFields, \
+    wants_ndjson, ndjson_response, ndjson_items_response
 
 
 home_bp = Blueprint("home_bp", __name__, url_prefix="/home")
@@ -28,6 +42,8 @@ def register_user():
         db.session.commit()
 
         return jsonify({'message': 'User created successfully'}), 201
+    except HasherOverloaded:
+        raise  # answered with 503 by the app error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -45,10 +61,18 @@ def login_user():
         if not user.verify_password(password):
             return jsonify({'message': 'Invalid password'}), 401
 
+        # Upgrade hashes made with an older BCRYPT_ROUNDS while we have the plain password
+        if user.needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+
         # Generate token with JWTManager
         access_token = create_access_token(identity=user.id)
+        g.user_id = user.id  # a new session reads from the primary for a moment, the account may be brand new
 
         return jsonify({'access_token': access_token, 'user_id': user.id}), 200
+    except HasherOverloaded:
+        raise  # answered with 503 by the app error handler
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -56,53 +80,275 @@ def login_user():
 @home_bp.route("/logout", methods=["POST"])
 @jwt_required()
 def logout():
-    jti = get_jwt()["jti"]
-    revoked_tokens.add(jti)  # Add token's JTI to blocklist
+    token = get_jwt()
+    revocation_store.revoke(token["jti"], token["exp"])  # Blocklisted until the token expires
     return jsonify({'message': 'Logged out successfully'}), 200
 
 POSTS_PER_PAGE = 10
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+
+
+def _sorted_by_popularity():
+    # The ranking moves with views, which never bump the 'posts' namespace
+    return 'sort' in request.args
+
+
 @home_bp.route("/search", methods=["GET"])
 @token_required
+@response_cache.cached('posts', unless=_sorted_by_popularity)
 def get_paginated_posts(user_id):
+    # ?fields=title,price,... only selects and returns those columns
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Popular mode: ?sort=popular[&type=Guitar], most viewed lately first
+    if 'sort' in request.args:
+        return _get_popular_posts(fields)
+
+    # Spatial mode: ?near=lat,lon (or a place name)&radius_km= and/or ?bbox=, nearest first
+    if 'near' in request.args or 'bbox' in request.args:
+        return _get_posts_near(fields)
+
+    # Cursor mode: ?cursor= (empty for the first page) switches to keyset pagination
+    if 'cursor' in request.args:
+        return _get_posts_by_cursor(fields)
+
     page = request.args.get('page', 1, type=int)
     if page is None:
-        posts = Post.query.all()
-        return jsonify([post.to_dict() for post in posts]), 200
+        rows = project_posts(Post.query, fields).all()
+        return json_response(rows_to_dicts(rows, fields))
+
+    pagination = project_posts(Post.query, fields).paginate(page=page, per_page=POSTS_PER_PAGE, error_out=False)
+    return _page_response(pagination.items, pagination.page, pagination.total, fields)
 
-    pagination = Post.query.paginate(page=page, per_page=POSTS_PER_PAGE, error_out=False)
-    posts = pagination.items
+
+def _page_response(rows, page, total, fields):
+    pages = math.ceil(total / POSTS_PER_PAGE)
 
     # generating urls for next and prev pages
-    next_url = url_for('home_bp.get_paginated_posts', page=pagination.next_num, _external=True) \
-        if pagination.has_next else None
-    prev_url = url_for('home_bp.get_paginated_posts', page=pagination.prev_num, _external=True) \
-        if pagination.has_prev else None
+    fields_arg = request.args.get('fields')
+    next_url = url_for('home_bp.get_paginated_posts', page=page + 1, fields=fields_arg, _external=True) \
+        if page < pages else None
+    prev_url = url_for('home_bp.get_paginated_posts', page=page - 1, fields=fields_arg, _external=True) \
+        if page > 1 else None
 
+    response = {
+        'posts': rows_to_dicts(rows, fields),
+        'pagination': {
+            'total': total,
+            'pages': pages,
+            'next': next_url,
+            'prev': prev_url
+        }
+    }
+
+    # following the http format
+    return json_response(response, 200, _link_header(next_url, prev_url))
+
+
+# Columns keyset_page() needs on every row to build the next/prev cursors
+KEYSET_COLUMNS = ('id', 'created_at')
+
+
+def _link_header(next_url, prev_url):
     links = []
     if next_url:
         links.append(f'<{next_url}>; rel="next"')
     if prev_url:
         links.append(f'<{prev_url}>; rel="prev"')
-
-    # following the http format
-    headers = {
+    return {
         'Link': ', '.join(links) if links else None
     }
 
+
+def _get_posts_by_cursor(fields):
+    cursor = request.args.get('cursor') or None
+    query = project_posts(Post.query, fields, extra=KEYSET_COLUMNS)
+    try:
+        rows, next_cursor, prev_cursor = keyset_page(query, cursor=cursor, per_page=POSTS_PER_PAGE)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    # COUNT(*) is a full scan, so the total is only computed when asked for
+    total = Post.query.count() if request.args.get('include_total', type=int) else None
+    return _cursor_response(rows, next_cursor, prev_cursor, fields, total)
+
+
+def _cursor_response(rows, next_cursor, prev_cursor, fields, total=None):
+    fields_arg = request.args.get('fields')
+    next_url = url_for('home_bp.get_paginated_posts', cursor=next_cursor, fields=fields_arg, _external=True) \
+        if next_cursor else None
+    prev_url = url_for('home_bp.get_paginated_posts', cursor=prev_cursor, fields=fields_arg, _external=True) \
+        if prev_cursor else None
+    headers = _link_header(next_url, prev_url)
+
+    pagination = {
+        'next_cursor': next_cursor,
+        'prev_cursor': prev_cursor,
+        'next': next_url,
+        'prev': prev_url
+    }
+    if total is not None:
+        pagination['total'] = total
+
+    response = {
+        'posts': rows_to_dicts(rows, fields),
+        'pagination': pagination
+    }
+
+    return json_response(response, 200, headers)
+
+def _parse_floats(value, count):
+    numbers = [float(part) for part in value.split(',')]
+    if len(numbers) != count or not all(math.isfinite(number) for number in numbers):
+        raise ValueError(value)
+    return numbers
+
+
+def _near_query(fields):
+    """
+    (query, RingSearch, None) for the ?near/?bbox arguments, or
+    (None, None, error response) when they are invalid. Fetch the rows of
+    posts_in_bbox(query, *search.box()) until search.add() says it is done.
+    """
+    near = request.args.get('near')
+    bbox = request.args.get('bbox')
+    try:
+        radius_km = request.args.get('radius_km', DEFAULT_RADIUS_KM, type=float)
+        if not 0 < radius_km <= MAX_RADIUS_KM:
+            return None, None, (jsonify({'error': f'radius_km must be between 0 and {MAX_RADIUS_KM}'}), 400)
+
+        if bbox:
+            bbox = tuple(_parse_floats(bbox, 4))
+            min_lat, min_lon, max_lat, max_lon = bbox
+            if min_lat > max_lat or min_lon > max_lon:
+                return None, None, (jsonify({'error': 'bbox must be min_lat,min_lon,max_lat,max_lon'}), 400)
+            radius_km = None  # the box is the filter, distances are only for ordering
+        if near:
+            try:
+                lat, lon = _parse_floats(near, 2)
+            except ValueError:
+                # Not coordinates, try it as a place name
+                point = geocoder.geocode(near)
+                if point is None:
+                    return None, None, (jsonify({'error': f'Unknown location: {near}'}), 400)
+                lat, lon = point
+        else:
+            lat, lon = (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+    except ValueError:
+        return None, None, (jsonify({'error': 'near must be lat,lon or a place name, bbox must be 4 numbers'}), 400)
+
+    # One row past the page tells whether there is a next one
+    wanted = _near_page() * POSTS_PER_PAGE + 1
+    search = RingSearch(lat, lon, wanted, radius_km=radius_km, bbox=bbox or None,
+                        first_ring_km=current_app.config.get('GEO_FIRST_RING_KM', 1.0))
+    return project_posts(Post.query, fields, extra=('id', 'latitude', 'longitude')), search, None
+
+
+def _near_page():
+    return max(request.args.get('page', 1, type=int) or 1, 1)
+
+
+def _get_posts_near(fields):
+    query, search, error = _near_query(fields)
+    if error:
+        return error
+    done = False
+    while not done:
+        box = search.box()
+        done = search.add(posts_in_bbox(query, *box).all() if box else [])
+    return _near_response(search, fields)
+
+
+def _near_response(search, fields):
+    """
+    A page of a finished RingSearch. The total is only known when the search
+    had to cover the whole radius or box, it is null otherwise.
+    """
+    ranked = search.ranked
+    page = _near_page()
+    start = (page - 1) * POSTS_PER_PAGE
+    ranked_page = ranked[start:start + POSTS_PER_PAGE]
+    posts = rows_to_dicts([row for _, row in ranked_page], fields)
+    for post, (distance, _) in zip(posts, ranked_page):
+        post['distance_km'] = round(distance, 3)
+
+    args = request.args.to_dict()
+    next_url = url_for('home_bp.get_paginated_posts', **dict(args, page=page + 1), _external=True) \
+        if start + POSTS_PER_PAGE < len(ranked) else None
+    prev_url = url_for('home_bp.get_paginated_posts', **dict(args, page=page - 1), _external=True) \
+        if page > 1 else None
+
     response = {
-        'posts': [post.to_dict() for post in posts],
+        'posts': posts,
         'pagination': {
-            'total': pagination.total,
-            'pages': pagination.pages,
+            'total': len(ranked) if search.complete else None,
+            'pages': math.ceil(len(ranked) / POSTS_PER_PAGE) if search.complete else None,
             'next': next_url,
             'prev': prev_url
         }
     }
+    return json_response(response, 200, _link_header(next_url, prev_url))
+
 
-    return jsonify(response), 200, headers
+def _popular_query(fields):
+    """
+    (query for the rows of one page, ranking of post ids, page, None) for
+    ?sort=popular&type=, or (None, None, None, error response) when invalid.
+    Reads the rankings as they are, refresh them first when due.
+    """
+    if request.args.get('sort') != 'popular':
+        return None, None, None, (jsonify({'error': 'sort must be popular'}), 400)
+    instrument_type = request.args.get('type') or None
+    if instrument_type and instrument_type not in INSTRUMENT_TYPES:
+        return None, None, None, (jsonify({'error': f'type must be one of: {", ".join(INSTRUMENT_TYPES)}'}), 400)
+
+    ranking = popular_posts.ranking(instrument_type)
+    page = max(request.args.get('page', 1, type=int) or 1, 1)
+    page_ids = ranking[(page - 1) * POSTS_PER_PAGE:page * POSTS_PER_PAGE]
+    query = project_posts(Post.query, fields, extra=('id',)).filter(Post.id.in_(page_ids))
+    return query, ranking, page, None
+
+
+def _get_popular_posts(fields):
+    if popular_posts.due():
+        popular_posts.refresh()
+    query, ranking, page, error = _popular_query(fields)
+    if error:
+        return error
+    return _popular_response(query.all(), ranking, page, fields)
+
+
+def _popular_response(rows, ranking, page, fields):
+    start = (page - 1) * POSTS_PER_PAGE
+    # Back in ranking order; a post deleted since the ranking was read is left out
+    by_id = {row.id: row for row in rows}
+    ranked_page = [by_id[post_id] for post_id in ranking[start:start + POSTS_PER_PAGE] if post_id in by_id]
+
+    args = request.args.to_dict()
+    next_url = url_for('home_bp.get_paginated_posts', **dict(args, page=page + 1), _external=True) \
+        if start + POSTS_PER_PAGE < len(ranking) else None
+    prev_url = url_for('home_bp.get_paginated_posts', **dict(args, page=page - 1), _external=True) \
+        if page > 1 else None
+
+    response = {
+        'posts': rows_to_dicts(ranked_page, fields),
+        'pagination': {
+            'total': len(ranking),
+            'pages': math.ceil(len(ranking) / POSTS_PER_PAGE),
+            'next': next_url,
+            'prev': prev_url
+        }
+    }
+    return json_response(response, 200, _link_header(next_url, prev_url))
 
 @home_bp.route("/posts/<string:post_id>", methods=["GET"])
 @token_required
+@view_counter.counted
+@response_cache.cached('posts')
 def get_single_post(post_id: str, user_id: str):
     try:
         post = Post.query.get(post_id)
@@ -115,25 +361,147 @@ def get_single_post(post_id: str, user_id: str):
 
 @home_bp.route("/category", methods=["GET"])
 @token_required
+@response_cache.cached('posts')
 def get_by_category(user_id=None):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
     instrument_type = request.args.get('type')
+    query = project_posts(Post.query, fields)
     if instrument_type:
-        posts = Post.query.filter_by(instrument_type=instrument_type).all()
-    else:
-        posts = Post.query.all()
-    return jsonify([post.to_dict() for post in posts])
+        query = query.filter_by(instrument_type=instrument_type)
+
+    # Accept: application/x-ndjson streams the rows instead of building one big list
+    if wants_ndjson():
+        return ndjson_response(query, fields) or ndjson_items_response([])
+
+    return json_response(rows_to_dicts(query.all(), fields))
+
+FILTER_PARAMS = {'type': 'instrument_type', 'status': 'status', 'availability': 'availability', 'brand': 'brand'}
+@home_bp.route("/filter", methods=["GET"])
+@token_required
+@response_cache.cached('posts')
+def filter_posts(user_id=None):
+    try:
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = []
+    for param, column in FILTER_PARAMS.items():
+        value = request.args.get(param)
+        if not value:
+            continue
+        enums = getattr(Post.__table__.c[column].type, 'enums', None)
+        if enums and value not in enums:
+            return jsonify({'error': f"Invalid {param}. Must be one of: {', '.join(enums)}"}), 400
+        conditions.append(getattr(Post, column) == value)
+
+    min_price = request.args.get('min_price', type=float)
+    max_price = request.args.get('max_price', type=float)
+    if min_price is not None:
+        conditions.append(Post.price >= min_price)
+    if max_price is not None:
+        conditions.append(Post.price <= max_price)
+
+    cursor = request.args.get('cursor') or None
+    query = project_posts(Post.query.filter(*conditions), fields, extra=KEYSET_COLUMNS)
+    try:
+        rows, next_cursor, prev_cursor = keyset_page(query, cursor=cursor, per_page=POSTS_PER_PAGE)
+    except InvalidCursor:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    # Keep the active filters in the next/prev links
+    filters = {key: value for key, value in request.args.items() if key != 'cursor'}
+    next_url = url_for('home_bp.filter_posts', cursor=next_cursor, _external=True, **filters) \
+        if next_cursor else None
+    prev_url = url_for('home_bp.filter_posts', cursor=prev_cursor, _external=True, **filters) \
+        if prev_cursor else None
+    headers = _link_header(next_url, prev_url)
+
+    response = {
+        'posts': rows_to_dicts(rows, fields),
+        'facets': get_facet_counts(*conditions),  # of the filtered posts, not only of this page
+        'pagination': {
+            'next_cursor': next_cursor,
+            'prev_cursor': prev_cursor,
+            'next': next_url,
+            'prev': prev_url
+        }
+    }
+
+    return json_response(response, 200, headers)
 
+SEARCH_RESULTS_PER_PAGE = 20
 @home_bp.route("/posts/search", methods=["GET"])
 def search_posts():
-    title = request.args.get('title', '').strip()  # Get the query parameter 'title'
-    
-    if not title:
+    # 'q' searches title, brand and description; 'title' is kept for older clients
+    query = request.args.get('q', request.args.get('title', '')).strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_RESULTS_PER_PAGE, type=int), 1), 100)
+
+    if not query:
         return jsonify({'error': 'Title query is required'}), 400
-    
-    posts = Post.query.filter(Post.title.ilike(f"%{title}%")).all()
-    
+
+    # Fetch one extra result to know whether a next page exists
+    posts = search_index.search(query, page=page, per_page=per_page + 1)
+    has_next = len(posts) > per_page
+    posts = posts[:per_page]
+
     if not posts:
         return jsonify({'message': 'No posts found'}), 404
-    
+
+    if wants_ndjson():
+        return ndjson_items_response([post.to_dict() for post in posts])
+
+    links = []
+    if has_next:
+        next_url = url_for('home_bp.search_posts', q=query, page=page + 1, per_page=per_page, _external=True)
+        links.append(f'<{next_url}>; rel="next"')
+    if page > 1:
+        prev_url = url_for('home_bp.search_posts', q=query, page=page - 1, per_page=per_page, _external=True)
+        links.append(f'<{prev_url}>; rel="prev"')
+
+    headers = {
+        'Link': ', '.join(links) if links else None
+    }
+
     posts_data = [post.to_dict() for post in posts]
-    return jsonify(posts_data), 200
\ No newline at end of file
+    return jsonify(posts_data), 200, headers
+
+CHANGES_PER_PAGE = 500
+@home_bp.route("/posts/changes", methods=["GET"])
+@token_required
+def get_post_changes(user_id):
+    """
+    Posts created, updated or deleted since a change token, oldest first.
+
+    Start without `since` for the whole catalogue, then pass the
+    `next_token` of each answer, even an empty one; `has_more` asks for
+    another page right away. Apply `posts` as upserts by id and drop the ids
+    in `deleted`. A token older than the tombstone retention is answered
+    410: sync from scratch.
+    """
+    try:
+        fields = parse_fields(request.args.get('fields'))
+        position = decode_token(request.args.get('since'))
+    except (InvalidFields, InvalidToken) as e:
+        return jsonify({'error': str(e)}), 400
+    limit = min(max(request.args.get('limit', CHANGES_PER_PAGE, type=int), 1), 1000)
+
+    config = current_app.config
+    if position != START and position[0] < tombstone_horizon(config.get('CHANGE_FEED_TOMBSTONE_DAYS', 30)):
+        return jsonify({'error': 'Change token expired, download the catalogue again.'}), 410
+
+    settled = time.time() - config.get('CHANGE_FEED_SETTLE_SECONDS', 5)
+    cutoff = datetime.fromtimestamp(settled, timezone.utc).replace(tzinfo=None)
+    g.db_fresh_after = settled  # a read replica must have replayed every change up to the cutoff
+    rows, deleted, position, has_more = changes_since(position, limit, fields, cutoff)
+    return json_response({
+        'posts': rows_to_dicts(rows, fields),
+        'deleted': deleted,
+        'next_token': encode_token(*position),
+        'has_more': has_more,
+    })
@@ -1,10 +1,24 @@
-from flask import Blueprint, jsonify, request
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime
+from types import SimpleNamespace
+from flask import Blueprint, current_app, jsonify, request
 from models.post import Post
 from models.user import User
+from models.availability_event import AvailabilityEvent
 from extensions import db
 from auth.authentication import token_required
-from routes.helper import validate_post_input
+from routes.helper import validate_post_input, post_input_errors
+from services.search import search_index
+from services.facets import facet_values, apply_facet_change, apply_facet_delta
+from services.changes import record_tombstones
+from services.response_cache import response_cache
+from services.geo import geocoder
+from sqlalchemy import bindparam, delete, insert, update
 from sqlalchemy.exc import SQLAlchemyError
+from services.availability import allowed, transition_update, rejection, record_transitions
+from services.concurrency import if_match_versions, precondition_failed_response, wants_representation, \
+    wants_minimal, PreconditionFailed
 
 
 posts_bp = Blueprint("posts_bp", __name__, url_prefix="/posts")
@@ -13,7 +27,10 @@ posts_bp = Blueprint("posts_bp", __name__, url_prefix="/posts")
 @posts_bp.route("/create", methods=["POST"])
 @token_required
 def create_post(user_id: str):
-    data = request.get_json()  # Get the incoming JSON data
+    data = request.get_json(silent=True)  # Get the incoming JSON data
+    validation_error = validate_post_input(data)
+    if validation_error:
+        return validation_error
     instrument_type = data.get('instrument_type')
     title = data.get('title')
     brand = data.get('brand')
@@ -29,10 +46,6 @@ def create_post(user_id: str):
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        validation_error = validate_post_input(title, description, price, status, image, instrument_type, brand, phone_number, location)
-        if validation_error:
-            return validation_error
-
 
         new_post = Post(
             user_id=user_id,
@@ -47,9 +60,15 @@ def create_post(user_id: str):
             status=status,
             location=location,
         )
+        for column, value in geocoder.coordinates(location).items():
+            setattr(new_post, column, value)
 
         db.session.add(new_post)
+        db.session.flush()  # assigns the id
+        apply_facet_change([], facet_values(new_post))
+        search_index.index_post(new_post)
         db.session.commit()
+        response_cache.bump('posts')
 
         return jsonify({"message": "Post created successfully", "post_id": new_post.id}), 201
 
@@ -61,7 +80,11 @@ def create_post(user_id: str):
 @posts_bp.route("/posts/<string:post_id>", methods=["PUT"])
 @token_required
 def update_post(user_id: str, post_id: str):
-    data = request.get_json()  # Get the incoming JSON data
+    data = request.get_json(silent=True)  # Get the incoming JSON data
+    # Only the fields sent are changed, and checked
+    validation_error = validate_post_input(data, partial=True)
+    if validation_error:
+        return validation_error
     instrument_type = data.get('instrument_type')
     title = data.get('title')
     brand = data.get('brand')
@@ -79,10 +102,7 @@ def update_post(user_id: str, post_id: str):
         if not post:
             return jsonify({"error": "Post not found"}), 404
 
-        validation_error = validate_post_input(title, description, price, status, image, instrument_type, brand, phone_number, location)
-        if validation_error:
-            return validation_error
-
+        facets_before = facet_values(post)
         if instrument_type:
             post.instrument_type = instrument_type
         if title:
@@ -99,10 +119,16 @@ def update_post(user_id: str, post_id: str):
             post.image = image
         if status:
             post.status = status
-        if location:
+        if location and location != post.location:
             post.location = location
+            for column, value in geocoder.coordinates(location).items():
+                setattr(post, column, value)
 
+        post.version += 1
+        apply_facet_change(facets_before, facet_values(post))
+        search_index.index_post(post)
         db.session.commit()
+        response_cache.bump('posts')
         return jsonify({"message": "Post updated successfully"}), 200
 
     except SQLAlchemyError as e:
@@ -119,7 +145,11 @@ def delete_post(user_id, post_id):
             return jsonify({'message': 'Post not found'}), 404
 
         db.session.delete(post)
+        apply_facet_change(facet_values(post), [])
+        record_tombstones(user_id, [post_id])
+        search_index.remove_post(post_id)
         db.session.commit()
+        response_cache.bump('posts')
         return jsonify({'message': 'Post deleted successfully.'}), 200
 
     except SQLAlchemyError as e:
@@ -128,74 +158,403 @@ def delete_post(user_id, post_id):
 
 
 
+# Columns a bulk create/update item may set, availability is managed by /status
+BULK_FIELDS = ('instrument_type', 'title', 'brand', 'price', 'description', 'phone_number', 'image', 'status', 'location')
+# PATCH may clear these with null, the others can only be replaced
+CLEARABLE_FIELDS = ('description', 'image')
+# Changing one of these moves the post between facet counters / search documents
+FACET_FIELDS = {'instrument_type', 'status', 'price'}
+SEARCH_FIELDS = {'title', 'brand', 'description'}
+
+
+def _bulk_item_error(item, partial=False):
+    """
+    (first message, {field: message}) of an invalid item, (None, None) for a valid one.
+    An update item (partial) is checked like a PATCH body: only the fields it sends besides its id.
+    """
+    if not isinstance(item, dict):
+        return "Item must be a JSON object.", {"item": "Item must be a JSON object."}
+    if not partial:
+        errors = post_input_errors(item)
+    else:
+        fields = {field: value for field, value in item.items() if field != 'id'}
+        if not fields:
+            return "Nothing to update.", None
+        errors = post_input_errors(fields, partial=True)
+        errors.update((field, "Unknown field.") for field in fields if field not in BULK_FIELDS)
+        errors.update((field, "Field cannot be null.") for field, value in fields.items()
+                      if value is None and field in BULK_FIELDS and field not in CLEARABLE_FIELDS)
+    return (next(iter(errors.values())), errors) if errors else (None, None)
+
+
+@posts_bp.route("/bulk", methods=["POST"])
+@token_required
+def bulk_posts(user_id: str):
+    """
+    Create, update and delete many posts in one transaction.
+
+    Body: {"create": [post, ...], "update": [{"id": ..., **fields}, ...], "delete": [id, ...]}.
+    An update sends only the fields it changes, like PATCH. Every item is
+    validated first; if any fails nothing is written and each error is returned
+    with its op and index. Otherwise the whole batch goes out as one multi-row
+    INSERT, one UPDATE executemany per set of updated fields and one DELETE ... IN.
+    Each UPDATE is pinned to the version read with the ownership check; when
+    another request changed a post in between, nothing is written and the
+    answer is 409 with the ids of the posts that moved.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object with create, update and/or delete lists."}), 400
+    creates = data.get('create') or []
+    updates = data.get('update') or []
+    deletes = data.get('delete') or []
+    if not all(isinstance(items, list) for items in (creates, updates, deletes)):
+        return jsonify({"error": "create, update and delete must be lists."}), 400
+
+    max_items = current_app.config.get('BULK_MAX_ITEMS', 1000)
+    if len(creates) + len(updates) + len(deletes) > max_items:
+        return jsonify({"error": f"A batch may hold at most {max_items} items."}), 413
+
+    try:
+        if not User.query.get(user_id):
+            return jsonify({"error": "User not found"}), 404
+
+        errors = []
+        for index, item in enumerate(creates):
+            error, fields = _bulk_item_error(item)
+            if error:
+                errors.append({"op": "create", "index": index, "error": error, "fields": fields})
+
+        # One query checks ownership of every targeted post and reads its current facets
+        targeted = [item.get('id') for item in updates if isinstance(item, dict)] + list(deletes)
+        owned = {}
+        if targeted:
+            rows = Post.query.with_entities(
+                Post.id, Post.instrument_type, Post.status, Post.availability, Post.price, Post.version
+            ).filter(Post.user_id == user_id, Post.id.in_([post_id for post_id in targeted if isinstance(post_id, str)]))
+            owned = {row.id: row._asdict() for row in rows}
+
+        seen = set()
+        for op, items in (("update", updates), ("delete", deletes)):
+            for index, item in enumerate(items):
+                post_id = item.get('id') if op == "update" and isinstance(item, dict) else item
+                error, fields = _bulk_item_error(item, partial=True) if op == "update" else (None, None)
+                if not error and not isinstance(post_id, str):
+                    error = "Post id must be a string."
+                elif not error and post_id not in owned:
+                    error = "Post not found"
+                elif not error and post_id in seen:
+                    error = "Post appears more than once in the batch."
+                if error:
+                    errors.append(dict({"op": op, "index": index, "error": error}, **({"fields": fields} if fields else {})))
+                else:
+                    seen.add(post_id)
+
+        if errors:
+            return jsonify({"error": "No posts were written.", "errors": errors}), 400
+
+        now = datetime.utcnow()
+        facet_delta = Counter()
+        created = []
+        for item in creates:
+            row = {field: item.get(field) for field in BULK_FIELDS}
+            row.update(id=str(uuid.uuid4()), user_id=user_id, price=float(row['price']),
+                       availability="available", created_at=now, updated_at=now, **geocoder.coordinates(row['location']))
+            created.append(row)
+            facet_delta.update(facet_values(row))
+
+        # An executemany needs the same columns in every row: one per set of fields sent
+        updated = defaultdict(list)
+        reindexed = []
+        for item in updates:
+            before = owned[item['id']]
+            values = {field: value for field, value in item.items() if field != 'id'}
+            if 'price' in values:
+                values['price'] = float(values['price'])
+            if 'location' in values:
+                values.update(geocoder.coordinates(values['location']))
+            updated[tuple(sorted(values))].append(dict(values, post_id=item['id'], expected_version=before['version']))
+            facet_delta.subtract(facet_values(before))
+            facet_delta.update(facet_values(dict(before, **values)))
+            if SEARCH_FIELDS & values.keys():
+                reindexed.append(item['id'])
+
+        for post_id in deletes:
+            facet_delta.subtract(facet_values(owned[post_id]))
+
+        if created:
+            db.session.execute(insert(Post), created)
+        posts = Post.__table__
+        written = 0
+        for rows in updated.values():
+            written += db.session.execute(
+                update(posts).where(posts.c.id == bindparam('post_id'), posts.c.user_id == user_id,
+                                    posts.c.version == bindparam('expected_version'))
+                .values(updated_at=now, version=posts.c.version + 1),
+                rows
+            ).rowcount
+        if written < len(updates):
+            db.session.rollback()
+            current = dict(db.session.query(Post.id, Post.version).filter(Post.id.in_(owned)))
+            moved = [item['id'] for item in updates if current.get(item['id']) != owned[item['id']]['version']]
+            return jsonify({"error": "Posts were changed by another request, fetch them and retry. No posts were written.",
+                            "conflicts": moved}), 409
+        if deletes:
+            db.session.execute(delete(Post).where(Post.user_id == user_id, Post.id.in_(deletes)))
+            record_tombstones(user_id, deletes, now)
+        apply_facet_delta(facet_delta)
+        search_index.index_posts([SimpleNamespace(**row) for row in created])
+        if reindexed and search_index.needs_documents:
+            search_index.index_posts(Post.query.filter(Post.id.in_(reindexed)).populate_existing().all())
+        search_index.remove_posts(deletes)
+        db.session.commit()
+        response_cache.bump('posts')
+
+        return jsonify({
+            "message": "Batch applied successfully",
+            "created": [row['id'] for row in created],
+            "updated": len(updated),
+            "deleted": len(deletes),
+        }), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+
+
+@posts_bp.route("/posts/<string:post_id>", methods=["PATCH"])
+@token_required
+def patch_post(user_id: str, post_id: str):
+    """
+    Partial update written as one UPDATE ... WHERE id AND user_id [AND version].
+
+    Only the fields sent are checked and written. With If-Match: "<version>"
+    the row must still have that version, otherwise 412 with the current one
+    as ETag. The response carries the new version (and ETag) when it is
+    known; Prefer: return=representation returns the whole post instead.
+    Changing a facet field reads the old values first, in the transaction, and
+    pins the UPDATE to the version read.
+    """
+    data = request.get_json(silent=True)
+    validation_error = validate_post_input(data, partial=True)
+    if validation_error:
+        return validation_error
+    unknown = sorted(set(data) - set(BULK_FIELDS))
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(BULK_FIELDS)}"}), 400
+    not_null = sorted(field for field, value in data.items() if value is None and field not in CLEARABLE_FIELDS)
+    if not_null:
+        return jsonify({"error": f"These fields cannot be null: {', '.join(not_null)}"}), 400
+    values = dict(data)
+    if not values:
+        return jsonify({"error": "Nothing to update."}), 400
+    if 'price' in values:
+        values['price'] = float(values['price'])
+    if 'location' in values:
+        values.update(geocoder.coordinates(values['location']))
+
+    try:
+        versions = if_match_versions()
+    except PreconditionFailed:
+        return precondition_failed_response()
+
+    try:
+        condition = [Post.id == post_id, Post.user_id == user_id]
+        before = None
+        if FACET_FIELDS & values.keys():
+            before = Post.query.with_entities(
+                Post.instrument_type, Post.status, Post.availability, Post.price, Post.version
+            ).filter(*condition).first()
+            if before is None:
+                return jsonify({"error": "Post not found"}), 404
+            if versions is not None and before.version not in versions:
+                return precondition_failed_response(before.version)
+            versions = {before.version}
+        if versions is not None:
+            condition.append(Post.version.in_(versions))
+
+        result = db.session.execute(
+            update(Post).where(*condition).values(**values, updated_at=datetime.utcnow(), version=Post.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            current = db.session.query(Post.version).filter(Post.id == post_id, Post.user_id == user_id).scalar()
+            if current is None:
+                return jsonify({"error": "Post not found"}), 404
+            return precondition_failed_response(current)
+        if before is not None:
+            apply_facet_change(facet_values(before), facet_values(dict(before._asdict(), **values)))
+        if SEARCH_FIELDS & values.keys() and search_index.needs_documents:
+            search_index.index_post(db.session.get(Post, post_id, populate_existing=True))
+        db.session.commit()
+
+        version = next(iter(versions)) + 1 if versions and len(versions) == 1 else None
+        post = Post.query.get(post_id) if wants_representation() else None
+        response_cache.bump('posts')
+
+        if wants_representation():
+            response = jsonify(post.to_dict())
+            response.set_etag(str(post.version))
+            return response
+        # The new version is only known without a read when If-Match named it
+        body = {"message": "Post updated successfully"}
+        if version is not None:
+            body["version"] = version
+        response = jsonify(body)
+        if version is not None:
+            response.set_etag(str(version))
+        return response
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
 VALID_AVAILABILITIES = ["sold", "rented", "available"]
-VALID_STATUSES = ["for sale", "for rental"]
+
+def _parse_availability(value):
+    """(availability, None) or (None, error message)"""
+    if value is None:
+        return None, "Availability is required."
+    availability = value.lower() if isinstance(value, str) else None
+    if availability not in VALID_AVAILABILITIES:
+        return None, f"Invalid availability. Must be one of: {', '.join(VALID_AVAILABILITIES)}"
+    return availability, None
+
 
 @posts_bp.route("/<string:post_id>/status", methods=["PATCH"])
 @token_required
 def mark_post_availability(user_id: str, post_id: str):
+    """
+    Move one post to another availability with a single conditional UPDATE,
+    see services/availability.py. When it matches no row, the post is read
+    to tell why: 404, 400 for a move the rules never allow, 409 when the
+    post is not (or no longer) in the state the move starts from.
+    The updated post is in the response unless the client sends
+    Prefer: return=minimal.
+    """
+    data = request.get_json(silent=True) or {}
+    availability, error = _parse_availability(data.get('availability'))
+    if error:
+        return jsonify({"error": error}), 400
+
     try:
-        # Get the JSON payload
-        data = request.get_json()
-        availability = data.get('availability')
-
-        # Validate that 'availability' is provided and not None
-        if availability is None:
-            return jsonify({"error": "Availability is required."}), 400
-
-        # Validate availability
-        availability = availability.lower()
-        if availability not in VALID_AVAILABILITIES:
-            return jsonify({
-                "error": f"Invalid availability. Must be one of: {', '.join(VALID_AVAILABILITIES)}"
-            }), 400
-
-        # Fetch the post
-        post = Post.query.filter_by(id=post_id, user_id=user_id).first()
-        if not post:
-            return jsonify({
-                "error": "Post not found."
-            }), 404
-
-        # Validate the post status
-        if post.status not in VALID_STATUSES:
-            return jsonify({
-                "error": "Invalid post status."
-            }), 400
-
-        # Handle availability transition based on status and current availability
-        if availability == "available":
-            if post.availability == "sold":
-                return jsonify({
-                    "error": "Cannot mark a sold item as available"
-                }), 400
-            
-        elif availability == "rented":
-            if post.status != "for rental":
-                return jsonify({
-                    "error": "Only posts with 'for rental' status can be marked as rented"
-                }), 400
-            if post.availability == "sold":
-                return jsonify({
-                    "error": "Cannot rent a sold item"
-                }), 400
-                
-        elif availability == "sold":
-            if post.status != "for sale":
-                return jsonify({
-                    "error": "Only posts with 'for sale' status can be marked as sold"
-                }), 400
-
-        # Update availability
-        post.availability = availability
+        now = datetime.utcnow()
+        result = db.session.execute(transition_update(user_id, [post_id], availability, now))
+        if result.rowcount == 0:
+            db.session.rollback()
+            post = Post.query.with_entities(Post.status, Post.availability) \
+                .filter_by(id=post_id, user_id=user_id).first()
+            if not post:
+                return jsonify({"error": "Post not found."}), 404
+            message, code = rejection(availability, post.status, post.availability)
+            return jsonify({"error": message}), code
+
+        record_transitions(user_id, [(post_id, availability)], now)
         db.session.commit()
-        
-        return jsonify({
-            "message": f"Post marked as {availability}",
-            "post": post.to_dict()
-        }), 200
+        response_cache.bump('posts')
+
+        body = {"message": f"Post marked as {availability}"}
+        if not wants_minimal():
+            body["post"] = Post.query.get(post_id).to_dict()
+        return jsonify(body), 200
 
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
+
+@posts_bp.route("/status", methods=["PATCH"])
+@token_required
+def mark_posts_availability(user_id: str):
+    """
+    Move many posts at once. Body: {"transitions": [{"id": ..., "availability": ...}, ...]}.
+
+    Each transition succeeds or fails on its own; the result lists every one
+    with either its new availability or an error and HTTP-like code. The
+    posts are read (and locked where the database supports it) in one query,
+    then each target availability is one conditional UPDATE over its ids.
+    """
+    data = request.get_json(silent=True)
+    transitions = data.get('transitions') if isinstance(data, dict) else None
+    if not isinstance(transitions, list) or not transitions:
+        return jsonify({"error": "Body must be {\"transitions\": [{\"id\": ..., \"availability\": ...}, ...]}."}), 400
+    max_items = current_app.config.get('BULK_MAX_ITEMS', 1000)
+    if len(transitions) > max_items:
+        return jsonify({"error": f"A batch may hold at most {max_items} items."}), 413
+
+    results = []
+    targets = {}  # post id -> availability
+    for item in transitions:
+        post_id = item.get('id') if isinstance(item, dict) else None
+        availability, error = _parse_availability(item.get('availability') if isinstance(item, dict) else None)
+        if not isinstance(post_id, str):
+            error = "Post id must be a string."
+        elif not error and post_id in targets:
+            error = "Post appears more than once in the batch."
+        results.append({"id": post_id, "error": error, "code": 400} if error else {"id": post_id})
+        if not error:
+            targets[post_id] = availability
+
+    try:
+        current = {}
+        if targets:
+            rows = Post.query.with_entities(Post.id, Post.status, Post.availability, Post.version) \
+                .filter(Post.user_id == user_id, Post.id.in_(list(targets))).with_for_update()
+            current = {row.id: row for row in rows}
+
+        groups = defaultdict(list)  # target -> ids the rules allow
+        for result in results:
+            if "error" in result:
+                continue
+            post_id = result["id"]
+            row, target = current.get(post_id), targets[post_id]
+            if row is None:
+                result.update(error="Post not found.", code=404)
+            elif not allowed(target, row.status, row.availability):
+                message, code = rejection(target, row.status, row.availability)
+                result.update(error=message, code=code)
+            else:
+                groups[target].append(post_id)
+
+        now = datetime.utcnow()
+        moves = []
+        for target, post_ids in groups.items():
+            moved = db.session.execute(transition_update(user_id, post_ids, target, now)).rowcount
+            if moved < len(post_ids):
+                # Another request moved some of them between the read and the UPDATE
+                # (databases without SELECT ... FOR UPDATE): ours are the ones one version up
+                after = db.session.query(Post.id, Post.availability, Post.version).filter(Post.id.in_(post_ids))
+                post_ids = [row.id for row in after
+                            if row.availability == target and row.version == current[row.id].version + 1]
+            moves.extend((post_id, target) for post_id in post_ids)
+
+        record_transitions(user_id, moves, now)
+        db.session.commit()
+        if moves:
+            response_cache.bump('posts')
+
+        moved_ids = {post_id for post_id, _ in moves}
+        for result in results:
+            if "error" in result:
+                continue
+            if result["id"] in moved_ids:
+                result["availability"] = targets[result["id"]]
+            else:
+                result.update(error="The post was changed by another request.", code=409)
+        return jsonify({"moved": len(moves), "failed": len(results) - len(moves), "results": results}), 200
+
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+@posts_bp.route("/<string:post_id>/status/events", methods=["GET"])
+@token_required
+def availability_events(user_id: str, post_id: str):
+    """Availability history of one of the caller's posts, oldest first"""
+    events = AvailabilityEvent.query.filter_by(post_id=post_id, user_id=user_id).order_by(AvailabilityEvent.id)
+    return jsonify([event.to_dict() for event in events]), 200
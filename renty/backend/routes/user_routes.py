@@ -1,25 +1,63 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, current_app, jsonify, request
+from collections import Counter
 from datetime import datetime
 from flask_jwt_extended import create_access_token
 from models.post import Post
 from models.user import User
 from extensions import db
 from auth.authentication import token_required
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import delete, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from auth.password_hasher import password_hasher
+from services.concurrency import if_match_versions, precondition_failed_response, wants_representation, \
+    PreconditionFailed
+from services.search import search_index
+from services.facets import facet_values, apply_facet_delta
+from services.background import background_jobs
+from services.changes import record_tombstones
+from services.media_store import media_store, HASHED_NAME_RE
+from routes.helper import URL_RE
+from auth.principal_cache import principal_cache
+from services.response_cache import response_cache
+from services.serialization import parse_fields, project_posts, rows_to_dicts, json_response, InvalidFields, \
+    wants_ndjson, ndjson_response
 
 
 users_bp = Blueprint("users_bp", __name__, url_prefix="/users")
 
 @users_bp.route('/user/posts', methods=["GET"])
 @token_required
+@response_cache.cached('posts', 'users', per_user=True)
 def get_user_posts(user_id: str):
     try:
-        user_posts = Post.query.filter_by(user_id=user_id).all()
+        fields = parse_fields(request.args.get('fields'))
+    except InvalidFields as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        query = project_posts(Post.query.filter_by(user_id=user_id), fields)
+        if wants_ndjson():
+            response = ndjson_response(query, fields)
+            if response is None:
+                return jsonify({'message': 'No posts found for this user.'}), 404
+            return response
+
+        user_posts = query.all()
         if not user_posts:
             return jsonify({'message': 'No posts found for this user.'}), 404
 
-        return jsonify([post.to_dict() for post in user_posts]), 200
+        return json_response(rows_to_dicts(user_posts, fields))
+
+    except SQLAlchemyError as e:
+        return jsonify({'error': str(e)}), 500
 
+@users_bp.route('/user/posts/views', methods=["GET"])
+@token_required
+def get_user_post_views(user_id: str):
+    # {post id: views} of the caller's posts, uncached: view flushes do not bump the response cache
+    try:
+        rows = db.session.query(Post.id, Post.view_count).filter(Post.user_id == user_id)
+        return json_response({post_id: view_count for post_id, view_count in rows})
     except SQLAlchemyError as e:
         return jsonify({'error': str(e)}), 500
 
@@ -31,7 +69,10 @@ def get_user_post(user_id: str, post_id: str):
         if not post:
             return jsonify({'message': 'Post not found.'}), 404
 
-        return jsonify(post.to_dict()), 200
+        # Not cached, so the owner sees the latest flushed view count
+        response = jsonify(dict(post.to_dict(), view_count=post.view_count))
+        response.set_etag(str(post.version))  # sent back in If-Match to PATCH the post
+        return response, 200
 
     except SQLAlchemyError as e:
         return jsonify({'error': str(e)}), 500
@@ -44,7 +85,9 @@ def get_user(user_id: str):
         if not user:
             return jsonify({'message': 'User not found.'}), 404
 
-        return jsonify(user.to_dict()), 200
+        response = jsonify(user.to_dict())
+        response.set_etag(str(user.version))  # sent back in If-Match to PATCH the profile
+        return response, 200
 
     except SQLAlchemyError as e:
         return jsonify({'error': str(e)}), 500
@@ -74,23 +117,147 @@ def update_user(user_id: str):  # Only accept user_id as a route parameter
             if image:
                 user.image = image
             user.updated_at = datetime.utcnow()  # Update the updated_at timestamp
+            user.version += 1
             db.session.commit()
+            principal_cache.invalidate(user_id)
+            response_cache.bump('users')
             return jsonify({'message': 'User updated successfully'}), 200
 
     except SQLAlchemyError as e:
         db.session.rollback()
         return jsonify({"error": str(e)}), 500
 
-@users_bp.route('/user/<string:user_id>', methods=['DELETE'])
+USER_PATCH_FIELDS = ('name', 'email', 'password', 'image')
+
+
+@users_bp.route('/user', methods=['PATCH'])
 @token_required
-def delete_user(user_id: str):
+def patch_user(user_id: str):
+    """
+    Partial profile update as one UPDATE ... WHERE id [AND version].
+
+    Same contract as PATCH /posts/posts/<id>: only the fields sent are
+    written, If-Match: "<version>" turns a concurrent edit into a 412, and
+    Prefer: return=representation returns the whole profile.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Body must be a JSON object."}), 400
+    unknown = sorted(set(data) - set(USER_PATCH_FIELDS))
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(USER_PATCH_FIELDS)}"}), 400
+    # Like PUT, empty values are ignored
+    values = {field: value for field, value in data.items() if value}
+    if not values:
+        return jsonify({"error": "Nothing to update."}), 400
+    if not all(isinstance(value, str) for value in values.values()):
+        return jsonify({"error": "Fields must be strings."}), 400
+    if 'password' in values:
+        values['password'] = password_hasher.hash(values['password'])
+
     try:
-        user = User.query.filter_by(id=user_id).first()
-        if not user:
+        versions = if_match_versions()
+    except PreconditionFailed:
+        return precondition_failed_response()
+
+    try:
+        condition = [User.id == user_id]
+        if versions is not None:
+            condition.append(User.version.in_(versions))
+        result = db.session.execute(
+            update(User).where(*condition).values(**values, updated_at=datetime.utcnow(), version=User.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            db.session.rollback()
+            current = db.session.query(User.version).filter(User.id == user_id).scalar()
+            if current is None:
+                return jsonify({"error": "User not found"}), 404
+            return precondition_failed_response(current)
+        db.session.commit()
+        principal_cache.invalidate(user_id)
+        response_cache.bump('users')
+
+        if wants_representation():
+            user = User.query.get(user_id)
+            response = jsonify(user.to_dict())
+            response.set_etag(str(user.version))
+            return response
+        version = next(iter(versions)) + 1 if versions and len(versions) == 1 else None
+        # The new version is only known without a read when If-Match named it
+        body = {'message': 'User updated successfully'}
+        if version is not None:
+            body['version'] = version
+        response = jsonify(body)
+        if version is not None:
+            response.set_etag(str(version))
+        return response
+
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': 'Email already registered'}), 409
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 500
+
+
+def purge_images(names):
+    """
+    Background job after an account deletion: delete the uploads among
+    `names` that no post or user refers to anymore. Uploads are shared by
+    content hash, so an image another account also posted is kept. Files
+    from before content hashing are left alone: their names came from the
+    client and may have been overwritten by another account's upload.
+    """
+    media_store.delete_unreferenced((name for name in names if HASHED_NAME_RE.match(name)), (Post.image, User.image))
+
+
+def remove_from_search(post_ids):
+    """Background job after a large account deletion: drop its posts from the search index"""
+    search_index.remove_posts(post_ids)
+    db.session.commit()
+
+
+@users_bp.route('/user/<string:account_id>', methods=['DELETE'])
+@token_required
+def delete_user(user_id: str, account_id: str):
+    # token_required passes the caller as user_id, users may only delete themselves
+    if account_id != user_id:
+        return jsonify({'message': 'You can only delete your own account.'}), 403
+
+    try:
+        # Locking the user row holds back new posts of this user (their FK check needs it) until the commit
+        user_image = db.session.execute(select(User.image).where(User.id == user_id).with_for_update()).first()
+        if user_image is None:
             return jsonify({'message': 'User not found.'}), 404
 
-        db.session.delete(user)
+        # Only what the counters and the cleanup need; the rows themselves go with ON DELETE CASCADE
+        posts = db.session.execute(
+            select(Post.id, Post.image, Post.instrument_type, Post.status, Post.availability, Post.price)
+            .where(Post.user_id == user_id)
+        ).mappings().all()
+        delta = Counter()
+        for post in posts:
+            delta.subtract(facet_values(dict(post)))
+        apply_facet_delta(delta)
+        record_tombstones(user_id, [post['id'] for post in posts])
+        db.session.execute(delete(User).where(User.id == user_id))
+        post_ids = [post['id'] for post in posts]
+        remove_later = len(post_ids) > current_app.config.get('ACCOUNT_DELETE_ASYNC_THRESHOLD', 500)
+        if not remove_later:
+            search_index.remove_posts(post_ids)
         db.session.commit()
+        principal_cache.invalidate(user_id)
+        response_cache.bump('posts', 'users')
+
+        images = {post['image'] for post in posts} | {user_image.image}
+        images = [name for name in images if name and not URL_RE.match(name)]
+        if images:
+            background_jobs.submit(purge_images, images)
+        if remove_later:
+            # The account is gone already, only its search entries are left to remove
+            background_jobs.submit(remove_from_search, post_ids)
+            return jsonify({'message': 'User deleted, their posts are being removed from search.'}), 202
         return jsonify({'message': 'User deleted successfully.'}), 200
 
     except SQLAlchemyError as e:
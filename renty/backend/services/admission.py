@@ -0,0 +1,275 @@
+"""
+Admission control for expensive endpoints, in front of the view functions.
+
+A request matching a rule of ADMISSION_LIMITS goes through two gates:
+
+- a token bucket per client (the user of a valid bearer token, else the
+  remote address, see TRUSTED_PROXIES): `rate` tokens per second up to `burst`, one per request;
+  an empty bucket is answered 429 with the seconds until the next token
+- a concurrency cap per worker process: at most `concurrency` requests of
+  the rule run at once, up to `queue` more wait `queue_timeout` seconds for
+  a slot, anything beyond is shed with 503 and `retry_after`
+
+Rules are keyed by blueprint ('home_bp') or endpoint ('home_bp.login_user');
+an endpoint rule replaces the rule of its blueprint. The buckets of a rule
+are shared by every endpoint it covers. Bucket storage:
+
+- 'memory': a dict in the worker, each worker counts on its own
+- 'sqlite': a SQLite file shared by every worker on the host
+- 'shm': a fixed-size hash table in a memory-mapped file under /dev/shm,
+  shared by every worker on the host
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import math
+import sqlite3
+import struct
+import threading
+import time
+from contextlib import closing
+from flask import g, jsonify, request
+from auth.authentication import AuthError, request_user_id
+from services.shared_memory import HostLock, map_file, shared_memory_path
+
+
+def _take(tokens, stamp, now, rate, burst):
+    """Token bucket step: (allowed, tokens left, seconds until the next token)"""
+    tokens = min(burst, tokens + max(now - stamp, 0) * rate)
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class InProcessBuckets:
+    name = 'memory'
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.lock = HostLock()
+        self._buckets = {}  # key -> (tokens, stamp, full again at)
+
+    def take(self, key, rate, burst, now):
+        with self.lock():
+            tokens, stamp, _ = self._buckets.get(key, (burst, now, now))
+            allowed, tokens, retry_after = _take(tokens, stamp, now, rate, burst)
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            if len(self._buckets) > self.capacity:
+                # A bucket that has refilled is the same as no bucket
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        return allowed, retry_after
+
+
+class SQLiteBuckets:
+    name = 'sqlite'
+
+    def __init__(self, path, capacity):
+        self.path = path
+        self.capacity = capacity
+        self.lock = HostLock(path + '.lock')
+        self._local = threading.local()
+        self._writes = 0
+        # Set up on a connection of its own, see SQLiteRevocationBackend
+        with self.lock(), closing(self._connect()) as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL, full_at REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS ix_rate_buckets_full_at ON rate_buckets (full_at)')
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')  # losing the last buckets in a crash is fine
+        return connection
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    def take(self, key, rate, burst, now):
+        connection = self._connection()
+        with self.lock():
+            row = connection.execute('SELECT tokens, stamp FROM rate_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, stamp = row if row else (burst, now)
+            allowed, tokens, retry_after = _take(tokens, stamp, now, rate, burst)
+            connection.execute('INSERT OR REPLACE INTO rate_buckets (key, tokens, stamp, full_at) VALUES (?, ?, ?, ?)',
+                               (key, tokens, now, now + (burst - tokens) / rate))
+            self._writes += 1
+            if self._writes >= self.capacity:
+                self._writes = 0
+                connection.execute('DELETE FROM rate_buckets WHERE full_at <= ?', (now,))
+        return allowed, retry_after
+
+
+class SharedMemoryBuckets:
+    """
+    Open-addressing hash table in a memory-mapped file under /dev/shm.
+
+    Slots are (64-bit key hash, tokens, stamp, full again at). A slot whose
+    bucket has refilled is free for any key. When the few slots a key may
+    probe are all busy the one closest to refilled is taken over, which only
+    ever gives its client a full bucket back: the table fails open.
+    """
+    name = 'shm'
+    SLOT = struct.Struct('<Qddd')
+    PROBES = 8
+
+    def __init__(self, name, capacity):
+        path = shared_memory_path(name)
+        self.slots = capacity * 2
+        self._buffer = map_file(path, self.slots * self.SLOT.size)
+        self.lock = HostLock(path + '.lock')
+
+    def take(self, key, rate, burst, now):
+        key = struct.unpack('<Q', hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest())[0] | 1
+        start = key % self.slots
+        with self.lock():
+            target, tokens, stamp, oldest = None, burst, now, None
+            for i in range(self.PROBES):
+                offset = (start + i) % self.slots * self.SLOT.size
+                slot_key, slot_tokens, slot_stamp, full_at = self.SLOT.unpack_from(self._buffer, offset)
+                if slot_key == key:
+                    target, tokens, stamp = offset, slot_tokens, slot_stamp
+                    break
+                if target is None and (slot_key == 0 or full_at <= now):
+                    target = offset
+                if slot_key == 0:  # never used, the key is not further along
+                    break
+                if oldest is None or full_at < oldest[1]:
+                    oldest = (offset, full_at)
+            if target is None:
+                target = oldest[0]
+            allowed, tokens, retry_after = _take(tokens, stamp, now, rate, burst)
+            self.SLOT.pack_into(self._buffer, target, key, tokens, now, now + (burst - tokens) / rate)
+        return allowed, retry_after
+
+
+class ConcurrencyGate:
+    """At most `limit` holders at once, `queue` more waiting up to `timeout` seconds"""
+
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Seconds waited for a slot, None when shed"""
+        with self._condition:
+            if self.running < self.limit:
+                self.running += 1
+                return 0.0
+            if self.waiting >= self.queue:
+                return None
+            self.waiting += 1
+            started = time.perf_counter()
+            try:
+                if not self._condition.wait_for(lambda: self.running < self.limit, self.timeout):
+                    return None
+            finally:
+                self.waiting -= 1
+            self.running += 1
+            return time.perf_counter() - started
+
+    def release(self):
+        with self._condition:
+            self.running -= 1
+            self._condition.notify()
+
+
+class Rule:
+    def __init__(self, name, rate=None, burst=None, concurrency=None, queue=0, queue_timeout=1.0, retry_after=1):
+        self.name = name
+        self.rate = rate
+        self.burst = burst or max(rate or 0, 1)
+        self.gate = ConcurrencyGate(concurrency, queue, queue_timeout) if concurrency else None
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    def __init__(self, app=None):
+        self.enabled = True
+        self.backend = None
+        self.rules = {}
+        self._by_endpoint = {}  # endpoint -> Rule or None, resolved on first request
+        # Called with (rule name, 'admitted' | 'rate_limited' | 'shed', seconds queued); see metrics
+        self.observers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ADMISSION_ENABLED', self.enabled)
+        kind = app.config.get('ADMISSION_BACKEND', 'memory')
+        capacity = app.config.get('ADMISSION_CAPACITY', 100000)
+        if kind == 'sqlite':
+            self.backend = SQLiteBuckets(app.config['ADMISSION_SQLITE_PATH'], capacity)
+        elif kind == 'shm':
+            self.backend = SharedMemoryBuckets(app.config['ADMISSION_SHM_NAME'], capacity)
+        else:
+            self.backend = InProcessBuckets(capacity)
+        self.rules = {name: Rule(name, **limits) for name, limits in app.config.get('ADMISSION_LIMITS', {}).items()}
+        self._by_endpoint = {}
+        app.extensions['admission_control'] = self
+        if self.enabled and self.rules:
+            app.before_request(self.admit)
+            app.teardown_request(self.release)
+
+    def rule_for(self, endpoint, blueprint):
+        if endpoint not in self._by_endpoint:
+            self._by_endpoint[endpoint] = self.rules.get(endpoint) or self.rules.get(blueprint)
+        return self._by_endpoint[endpoint]
+
+    @staticmethod
+    def client_key():
+        try:
+            return 'user:' + request_user_id()
+        except AuthError:
+            # The client's address when TRUSTED_PROXIES puts ProxyFix in front, else the last hop's
+            return 'ip:' + (request.remote_addr or '')
+
+    def admit(self):
+        if request.method == 'OPTIONS':  # CORS preflights cost nothing
+            return None
+        rule = self.rule_for(request.endpoint, request.blueprint)
+        if rule is None:
+            return None
+
+        if rule.rate:
+            allowed, retry_after = self.backend.take(f'{rule.name}|{self.client_key()}', rule.rate, rule.burst,
+                                                     time.time())
+            if not allowed:
+                self._notify(rule.name, 'rate_limited', 0.0)
+                return (jsonify({"error": "Too many requests, retry later"}), 429,
+                        {'Retry-After': str(max(math.ceil(retry_after), 1))})
+
+        if rule.gate:
+            waited = rule.gate.acquire()
+            if waited is None:
+                self._notify(rule.name, 'shed', 0.0)
+                return jsonify({"error": "Server is busy, please retry"}), 503, {'Retry-After': str(rule.retry_after)}
+            g.admission_gate = rule.gate
+            self._notify(rule.name, 'admitted', waited)
+        else:
+            self._notify(rule.name, 'admitted', 0.0)
+        return None
+
+    def release(self, exc=None):
+        gate = g.pop('admission_gate', None)
+        if gate is not None:
+            gate.release()
+
+    def _notify(self, rule, outcome, waited):
+        for observer in self.observers:
+            observer(rule, outcome, waited)
+
+    def status(self):
+        """Requests running and waiting per rule with a concurrency cap, in this worker"""
+        return {name: {"running": rule.gate.running, "waiting": rule.gate.waiting}
+                for name, rule in sorted(self.rules.items()) if rule.gate}
+
+
+admission = AdmissionControl()
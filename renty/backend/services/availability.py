@@ -0,0 +1,76 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import insert, update
+from extensions import db
+from models.post import Post
+from models.availability_event import AvailabilityEvent
+from services.facets import apply_facet_delta
+
+# Allowed moves: target availability -> (status the post must have, None for any, availability it must
+# have now). Every target has a single source, so a successful UPDATE tells what the post was before.
+# Going back to available only depends on the availability: a rented post whose status was edited since
+# must not be stuck.
+TRANSITIONS = {
+    "sold": ("for sale", "available"),
+    "rented": ("for rental", "available"),
+    "available": (None, "rented"),
+}
+
+
+def allowed(target, status, availability):
+    """Whether a post with this status and availability may move to target"""
+    required_status, source = TRANSITIONS[target]
+    return availability == source and required_status in (None, status)
+
+
+def transition_update(user_id, post_ids, target, now=None):
+    """
+    The compare-and-set UPDATE moving the caller's posts to `target`: the
+    rules are in its WHERE clause, so of two racing requests only one
+    matches. Its rowcount is the number of posts moved.
+    """
+    status, source = TRANSITIONS[target]
+    conditions = [Post.user_id == user_id, Post.id.in_(post_ids), Post.availability == source]
+    if status is not None:
+        conditions.append(Post.status == status)
+    return (
+        update(Post)
+        .where(*conditions)
+        .values(availability=target, version=Post.version + 1, updated_at=now or datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+
+def rejection(target, status, availability):
+    """(message, HTTP status) explaining why a post with this status and availability cannot move to target"""
+    if target == "available" and availability == "sold":
+        return "Cannot mark a sold item as available", 400
+    if target == "rented" and status != "for rental":
+        return "Only posts with 'for rental' status can be marked as rented", 400
+    if target == "rented" and availability == "sold":
+        return "Cannot rent a sold item", 400
+    if target == "sold" and status != "for sale":
+        return "Only posts with 'for sale' status can be marked as sold", 400
+    if availability == target:
+        return f"Post is already {target}.", 409
+    return f"Post cannot go from {availability} to {target}.", 409
+
+
+def record_transitions(user_id, moves, now=None):
+    """Count and log moved posts, moves are (post_id, target) pairs; part of the caller's transaction"""
+    if not moves:
+        return
+    now = now or datetime.utcnow()
+    delta = Counter()
+    for _, target in moves:
+        delta[("availability", TRANSITIONS[target][1])] -= 1
+        delta[("availability", target)] += 1
+    apply_facet_delta(delta)
+    db.session.execute(insert(AvailabilityEvent), [
+        {"post_id": post_id, "user_id": user_id, "from_availability": TRANSITIONS[target][1],
+         "to_availability": target, "created_at": now}
+        for post_id, target in moves
+    ])
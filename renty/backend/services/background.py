@@ -0,0 +1,63 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundJobs:
+    """
+    Work a request hands off instead of doing before it answers, e.g. the
+    file cleanup after an account deletion.
+
+    Jobs run on a small thread pool of the worker process, each inside an
+    app context with its own database session. They are not persisted: a
+    job still queued when the process exits is lost, so only work that can
+    be redone or safely skipped belongs here. With BACKGROUND_WORKERS = 0
+    jobs run inline, which keeps tests deterministic.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.workers = 2
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config.get('BACKGROUND_WORKERS', self.workers)
+        app.extensions['background_jobs'] = self
+
+    def submit(self, fn, *args):
+        """Run fn(*args) after the current request, errors are logged"""
+        if not self.workers:
+            self._run(fn, args)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='background')
+        self._executor.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        with self.app.app_context():
+            try:
+                fn(*args)
+            except Exception:
+                db.session.rollback()
+                logger.exception('Background job %s failed', getattr(fn, '__name__', fn))
+
+    def wait(self):
+        """Block until queued jobs are done (tests, benchmarks and shutdown)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+background_jobs = BackgroundJobs()
@@ -0,0 +1,100 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import base64
+import heapq
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import insert, tuple_
+from extensions import db
+from models.post import Post
+from models.tombstone import PostTombstone
+
+# Change feed of the catalogue for clients keeping a local copy.
+#
+# Every post carries its last change in updated_at and every deleted post
+# leaves a tombstone; both are read in (time, id) order, so a token is the
+# position of the last change a client has applied. Changes younger than
+# CHANGE_FEED_SETTLE_SECONDS are held back: a transaction stamps its rows
+# before it commits, and a row stamped earlier but committed later than one
+# already handed out would otherwise be skipped for good. Once a client has
+# every change up to the cutoff its token moves to the cutoff itself, so a
+# client polling a quiet catalogue keeps a token younger than the tombstones.
+
+START = (datetime.min, "")
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+def encode_token(changed_at, post_id):
+    payload = json.dumps([changed_at.isoformat(), post_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    """(time, post id) of a token from encode_token(), the start of the feed for None"""
+    if not token:
+        return START
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        changed_at, post_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(changed_at), str(post_id)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidToken("Invalid change token") from e
+
+
+def record_tombstones(user_id, post_ids, now=None):
+    """Leave a tombstone per deleted post; part of the caller's transaction"""
+    if not post_ids:
+        return
+    now = now or datetime.utcnow()
+    db.session.execute(insert(PostTombstone), [
+        {"post_id": post_id, "user_id": user_id, "deleted_at": now} for post_id in post_ids
+    ])
+
+
+def changes_since(position, limit, fields, cutoff):
+    """
+    Up to `limit` changes after `position` and no later than `cutoff`, oldest
+    first: (post rows projected on `fields`, deleted post ids, position to
+    resume from, whether more changes are ready). With nothing more ready
+    the position is the cutoff, or the last change when stamped at it.
+    """
+    # Two seeks on (updated_at, id) and (deleted_at, post_id), merged in memory
+    columns = tuple(dict.fromkeys(fields + ('updated_at', 'id')))
+    posts = db.session.query(*(getattr(Post, field) for field in columns)) \
+        .filter(tuple_(Post.updated_at, Post.id) > tuple_(*position), Post.updated_at <= cutoff) \
+        .order_by(Post.updated_at, Post.id).limit(limit + 1).all()
+    tombstones = db.session.query(PostTombstone.deleted_at, PostTombstone.post_id) \
+        .filter(tuple_(PostTombstone.deleted_at, PostTombstone.post_id) > tuple_(*position),
+                PostTombstone.deleted_at <= cutoff) \
+        .order_by(PostTombstone.deleted_at, PostTombstone.post_id).limit(limit + 1).all()
+
+    merged = heapq.merge(((row.updated_at, row.id, row) for row in posts),
+                         ((row.deleted_at, row.post_id, None) for row in tombstones),
+                         key=lambda change: change[:2])
+    changed, deleted = [], []
+    for count, (changed_at, post_id, row) in enumerate(merged):
+        if count == limit:
+            return changed, deleted, position, True
+        if row is None:
+            deleted.append(post_id)
+        else:
+            changed.append(row)
+        position = (changed_at, post_id)
+    # Every change up to the cutoff is in hand; one stamped at the cutoff itself keeps its id in the position
+    return changed, deleted, max(position, (cutoff, "")), False
+
+
+def tombstone_horizon(days):
+    """Tombstones older than this are pruned, a token from before it may have missed deletions"""
+    return datetime.utcnow() - timedelta(days=days)
+
+
+def prune_tombstones(days):
+    deleted = PostTombstone.query.filter(PostTombstone.deleted_at < tombstone_horizon(days)) \
+        .delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
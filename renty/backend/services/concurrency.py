@@ -0,0 +1,46 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+from flask import jsonify, request
+
+
+# Optimistic concurrency for PATCH: the ETag of a post or user is its version
+# column, quoted. A client sends it back in If-Match; the UPDATE only applies
+# while the row still has that version, otherwise the answer is 412.
+
+
+class PreconditionFailed(Exception):
+    pass
+
+
+def if_match_versions():
+    """
+    Versions the request allows from If-Match: None without the header or
+    with *, else a set of ints. Raises PreconditionFailed when it names no
+    version at all (weak tags never match).
+    """
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    versions = {int(tag) for tag in if_match.as_set() if tag.isdigit()}
+    if not versions:
+        raise PreconditionFailed()
+    return versions
+
+
+def precondition_failed_response(current_version=None):
+    response = jsonify({"error": "The resource was changed by another request, fetch it and retry."})
+    response.status_code = 412
+    if current_version is not None:
+        response.set_etag(str(current_version))
+    return response
+
+
+def wants_representation():
+    """Prefer: return=representation asks for the updated object in the response (RFC 7240)"""
+    return "return=representation" in request.headers.get("Prefer", "")
+
+
+def wants_minimal():
+    """Prefer: return=minimal asks to leave the updated object out of the response (RFC 7240)"""
+    return "return=minimal" in request.headers.get("Prefer", "")
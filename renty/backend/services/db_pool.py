@@ -0,0 +1,88 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from flask_sqlalchemy.session import Session
+
+
+class _TimedCheckout:
+    """
+    Times every checkout: how long the caller waited for a free connection,
+    or to open a new one. Each observer is called with (engine label, seconds,
+    timed out). engine.dispose() recreates the pool with the same class, so
+    the timing survives the dispose done after a fork.
+    """
+    engine_label = "default"
+    observers = []
+
+    def _do_get(self):
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except PoolTimeout:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            for observer in self.observers:
+                observer(self.engine_label, waited, timed_out)
+
+
+class MeteredQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+def pool_status(pool):
+    """Connections of a queue pool: size, checked out, overflow and saturation, None for other pools"""
+    if not isinstance(pool, QueuePool):
+        return None
+    checked_out = pool.checkedout()
+    limit = pool.size() + pool._max_overflow if pool._max_overflow >= 0 else None
+    return {
+        "size": pool.size(),
+        "checked_out": checked_out,
+        "idle": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        # Share of the connections this worker may open that are in use; at 1 requests queue
+        "saturation": checked_out / limit if limit else 0.0,
+    }
+
+
+def enforce_sqlite_foreign_keys(engine):
+    """
+    SQLite ignores foreign keys, ON DELETE CASCADE included, unless every
+    connection turns them on. No-op for other databases.
+    """
+    if engine.dialect.name != "sqlite" or event.contains(engine, "connect", _sqlite_foreign_keys_on):
+        return
+    event.listen(engine, "connect", _sqlite_foreign_keys_on)
+
+
+def _sqlite_foreign_keys_on(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+class RoutingSession(Session):
+    """
+    Session asking `router` (see services/replicas.py) for the engine of
+    each statement before the usual bind lookup. The router returns a
+    replica engine for reads it may serve there, None for the primary.
+    """
+    router = None
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.router is not None:
+            engine = self.router.read_engine(clause, self._flushing)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
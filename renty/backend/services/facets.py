@@ -0,0 +1,130 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+from collections import Counter
+from sqlalchemy import and_, case, update
+from extensions import db
+from models.post import Post
+from models.facet import PostFacetCount
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ("0-50", 0, 50),
+    ("50-100", 50, 100),
+    ("100-250", 100, 250),
+    ("250-500", 250, 500),
+    ("500-1000", 500, 1000),
+    ("1000+", 1000, None),
+]
+
+ENUM_FACETS = ("instrument_type", "status", "availability")
+
+
+def price_bucket(price):
+    try:
+        price = float(price)
+    except (ValueError, TypeError):
+        return None
+    for label, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return label
+    return None
+
+
+def facet_values(post):
+    """The (facet, value) pairs a post (model or column dict) is counted under, None for no post"""
+    if post is None:
+        return []
+    get = post.get if isinstance(post, dict) else lambda name: getattr(post, name)
+    values = [(facet, get(facet)) for facet in ENUM_FACETS]
+    values.append(("price_bucket", price_bucket(get("price"))))
+    return [(facet, value) for facet, value in values if value is not None]
+
+
+def apply_facet_change(before, after):
+    """
+    Adjust the counters for a post going from `before` to `after`.
+
+    Both are lists from facet_values(); pass [] for a create or a delete.
+    The UPDATEs join the caller's transaction, so the counters commit or roll
+    back together with the post itself.
+    """
+    delta = Counter(after)
+    delta.subtract(before)
+    apply_facet_delta(delta)
+
+
+def apply_facet_delta(delta):
+    """Apply a Counter of (facet, value) -> change, e.g. summed over a whole batch"""
+    for (facet, value), change in delta.items():
+        if not change:
+            continue
+        result = db.session.execute(
+            update(PostFacetCount)
+            .where(PostFacetCount.facet == facet, PostFacetCount.value == value)
+            .values(count=PostFacetCount.count + change)
+        )
+        if result.rowcount == 0:
+            db.session.add(PostFacetCount(facet=facet, value=value, count=max(change, 0)))
+
+
+def rebuild_facet_counts():
+    """Recount every facet from the posts table, used to backfill the counters"""
+    PostFacetCount.query.delete()
+    counts = Counter()
+    # Seed every known value so later writes only ever need an UPDATE
+    for facet in ENUM_FACETS:
+        for value in getattr(Post, facet).type.enums:
+            counts[(facet, value)] += 0
+    for label, _, _ in PRICE_BUCKETS:
+        counts[("price_bucket", label)] += 0
+
+    for facet in ENUM_FACETS:
+        column = getattr(Post, facet)
+        for value, count in db.session.query(column, db.func.count()).group_by(column):
+            counts[(facet, value)] += count
+    for (price, count) in db.session.query(Post.price, db.func.count()).group_by(Post.price):
+        label = price_bucket(price)
+        if label:
+            counts[("price_bucket", label)] += count
+
+    db.session.add_all(PostFacetCount(facet=facet, value=value, count=count)
+                       for (facet, value), count in counts.items())
+    db.session.commit()
+
+
+def ensure_facet_counts():
+    """Backfill the counters once when they have never been built for this database"""
+    if PostFacetCount.query.first() is None:
+        rebuild_facet_counts()
+
+
+def price_bucket_column():
+    """price_bucket() as SQL"""
+    return case(*((and_(Post.price >= low, Post.price < high) if high is not None else Post.price >= low, label)
+                  for label, low, high in PRICE_BUCKETS))
+
+
+def get_facet_counts(*conditions):
+    """
+    Counts grouped by facet, e.g. {'instrument_type': {'Guitar': 12, ...}, ...}
+
+    Without conditions, of the whole catalogue, read from the counters. With
+    conditions, of the posts matching them: one GROUP BY over the facet
+    columns, at most a few hundred groups, summed per facet here.
+    """
+    if not conditions:
+        facets = {facet: {} for facet in ENUM_FACETS + ("price_bucket",)}
+        for row in PostFacetCount.query.all():
+            facets.setdefault(row.facet, {})[row.value] = row.count
+        return facets
+
+    facets = {facet: dict.fromkeys(getattr(Post, facet).type.enums, 0) for facet in ENUM_FACETS}
+    facets["price_bucket"] = dict.fromkeys((label for label, _, _ in PRICE_BUCKETS), 0)
+    columns = [getattr(Post, facet) for facet in ENUM_FACETS] + [price_bucket_column()]
+    groups = db.session.query(*columns, db.func.count()).filter(*conditions).group_by(*columns)
+    for *values, count in groups:
+        for facet, value in zip(ENUM_FACETS + ("price_bucket",), values):
+            if value is not None:
+                facets[facet][value] += count
+    return facets
@@ -0,0 +1,305 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import csv
+import logging
+import math
+import threading
+import unicodedata
+from sqlalchemy import and_, or_
+from werkzeug.utils import import_string
+from models.post import Post
+
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # stored precision, cells of about 5 x 5 m
+MAX_COVER_CELLS = 36  # geohash ranges a single spatial query may scan
+
+logger = logging.getLogger(__name__)
+
+# Offline stand-in for a real geocoder: the main Tunisian cities
+GAZETTEER = {
+    "tunis": (36.8065, 10.1815),
+    "ariana": (36.8625, 10.1956),
+    "ben arous": (36.7531, 10.2189),
+    "manouba": (36.8081, 10.0972),
+    "la marsa": (36.8782, 10.3247),
+    "carthage": (36.8529, 10.3233),
+    "nabeul": (36.4561, 10.7376),
+    "hammamet": (36.4000, 10.6167),
+    "bizerte": (37.2744, 9.8739),
+    "beja": (36.7256, 9.1817),
+    "jendouba": (36.5011, 8.7803),
+    "le kef": (36.1822, 8.7148),
+    "siliana": (36.0849, 9.3708),
+    "zaghouan": (36.4029, 10.1429),
+    "sousse": (35.8256, 10.6084),
+    "monastir": (35.7643, 10.8113),
+    "mahdia": (35.5047, 11.0622),
+    "kairouan": (35.6781, 10.0963),
+    "kasserine": (35.1676, 8.8365),
+    "sidi bouzid": (35.0382, 9.4849),
+    "sfax": (34.7406, 10.7603),
+    "gafsa": (34.4250, 8.7842),
+    "tozeur": (33.9197, 8.1335),
+    "kebili": (33.7044, 8.9690),
+    "gabes": (33.8815, 10.0982),
+    "medenine": (33.3549, 10.5055),
+    "djerba": (33.8076, 10.8451),
+    "tataouine": (32.9297, 10.4518),
+}
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Base32 geohash of a point; nearby points share a prefix"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (span[0] + span[1]) / 2
+        ch <<= 1
+        if value >= mid:
+            ch |= 1
+            span[0] = mid
+        else:
+            span[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """(lat degrees, lon degrees) spanned by a geohash cell of that length"""
+    lon_bits = (precision * 5 + 1) // 2
+    lat_bits = precision * 5 // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Geohash prefixes whose cells together cover a bounding box.
+
+    Picks the longest prefix for which the box spans at most `max_cells`
+    cells, so a query scans a few index ranges sized to the box rather than
+    to the whole table. Boxes crossing the antimeridian are clamped.
+    """
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        lat_step, lon_step = cell_size(precision)
+        rows = math.floor(max_lat / lat_step) - math.floor(min_lat / lat_step) + 1
+        cols = math.floor(max_lon / lon_step) - math.floor(min_lon / lon_step) + 1
+        if rows * cols <= max_cells:
+            break
+    cells = set()
+    for row in range(rows):
+        for col in range(cols):
+            lat = min(min_lat + row * lat_step, max_lat)
+            lon = min(min_lon + col * lon_step, max_lon)
+            cells.add(geohash_encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def radius_bbox(lat, lon, radius_km):
+    """Bounding box (min_lat, min_lon, max_lat, max_lon) of a circle"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def _normalize(place):
+    place = unicodedata.normalize("NFKD", place).encode("ascii", "ignore").decode()
+    return " ".join(place.lower().replace("-", " ").split())
+
+
+class GazetteerGeocoder:
+    """
+    Offline geocoder matching place names against a fixed table.
+
+    The location text is matched whole first, then on its comma separated
+    parts from the most specific, so "Rue de Marseille, Tunis" finds Tunis.
+    A CSV of name,latitude,longitude rows can extend the built-in table; a
+    header line is skipped, and so are rows that are not a place (logged).
+    """
+
+    def __init__(self, path=None):
+        self.places = dict(GAZETTEER)
+        if path:
+            with open(path, newline="", encoding="utf-8") as f:
+                for line, row in enumerate(csv.reader(f), 1):
+                    place = self._parse_row(row)
+                    if place:
+                        self.places[place[0]] = place[1]
+                    elif row and line > 1:
+                        logger.warning("Skipping gazetteer row %d of %s: %r", line, path, row)
+
+    @staticmethod
+    def _parse_row(row):
+        """(normalized name, (lat, lon)) of a name,latitude,longitude row, None when it is not one"""
+        if len(row) != 3 or not row[0].strip():
+            return None
+        try:
+            lat, lon = float(row[1]), float(row[2])
+        except ValueError:
+            return None
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return None
+        return _normalize(row[0]), (lat, lon)
+
+    def geocode(self, location):
+        candidates = [location] + [part for part in reversed(location.split(","))]
+        for candidate in candidates:
+            point = self.places.get(_normalize(candidate))
+            if point:
+                return point
+        return None
+
+
+class Geocoder:
+    """
+    Turns the free-text Post.location into coordinates.
+
+    GEOCODER picks the implementation: 'gazetteer' (offline, default), 'none',
+    or the import path of a class with a geocode(location) -> (lat, lon) or
+    None method, e.g. a wrapper around an online geocoding API. Answers are
+    memoized per worker, listings repeat the same few city names.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.cache_size = 10000
+        self._cache = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        choice = app.config.get("GEOCODER", "gazetteer")
+        if choice == "gazetteer":
+            self.backend = GazetteerGeocoder(app.config.get("GEOCODER_GAZETTEER_PATH"))
+        elif choice in (None, "none"):
+            self.backend = None
+        else:
+            self.backend = import_string(choice)()
+        self.cache_size = app.config.get("GEOCODER_CACHE_SIZE", self.cache_size)
+        self._cache = {}
+        app.extensions["geocoder"] = self
+
+    def geocode(self, location):
+        """(latitude, longitude) of a location string, None when unknown"""
+        if not location or self.backend is None:
+            return None
+        key = _normalize(location)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+        point = self.backend.geocode(location)
+        with self._lock:
+            if len(self._cache) >= self.cache_size:
+                self._cache.clear()
+            self._cache[key] = point
+        return point
+
+    def coordinates(self, location):
+        """latitude/longitude/geohash column values for a location, all None when unknown"""
+        point = self.geocode(location)
+        if point is None:
+            return {"latitude": None, "longitude": None, "geohash": None}
+        lat, lon = point
+        return {"latitude": lat, "longitude": lon, "geohash": geohash_encode(lat, lon)}
+
+
+def within_cells(column, cells):
+    """SQL condition matching any of the geohash prefixes, one index range each"""
+    # '~' sorts after every geohash character under a binary collation, so [cell, cell~)
+    # is the prefix range; Post.geohash is declared ascii_bin on MySQL for that reason
+    return or_(*(and_(column >= cell, column < cell + "~") for cell in cells))
+
+
+def posts_in_bbox(query, min_lat, min_lon, max_lat, max_lon):
+    """Narrow a Post query to a bounding box, through the geohash index"""
+    return query.filter(
+        within_cells(Post.geohash, cover(min_lat, min_lon, max_lat, max_lon)),
+        Post.latitude.between(min_lat, max_lat),
+        Post.longitude.between(min_lon, max_lon),
+    )
+
+
+def sort_by_distance(rows, lat, lon, radius_km=None):
+    """
+    (distance_km, row) pairs nearest first, dropping rows beyond radius_km.
+
+    Rows need latitude and longitude columns; only the candidates left by
+    posts_in_bbox() are measured, not the whole table.
+    """
+    measured = ((haversine_km(lat, lon, row.latitude, row.longitude), row) for row in rows)
+    if radius_km is not None:
+        measured = (pair for pair in measured if pair[0] <= radius_km)
+    return sorted(measured, key=lambda pair: (pair[0], pair[1].id))
+
+
+class RingSearch:
+    """
+    The `wanted` posts nearest to a point, searched ring by ring.
+
+    A round fetches the posts of box() and hands them to add(). The radius
+    starts at first_ring_km and doubles until `wanted` posts lie within it or
+    the whole search area (radius_km, or the bbox) is covered, so a dense
+    city only loads the rows near the point instead of every post within the
+    radius. Rows beyond the current ring are dropped, which keeps each
+    round's ranking exact.
+    """
+
+    def __init__(self, lat, lon, wanted, radius_km=None, bbox=None, first_ring_km=1.0):
+        self.lat, self.lon = lat, lon
+        self.wanted = wanted
+        self.radius_km = radius_km
+        self.bbox = bbox
+        if radius_km is None:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            radius_km = max(haversine_km(lat, lon, corner_lat, corner_lon)
+                            for corner_lat in (min_lat, max_lat) for corner_lon in (min_lon, max_lon))
+        self.limit_km = radius_km
+        self.ring_km = min(first_ring_km, radius_km)
+        self.ranked = []
+        self.complete = False  # the whole area was searched, ranked holds every match
+
+    def _last_round(self):
+        return self.ring_km >= self.limit_km
+
+    def box(self):
+        """(min_lat, min_lon, max_lat, max_lon) to fetch this round, None when it holds nothing"""
+        if self.bbox is None:
+            return radius_bbox(self.lat, self.lon, self.ring_km)
+        if self._last_round():
+            return self.bbox
+        ring = radius_bbox(self.lat, self.lon, self.ring_km)
+        box = (max(ring[0], self.bbox[0]), max(ring[1], self.bbox[1]),
+               min(ring[2], self.bbox[2]), min(ring[3], self.bbox[3]))
+        return box if box[0] <= box[2] and box[1] <= box[3] else None
+
+    def add(self, rows):
+        """Rank the rows of box(), True when the search is done"""
+        last = self._last_round()
+        # The last round over a bbox keeps all of it, corners included
+        radius = None if last and self.radius_km is None else self.ring_km
+        self.ranked = sort_by_distance(rows, self.lat, self.lon, radius)
+        self.complete = last
+        if last or len(self.ranked) >= self.wanted:
+            return True
+        self.ring_km = min(self.ring_km * 2, self.limit_km)
+        return False
+
+
+geocoder = Geocoder()
@@ -0,0 +1,291 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import logging
+import mimetypes
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app, request, send_file
+from sqlalchemy import delete, exists, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.upload import UploadedImage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # optional, uploads are stored without resized variants
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Content addressed names: sha256 of the original bytes, plus a variant suffix
+HASHED_NAME_RE = re.compile(r'^([0-9a-f]{64})(_thumb|_medium)?\.(png|jpg|jpeg|webp)$')
+
+# variant -> (name suffix, config key of its longest side in pixels, Pillow format)
+VARIANTS = {
+    'thumbnail': ('_thumb.jpg', 'MEDIA_THUMBNAIL_SIZE', 'JPEG'),
+    'medium': ('_medium.jpg', 'MEDIA_MEDIUM_SIZE', 'JPEG'),
+    'webp': ('.webp', 'MEDIA_MEDIUM_SIZE', 'WEBP'),
+}
+
+# A hashed name never changes content, so browsers may keep it forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class MediaStore:
+    """
+    Content addressed storage for uploaded images.
+
+    Files are named after the sha256 of their bytes, so uploading the same
+    image twice stores it once, and kept in two levels of sharded directories
+    (ab/cd/abcd...) instead of one flat folder. Resized variants are rendered
+    by a background thread pool after the upload has been answered.
+    Files uploaded before this store existed keep their flat location.
+
+    is_uploaded() answers from a registry of stored names rather than the
+    filesystem: every save is recorded in the uploaded_images table, shared
+    by every worker and read by primary key on every check, so a name purged
+    through one worker is gone for all of them.
+    Files stored before the registry are recorded by `flask register-uploads`,
+    or on startup when the app creates its own tables.
+    """
+
+    def __init__(self, app=None):
+        self.root = 'static/uploads'
+        self.sizes = {'MEDIA_THUMBNAIL_SIZE': 200, 'MEDIA_MEDIUM_SIZE': 800}
+        self.workers = 2
+        self.serve_mode = 'direct'
+        self.accel_prefix = '/protected-uploads/'
+        self.legacy_max_age = 3600
+        self._executor = None
+        self._lock = threading.Lock()
+        self._pending = set()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Relative to the backend folder, wherever the server is started from
+        self.root = os.path.join(app.root_path, app.config.get('UPLOAD_FOLDER', self.root))
+        self.workers = app.config.get('MEDIA_WORKERS', self.workers)
+        for key in self.sizes:
+            self.sizes[key] = app.config.get(key, self.sizes[key])
+        self.serve_mode = app.config.get('MEDIA_SERVE_MODE', self.serve_mode)
+        self.accel_prefix = app.config.get('MEDIA_ACCEL_REDIRECT_PREFIX', self.accel_prefix)
+        self.legacy_max_age = app.config.get('MEDIA_LEGACY_MAX_AGE', self.legacy_max_age)
+        if self.serve_mode == 'x-sendfile':
+            app.config['USE_X_SENDFILE'] = True
+        app.extensions['media_store'] = self
+
+    def path_for(self, name):
+        """Absolute location of a stored name, sharded or legacy flat"""
+        match = HASHED_NAME_RE.match(name)
+        if match:
+            digest = match.group(1)
+            return os.path.join(self.root, digest[:2], digest[2:4], name)
+        return os.path.join(self.root, name)
+
+    def exists(self, name):
+        return os.path.isfile(self.path_for(name))
+
+    def stored_names(self):
+        """Every name in the upload folder, from a walk of the disk"""
+        for _, _, files in os.walk(self.root):
+            yield from (name for name in files if not name.endswith('.part'))
+
+    def is_uploaded(self, name):
+        """Whether `name` was stored here, without touching the filesystem"""
+        return db.session.get(UploadedImage, name) is not None
+
+    def register(self, names):
+        """Record stored names in the registry, returns how many were new"""
+        names = list(names)
+        if not names:
+            return 0
+        recorded = {row.name for row in UploadedImage.query.filter(UploadedImage.name.in_(names))}
+        new = [name for name in names if name not in recorded]
+        try:
+            db.session.add_all(UploadedImage(name=name) for name in new)
+            db.session.commit()
+        except IntegrityError:  # stored by another worker at the same time
+            db.session.rollback()
+        return len(new)
+
+    def _lock_rows(self, names):
+        """Lock the registry rows of `names` until the commit, returns how many there are"""
+        # A write rather than SELECT ... FOR UPDATE, so SQLite takes its write lock too
+        return db.session.execute(update(UploadedImage).where(UploadedImage.name.in_(names))
+                                  .values(name=UploadedImage.name)).rowcount
+
+    def _remove_files(self, name):
+        for path in {self.path_for(name), *(self.path_for(v) for v in self.variant_names(name).values())}:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def delete_unreferenced(self, names, columns):
+        """
+        Remove the stored names no row refers to in any of `columns`, with
+        their variants, and forget them; returns the names removed.
+
+        Per chunk, one transaction locks the registry rows, deletes those
+        still unreferenced and unlinks their files before committing. An
+        upload of the same content waits on the lock, then registers the
+        name again and rewrites the file (see save()).
+        """
+        names = list(names)
+        removed = []
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            if not self._lock_rows(chunk):
+                db.session.rollback()
+                continue
+            registered = set(db.session.scalars(select(UploadedImage.name).where(UploadedImage.name.in_(chunk))))
+            db.session.execute(delete(UploadedImage).where(
+                UploadedImage.name.in_(chunk),
+                *(~exists().where(column == UploadedImage.name) for column in columns),
+            ))
+            kept = set(db.session.scalars(select(UploadedImage.name).where(UploadedImage.name.in_(chunk))))
+            gone = sorted(registered - kept)
+            for name in gone:
+                self._remove_files(name)
+            db.session.commit()
+            removed.extend(gone)
+        return removed
+
+    def ensure_registered(self):
+        """Record the upload folder in the registry once, when the registry has never been filled"""
+        if UploadedImage.query.first() is None:
+            names = list(self.stored_names())
+            for start in range(0, len(names), 500):
+                self.register(names[start:start + 500])
+
+    def save(self, stream, extension):
+        """Store an upload and queue its variants, returns the stored name"""
+        extension = extension.lower()
+        os.makedirs(self.root, exist_ok=True)
+        digest = hashlib.sha256()
+        # Hash while spooling to disk so a large upload is never held in memory
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                for chunk in iter(lambda: stream.read(64 * 1024), b''):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            name = f'{digest.hexdigest()}.{extension}'
+            path = self.path_for(name)
+            # The file is checked under the lock of its registry row: a purge of the same
+            # name has either not started, or removed both and committed
+            self._claim(name)
+            if os.path.exists(path):
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            db.session.commit()
+        except BaseException:
+            db.session.rollback()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._queue_variants(name)
+        return name
+
+    def _claim(self, name):
+        """Lock the registry row of `name`, inserting it when missing"""
+        for attempt in range(2):
+            if self._lock_rows([name]):
+                return
+            try:
+                with db.session.begin_nested():
+                    db.session.add(UploadedImage(name=name))
+                return
+            except IntegrityError:  # registered by another upload meanwhile, lock that row instead
+                if attempt:
+                    raise
+
+    def variant_names(self, name):
+        """Names of the resized variants of a stored original"""
+        match = HASHED_NAME_RE.match(name)
+        if not match or match.group(2) or Image is None:
+            return {key: name for key in VARIANTS}
+        return {key: match.group(1) + suffix for key, (suffix, _, _) in VARIANTS.items()}
+
+    def _queue_variants(self, name):
+        if Image is None:
+            return
+        with self._lock:
+            if name in self._pending:
+                return
+            missing = [key for key, variant in self.variant_names(name).items() if not self.exists(variant)]
+            if not missing:
+                return
+            self._pending.add(name)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='media')
+        self._executor.submit(self._render_variants, name, missing)
+
+    def _render_variants(self, name, keys):
+        try:
+            with Image.open(self.path_for(name)) as original:
+                original = ImageOps.exif_transpose(original).convert('RGB')
+                for key in keys:
+                    suffix, size_key, image_format = VARIANTS[key]
+                    size = self.sizes[size_key]
+                    image = original.copy()
+                    image.thumbnail((size, size))
+                    path = self.path_for(self.variant_names(name)[key])
+                    # Write aside then rename, a half written variant is never served
+                    tmp_path = path + '.part'
+                    image.save(tmp_path, format=image_format, quality=80)
+                    os.replace(tmp_path, path)
+        except Exception:
+            logger.exception('Could not render variants of %s', name)
+        finally:
+            with self._lock:
+                self._pending.discard(name)
+
+    def send(self, name):
+        """
+        Response serving a stored file, honoring MEDIA_SERVE_MODE.
+
+        'direct' streams the file from Python through wsgi.file_wrapper, which
+        gunicorn turns into sendfile(); 'x-sendfile' and 'x-accel-redirect'
+        only send a header and let Apache/lighttpd or nginx ship the bytes.
+        Hashed names get an immutable Cache-Control and their hash as ETag,
+        so a revalidation is answered without touching the filesystem.
+        """
+        match = HASHED_NAME_RE.match(name)
+        etag = name if match else None
+        if etag and etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+            return response
+
+        path = self.path_for(name)
+        if self.serve_mode == 'x-accel-redirect':
+            # nginx maps the internal prefix onto the upload folder and handles Range itself
+            response = current_app.response_class(mimetype=mimetypes.guess_type(name)[0])
+            response.headers['X-Accel-Redirect'] = self.accel_prefix + os.path.relpath(path, self.root).replace(os.sep, '/')
+        else:
+            response = send_file(path, etag=etag or True, max_age=None if etag else self.legacy_max_age)
+
+        if etag:
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+
+    def wait(self):
+        """Block until queued variants are rendered (tests and benchmarks)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+media_store = MediaStore()
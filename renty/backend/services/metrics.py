@@ -0,0 +1,278 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from flask import g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from extensions import db
+from services.db_pool import pool_status, _TimedCheckout
+from services.admission import admission
+from services.replicas import replica_router
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_MIMETYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+POOL_WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 25, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    """Cumulative Prometheus histogram, one series per label values tuple"""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}  # label values -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, values, amount):
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, amount)] += 1
+        series[-1] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for values, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, values)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, values)} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self._series = defaultdict(float)
+
+    def inc(self, values, amount=1):
+        self._series[values] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines.extend(f"{self.name}{_labels(self.labels, values)} {value}"
+                     for values, value in sorted(self._series.items()))
+        return lines
+
+
+class RequestMetrics:
+    """
+    Per-request latency and SQL accounting, rendered in Prometheus text format.
+
+    before/after_request hooks time every request; SQLAlchemy engine events
+    count the statements it runs and their time. A request that issues the
+    same SELECT N_PLUS_ONE_THRESHOLD times, or as many relationship lazy
+    loads, is flagged as an N+1 pattern and logged with that statement;
+    statements slower than METRICS_SLOW_QUERY_MS are logged too. Metrics are
+    kept per process, a scrape sees the worker that answered it.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.slow_query_seconds = 0.2
+        self.n_plus_one_threshold = 5
+        self._lock = threading.Lock()
+        self._instrumented = set()
+        self.request_latency = Histogram(
+            "renty_http_request_duration_seconds", "Time spent answering a request.",
+            ("blueprint", "endpoint", "method"), LATENCY_BUCKETS)
+        self.requests = CounterMetric(
+            "renty_http_requests_total", "Requests answered, by status code.", ("blueprint", "endpoint", "method", "status"))
+        self.sql_statements = Histogram(
+            "renty_sql_statements_per_request", "SQL statements executed by one request.",
+            ("endpoint",), STATEMENT_BUCKETS)
+        self.sql_time = Histogram(
+            "renty_sql_duration_seconds_per_request", "Time spent in SQL by one request.",
+            ("endpoint",), LATENCY_BUCKETS)
+        self.slow_queries = CounterMetric(
+            "renty_sql_slow_queries_total", "Statements slower than METRICS_SLOW_QUERY_MS.", ("endpoint",))
+        self.n_plus_one = CounterMetric(
+            "renty_sql_n_plus_one_total", "Requests that repeated one statement or lazy loaded a relationship "
+                                          "N_PLUS_ONE_THRESHOLD times or more.", ("endpoint",))
+        self.pool_wait = Histogram(
+            "renty_db_pool_checkout_seconds", "Time spent waiting for a pooled database connection.",
+            ("engine",), POOL_WAIT_BUCKETS)
+        self.pool_timeouts = CounterMetric(
+            "renty_db_pool_timeouts_total", "Checkouts that gave up after pool_timeout.", ("engine",))
+        self.admission_requests = CounterMetric(
+            "renty_admission_requests_total", "Requests under an ADMISSION_LIMITS rule, by outcome "
+                                              "(admitted, rate_limited, shed).", ("rule", "outcome"))
+        self.admission_wait = Histogram(
+            "renty_admission_queue_seconds", "Time an admitted request waited for a concurrency slot.",
+            ("rule",), POOL_WAIT_BUCKETS)
+        self.collectors = [self.request_latency, self.requests, self.sql_statements, self.sql_time,
+                           self.slow_queries, self.n_plus_one, self.pool_wait, self.pool_timeouts,
+                           self.admission_requests, self.admission_wait]
+        self.gauges = [self._pool_gauges, self._admission_gauges, self._replica_gauges]  # callables returning extra exposition lines
+        self._pools = {}  # engine label -> Engine
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get("METRICS_ENABLED", self.enabled)
+        self.slow_query_seconds = app.config.get("METRICS_SLOW_QUERY_MS", 200) / 1000
+        self.n_plus_one_threshold = app.config.get("METRICS_N_PLUS_ONE_THRESHOLD", self.n_plus_one_threshold)
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        with app.app_context():
+            self.instrument_engine(db.engine)
+            self.instrument_pool(db.engine, "default")
+            for bind in app.config.get("DB_REPLICA_BINDS", []):
+                self.instrument_engine(db.engines[bind])
+                self.instrument_pool(db.engines[bind], bind)
+        if Session not in self._instrumented:
+            event.listen(Session, "do_orm_execute", self._on_orm_execute)
+            self._instrumented.add(Session)
+        if self._observe_checkout not in _TimedCheckout.observers:
+            _TimedCheckout.observers.append(self._observe_checkout)
+        if self._observe_admission not in admission.observers:
+            admission.observers.append(self._observe_admission)
+
+    def instrument_engine(self, engine):
+        """Count the statements of an Engine (pass AsyncEngine.sync_engine for async ones)"""
+        if engine in self._instrumented:
+            return
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        self._instrumented.add(engine)
+
+    def instrument_pool(self, engine, label):
+        """Report the pool of an Engine (the sync_engine of an AsyncEngine) as gauges labelled `label`"""
+        self._pools[label] = engine
+
+    def _observe_checkout(self, label, waited, timed_out):
+        with self._lock:
+            self.pool_wait.observe((label,), waited)
+            if timed_out:
+                self.pool_timeouts.inc((label,))
+
+    def _observe_admission(self, rule, outcome, waited):
+        with self._lock:
+            self.admission_requests.inc((rule, outcome))
+            if outcome == "admitted":
+                self.admission_wait.observe((rule,), waited)
+
+    def _admission_gauges(self):
+        statuses = admission.status()
+        lines = []
+        for key, help in (("running", "Requests of a rule holding a concurrency slot."),
+                          ("waiting", "Requests of a rule queued for a concurrency slot.")):
+            name = f"renty_admission_{key}"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_labels(('rule',), (rule,))} {status[key]}" for rule, status in statuses.items()]
+        return lines
+
+    def _replica_gauges(self):
+        name = "renty_db_replica_lag_seconds"
+        lines = [f"# HELP {name} Seconds a read replica is behind the primary, as last measured by this worker "
+                 "(absent while unknown or unreachable).", f"# TYPE {name} gauge"]
+        lines += [f"{name}{_labels(('bind',), (bind,))} {status['lag']}"
+                  for bind, status in replica_router.status().items() if status["lag"] is not None]
+        return lines
+
+    def _pool_gauges(self):
+        statuses = {label: pool_status(engine.pool) for label, engine in sorted(self._pools.items())}
+        statuses = {label: status for label, status in statuses.items() if status}
+        lines = []
+        for key, help in (("size", "Connections kept open by the pool."),
+                          ("checked_out", "Connections in use."),
+                          ("idle", "Connections open and waiting in the pool."),
+                          ("overflow", "Connections open beyond pool_size."),
+                          ("saturation", "Connections in use over pool_size + max_overflow.")):
+            name = f"renty_db_pool_{key}"
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_labels(('engine',), (label,))} {status[key]}" for label, status in statuses.items()]
+        return lines
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_sql_count = 0
+        g.metrics_sql_time = 0.0
+        g.metrics_statements = Counter()
+        g.metrics_lazy_loads = Counter()
+
+    def finish_request(self, response):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return response
+        elapsed = time.perf_counter() - started
+        endpoint = request.endpoint or "none"
+        blueprint = request.blueprint or ""
+
+        statement, repeats = max(g.metrics_statements.items(), key=lambda item: item[1], default=(None, 0))
+        relationship, lazy_loads = max(g.metrics_lazy_loads.items(), key=lambda item: item[1], default=(None, 0))
+        n_plus_one = max(repeats, lazy_loads) >= self.n_plus_one_threshold
+
+        with self._lock:
+            self.request_latency.observe((blueprint, endpoint, request.method), elapsed)
+            self.requests.inc((blueprint, endpoint, request.method, str(response.status_code)))
+            self.sql_statements.observe((endpoint,), g.metrics_sql_count)
+            self.sql_time.observe((endpoint,), g.metrics_sql_time)
+            if n_plus_one:
+                self.n_plus_one.inc((endpoint,))
+
+        if n_plus_one:
+            if lazy_loads >= repeats:
+                logger.warning("N+1 in %s: %d lazy loads of %s", endpoint, lazy_loads, relationship)
+            else:
+                logger.warning("N+1 in %s: %d runs of %s", endpoint, repeats, statement[:200])
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+        # Statements outside a request (startup, CLI) or outside its context are not attributed
+        if not has_app_context() or "metrics_statements" not in g:
+            return
+        g.metrics_sql_count += 1
+        g.metrics_sql_time += elapsed
+        # Only reads count towards N+1, a write may legitimately repeat (e.g. one UPDATE per facet)
+        if statement.lstrip()[:6].upper() == "SELECT":
+            g.metrics_statements[statement] += 1
+        if elapsed >= self.slow_query_seconds:
+            endpoint = request.endpoint or "none"
+            with self._lock:
+                self.slow_queries.inc((endpoint,))
+            logger.warning("Slow query in %s (%.0f ms): %s", endpoint, elapsed * 1000, statement[:200])
+
+    def _on_orm_execute(self, orm_execute_state):
+        if orm_execute_state.is_relationship_load and has_app_context() and "metrics_lazy_loads" in g:
+            path = orm_execute_state.loader_strategy_path
+            g.metrics_lazy_loads[str(path[-1]) if path else "relationship"] += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = [line for collector in self.collectors for line in collector.render()]
+        for gauge in self.gauges:
+            lines.extend(gauge())
+        return "\n".join(lines) + "\n"
+
+
+metrics = RequestMetrics()
@@ -0,0 +1,87 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+from models.post import Post
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, post_id, direction="next"):
+    """Encode a (created_at, id) position into an opaque url-safe token"""
+    payload = json.dumps([created_at.isoformat(), post_id, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decode a token produced by encode_cursor, raises InvalidCursor on garbage"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, post_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if direction not in ("next", "prev"):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), str(post_id), direction
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+
+
+def _position():
+    # Row-value comparison so both SQLite and MySQL turn the seek into an index range scan
+    return tuple_(Post.created_at, Post.id)
+
+
+def keyset_page(query, cursor=None, per_page=10):
+    """
+    Fetch one page of posts ordered newest first by (created_at, id).
+
+    Instead of OFFSET the page is located with a seek predicate on the
+    ix_posts_created_at_id index, so every page costs the same as the first.
+    Returns (posts, next_cursor, prev_cursor).
+    """
+    query, direction = keyset_query(query, cursor, per_page)
+    return keyset_result(query.all(), cursor, direction, per_page)
+
+
+def keyset_query(query, cursor=None, per_page=10):
+    """The seek query of keyset_page() without running it, and its direction"""
+    direction = "next"
+    if cursor:
+        created_at, post_id, direction = decode_cursor(cursor)
+        if direction == "next":
+            query = query.filter(_position() < tuple_(created_at, post_id))
+        else:
+            query = query.filter(_position() > tuple_(created_at, post_id))
+
+    if direction == "next":
+        query = query.order_by(Post.created_at.desc(), Post.id.desc())
+    else:
+        query = query.order_by(Post.created_at.asc(), Post.id.asc())
+
+    # One extra row tells us whether there is anything beyond this page
+    return query.limit(per_page + 1), direction
+
+
+def keyset_result(rows, cursor, direction, per_page=10):
+    """(posts, next_cursor, prev_cursor) from the rows fetched by keyset_query()"""
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == "prev":
+        rows.reverse()
+
+    if not rows:
+        return rows, None, None
+
+    first, last = rows[0], rows[-1]
+    if direction == "next":
+        next_cursor = encode_cursor(last.created_at, last.id, "next") if has_more else None
+        prev_cursor = encode_cursor(first.created_at, first.id, "prev") if cursor else None
+    else:
+        next_cursor = encode_cursor(last.created_at, last.id, "next")
+        prev_cursor = encode_cursor(first.created_at, first.id, "prev") if has_more else None
+
+    return rows, next_cursor, prev_cursor
@@ -0,0 +1,238 @@
+"""
+View counts and the popular ranking of posts.
+
+Views of a post are counted in memory by each worker and written by a
+thread of that worker every VIEW_FLUSH_INTERVAL seconds, or sooner once
+VIEW_FLUSH_MAX_PENDING posts have views waiting: one executemany UPDATE
+per flush, never one per request. A flush that fails keeps its counts for
+the next one; the counts still in memory when a worker dies are lost, a
+clean exit writes them. Flushes change neither updated_at nor version, so
+a view is not an edit. View counts are left out of the post representation
+the response cache keeps until the next edit; the owner of a post reads
+them uncached from /users/user/posts/views and /users/user/posts/<id>.
+
+Popularity decays with a half-life of POPULARITY_HALF_LIFE seconds. Rather
+than decaying every row over time, a view at time t adds
+2 ** ((t - epoch) / half-life) to posts.popularity: at any moment that
+orders posts the same as their decayed view counts, and the flushes of
+several workers are plain increments. The epoch is the popularity_epoch
+row; once it is REBASE_AFTER half-lives old, the next flush moves it to
+now and rescales every score by the same factor, so the weights stay far
+from overflowing a double.
+
+The POPULAR_TOP_K most popular posts, overall and per instrument type, are
+kept by every worker and reread every POPULAR_REFRESH_SECONDS.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from functools import wraps
+from flask import make_response
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.post import Post
+from models.popularity_epoch import PopularityEpoch
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENT_TYPES = tuple(Post.instrument_type.type.enums)
+
+
+class ViewCounter:
+    REBASE_AFTER = 64  # half-lives, a double holds about 1024
+
+    def __init__(self, app=None):
+        self.app = None
+        self.interval = 10.0
+        self.max_pending = 10000
+        self.half_life = 2 * 24 * 3600.0
+        self._pending = Counter()  # post id -> views not written yet
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None  # process the flush thread runs in
+        self._epoch_stored = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.interval = app.config.get('VIEW_FLUSH_INTERVAL', self.interval)
+        self.max_pending = app.config.get('VIEW_FLUSH_MAX_PENDING', self.max_pending)
+        self.half_life = app.config.get('POPULARITY_HALF_LIFE', self.half_life)
+        app.extensions['view_counter'] = self
+
+    def record(self, post_id, views=1):
+        self._start()
+        with self._lock:
+            self._pending[post_id] += views
+            full = len(self._pending) >= self.max_pending
+        if full:
+            self._wake.set()
+
+    def counted(self, f):
+        """Count a view of the post_id argument whenever the view answers 200 or 304, cached or not"""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if response.status_code in (200, 304):
+                self.record(kwargs['post_id'])
+            return response
+        return decorated
+
+    def _start(self):
+        # Started lazily, so the gunicorn master never runs it, and again in a forked
+        # process: threads do not survive fork(), the counts inherited belong to the parent
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = Counter()
+            threading.Thread(target=self._run, name='view-counter', daemon=True).start()
+        atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:  # the thread must outlive any error, flush() keeps the counts
+                logger.exception('View counter flush failed')
+
+    def flush(self):
+        """Write the pending views in one batch, returns how many posts were updated"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending or self.app is None:
+            return 0
+        with self.app.app_context():
+            try:
+                return self._write(pending)
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self._pending.update(pending)
+                logger.exception('Could not write the views of %d posts, keeping them for the next flush',
+                                 len(pending))
+                return 0
+
+    def _write(self, pending):
+        now = time.time()
+        connection = db.session.connection()
+        epoch = self._epoch(connection, now)
+        if (now - epoch) / self.half_life > self.REBASE_AFTER:
+            epoch = self._rebase(connection, epoch, now)
+        weight = 2.0 ** ((now - epoch) / self.half_life)
+        # Same order in every worker, so concurrent flushes lock rows in the same order
+        rows = [{'post_id': post_id, 'views': views, 'score': views * weight}
+                for post_id, views in sorted(pending.items())]
+        connection.execute(update(Post).where(Post.id == bindparam('post_id')).values(
+            view_count=Post.view_count + bindparam('views'),
+            popularity=Post.popularity + bindparam('score'),
+            updated_at=Post.updated_at,  # keeps the onupdate stamp off, a view is not a change
+        ), rows)
+        db.session.commit()
+        return len(rows)
+
+    def _epoch(self, connection, now):
+        """The epoch of the scores, its row locked until the flush commits so a rebase cannot slip in"""
+        if not self._epoch_stored:
+            # On a connection of its own, before the lock: the flush's transaction waiting on this insert
+            # behind its own gap lock would hang
+            try:
+                with db.engines[None].begin() as insert_connection:
+                    insert_connection.execute(insert(PopularityEpoch).values(id=1, epoch=now))
+            except IntegrityError:  # stored earlier or by another worker
+                pass
+            self._epoch_stored = True
+        query = select(PopularityEpoch.epoch).where(PopularityEpoch.id == 1).with_for_update()
+        return connection.execute(query).scalar()
+
+    def _rebase(self, connection, epoch, now):
+        """Move the epoch to `now`, rescaling every score by the same factor keeps their order"""
+        factor = 2.0 ** ((epoch - now) / self.half_life)
+        connection.execute(update(Post).where(Post.popularity > 0)
+                           .values(popularity=Post.popularity * factor, updated_at=Post.updated_at))
+        connection.execute(update(PopularityEpoch).where(PopularityEpoch.id == 1).values(epoch=now))
+        logger.info('Rebased post popularity to %s', now)
+        return now
+
+    def pending(self):
+        """Posts with views not written yet, in this worker"""
+        return len(self._pending)
+
+
+class PopularPosts:
+    def __init__(self, app=None):
+        self.k = 100
+        self.refresh_interval = 30.0
+        self._top = {}  # instrument type, None for all -> post ids, most popular first
+        self._next_refresh = 0.0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.k = app.config.get('POPULAR_TOP_K', self.k)
+        self.refresh_interval = app.config.get('POPULAR_REFRESH_SECONDS', self.refresh_interval)
+        self._top = {}
+        self._next_refresh = 0.0
+        app.extensions['popular_posts'] = self
+
+    def due(self):
+        return time.time() >= self._next_refresh
+
+    def ranking(self, instrument_type=None):
+        """Ids of the most popular posts, of one instrument type or of all, as last read"""
+        return self._top.get(instrument_type, ())
+
+    def ranking_queries(self):
+        """(instrument type or None, SELECT of its top post ids), one LIMIT on ix_posts_type_popularity each"""
+        for instrument_type in (None,) + INSTRUMENT_TYPES:
+            query = select(Post.id).where(Post.popularity > 0)
+            if instrument_type:
+                query = query.where(Post.instrument_type == instrument_type)
+            yield instrument_type, query.order_by(Post.popularity.desc(), Post.id.desc()).limit(self.k)
+
+    def _store(self, top):
+        self._top = top
+        self._next_refresh = time.time() + self.refresh_interval
+
+    def refresh(self):
+        """Reread the rankings on the Flask session"""
+        # One thread rereads, the others keep serving the last rankings; only the first load waits
+        if not self._lock.acquire(blocking=not self._top):
+            return
+        try:
+            if self._top and not self.due():
+                return
+            self._store({instrument_type: tuple(db.session.execute(query).scalars())
+                         for instrument_type, query in self.ranking_queries()})
+        finally:
+            self._lock.release()
+
+    async def refresh_async(self, session):
+        """refresh() for the async handlers, on their AsyncSession; never waits for another refresh"""
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._top and not self.due():
+                return
+            top = {}
+            for instrument_type, query in self.ranking_queries():
+                top[instrument_type] = tuple((await session.execute(query)).scalars())
+            self._store(top)
+        finally:
+            self._lock.release()
+
+
+view_counter = ViewCounter()
+popular_posts = PopularPosts()
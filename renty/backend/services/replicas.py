@@ -0,0 +1,231 @@
+"""
+Read-replica routing for the Flask session.
+
+Replicas are SQLAlchemy binds named in DB_REPLICA_BINDS. The reads of a GET
+or HEAD request to one of REPLICA_BLUEPRINTS go to a replica, everything
+else goes to the primary:
+
+- a request that writes (a flush, an INSERT/UPDATE/DELETE, any text() that
+  is not a SELECT) stays on the primary from then on
+- read-your-writes: a user whose request wrote something, or who just logged
+  in, reads from the primary for READ_YOUR_WRITES_SECONDS
+- a view may ask for data at least as recent as a point in time by setting
+  g.db_fresh_after (the response cache does, with the time of the last write
+  to its namespaces); replicas that have not replayed that far are skipped
+- lag: every REPLICA_LAG_CHECK_INTERVAL seconds each worker stamps the
+  replica_heartbeat row on the primary and reads it back from every replica;
+  a replica more than REPLICA_MAX_LAG seconds behind, or unreachable, gets
+  no reads until it has caught up
+
+Times are unix timestamps compared across processes, so the hosts need
+synchronized clocks. Recent writers are remembered in REPLICA_STICKY_BACKEND:
+'memory' (per worker) or 'shm' (shared by every worker on the host).
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import itertools
+import logging
+import struct
+import threading
+import time
+from flask import g, has_request_context, request
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from extensions import db
+from models.replica_heartbeat import ReplicaHeartbeat
+from services.db_pool import RoutingSession
+from services.shared_memory import HostLock, map_file, shared_memory_path
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+def is_read(clause):
+    """Whether a statement only reads: a SELECT construct, or text() starting with SELECT/WITH"""
+    if clause is None:
+        return False
+    if getattr(clause, 'is_select', False):
+        return True
+    text = getattr(clause, 'text', None)
+    return isinstance(text, str) and text.lstrip()[:6].upper() in ('SELECT', 'WITH')
+
+
+class InProcessWriteMarks:
+    name = 'memory'
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._until = {}  # user id -> unix time
+        self._lock = threading.Lock()
+
+    def mark(self, user_id, until):
+        with self._lock:
+            self._until[user_id] = until
+            if len(self._until) > self.capacity:
+                now = time.time()
+                self._until = {user: expiry for user, expiry in self._until.items() if expiry > now}
+
+    def until(self, user_id):
+        return self._until.get(user_id, 0.0)
+
+
+class SharedMemoryWriteMarks:
+    """
+    Fixed-size table of (64-bit user hash, until) slots in /dev/shm. A user
+    probes a few slots; when all are taken by live marks the one expiring
+    first is overwritten, so the table never errors, a mark may only end early.
+    """
+    name = 'shm'
+    SLOT = struct.Struct('<Qd')
+    PROBES = 4
+
+    def __init__(self, name, capacity):
+        path = shared_memory_path(name)
+        self.slots = capacity * 2
+        self._buffer = map_file(path, self.slots * self.SLOT.size)
+        self._lock = HostLock(path + '.lock')
+
+    def _offsets(self, user_id):
+        key = struct.unpack('<Q', hashlib.blake2b(user_id.encode('utf-8'), digest_size=8).digest())[0] | 1
+        start = key % self.slots
+        return key, [(start + i) % self.slots * self.SLOT.size for i in range(self.PROBES)]
+
+    def mark(self, user_id, until):
+        key, offsets = self._offsets(user_id)
+        with self._lock():
+            slots = [(offset, *self.SLOT.unpack_from(self._buffer, offset)) for offset in offsets]
+            target = next((offset for offset, slot_key, _ in slots if slot_key == key), None)
+            if target is None:
+                target = min(slots, key=lambda slot: slot[2])[0]
+            self.SLOT.pack_into(self._buffer, target, key, until)
+
+    def until(self, user_id):
+        key, offsets = self._offsets(user_id)
+        for offset in offsets:
+            slot_key, until = self.SLOT.unpack_from(self._buffer, offset)
+            if slot_key == key:
+                return until
+        return 0.0
+
+
+class ReplicaRouter:
+    def __init__(self, app=None):
+        self.replicas = []
+        self.blueprints = set()
+        self.max_lag = 2.0
+        self.check_interval = 1.0
+        self.sticky_seconds = 5.0
+        self.marks = None
+        self.lag = {}  # bind -> seconds behind the primary, None when unknown or unreachable
+        self.seen = {}  # bind -> primary heartbeat the replica has replayed (unix time)
+        self._next_check = 0.0
+        self._check_lock = threading.Lock()
+        self._turn = itertools.count()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.replicas = list(app.config.get('DB_REPLICA_BINDS', []))
+        self.blueprints = set(app.config.get('REPLICA_BLUEPRINTS', ()))
+        self.max_lag = app.config.get('REPLICA_MAX_LAG', self.max_lag)
+        self.check_interval = app.config.get('REPLICA_LAG_CHECK_INTERVAL', self.check_interval)
+        self.sticky_seconds = app.config.get('READ_YOUR_WRITES_SECONDS', self.sticky_seconds)
+        capacity = app.config.get('REPLICA_STICKY_CAPACITY', 100000)
+        if app.config.get('REPLICA_STICKY_BACKEND', 'memory') == 'shm':
+            self.marks = SharedMemoryWriteMarks(app.config['REPLICA_STICKY_SHM_NAME'], capacity)
+        else:
+            self.marks = InProcessWriteMarks(capacity)
+        self.lag = {bind: None for bind in self.replicas}
+        self.seen = {bind: 0.0 for bind in self.replicas}
+        self._next_check = 0.0
+        app.extensions['replica_router'] = self
+        RoutingSession.router = self
+        if self.replicas:
+            app.after_request(self.remember_writer)
+
+    def read_engine(self, clause, flushing):
+        """Replica engine for this statement, None for the primary"""
+        if not self.replicas or not has_request_context() or g.get('db_primary'):
+            return None
+        if flushing or not is_read(clause):
+            g.db_primary = True  # later reads must see what this request wrote
+            return None
+        if 'db_replica' not in g:
+            g.db_replica = self._choose()
+        bind = g.db_replica
+        if bind is None or self.seen[bind] < g.get('db_fresh_after', 0.0):
+            return None
+        return db.engines[bind]
+
+    def _choose(self):
+        if request.method not in SAFE_METHODS or request.blueprint not in self.blueprints:
+            return None
+        now = time.time()
+        user_id = g.get('user_id')
+        if user_id and self.marks.until(user_id) > now:
+            return None
+        if now >= self._next_check:
+            self.check_lag(now)
+        healthy = [bind for bind in self.replicas if self.lag[bind] is not None and self.lag[bind] <= self.max_lag]
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def remember_writer(self, response):
+        """after_request: a user who wrote reads their own data from the primary for a while"""
+        user_id = g.get('user_id')
+        if user_id and request.method not in SAFE_METHODS and response.status_code < 400:
+            self.marks.mark(user_id, time.time() + self.sticky_seconds)
+        return response
+
+    def check_lag(self, now=None):
+        """Stamp the heartbeat on the primary and measure every replica against it"""
+        # One thread measures, the others keep using the last result
+        if not self._check_lock.acquire(blocking=False):
+            return
+        try:
+            now = now or time.time()
+            self._next_check = now + self.check_interval
+            try:
+                beat = self._beat(now)
+            except SQLAlchemyError:
+                logger.exception('Could not stamp the replica heartbeat on the primary')
+                beat = now
+            for bind in self.replicas:
+                try:
+                    with db.engines[bind].connect() as connection:
+                        seen = connection.execute(select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1)).scalar()
+                except SQLAlchemyError:
+                    logger.warning('Replica %s is unreachable, reading from the primary', bind, exc_info=True)
+                    seen = None
+                self.seen[bind] = seen or 0.0
+                self.lag[bind] = max(beat - seen, 0.0) if seen is not None else None
+        finally:
+            self._check_lock.release()
+
+    def _beat(self, now):
+        """Move the heartbeat forward at most once per interval, returns its value on the primary"""
+        with db.engines[None].begin() as connection:
+            connection.execute(update(ReplicaHeartbeat)
+                               .where(ReplicaHeartbeat.id == 1,
+                                      ReplicaHeartbeat.beat_at <= now - self.check_interval / 2)
+                               .values(beat_at=now))
+            beat = connection.execute(select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1)).scalar()
+        if beat is None:
+            try:
+                with db.engines[None].begin() as connection:
+                    connection.execute(insert(ReplicaHeartbeat).values(id=1, beat_at=now))
+            except IntegrityError:  # inserted by another worker meanwhile
+                pass
+            beat = now
+        return beat
+
+    def status(self):
+        """Lag and replayed heartbeat of every replica, as last measured by this worker"""
+        return {bind: {"lag": self.lag[bind], "seen": self.seen[bind]} for bind in self.replicas}
+
+
+replica_router = ReplicaRouter()
@@ -0,0 +1,193 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import hashlib
+import struct
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+from services.shared_memory import HostLock, map_file, shared_memory_path
+
+# Data a cached response can depend on; writes bump the matching counter
+NAMESPACES = ('posts', 'users')
+
+# Not worth caching: recomputed from the body or specific to one response
+SKIPPED_HEADERS = {'Content-Length', 'ETag', 'Cache-Control'}
+
+
+class VersionCounters:
+    """
+    One 64-bit counter per namespace, after a random epoch, and the unix
+    time of the last bump of each namespace.
+
+    With a `shm_name` the counters live in a memory-mapped file so a write on
+    one worker invalidates the cached responses of every worker on the host.
+    Reading a counter is a plain memory read. The epoch keeps ETags handed out
+    before a restart from matching once the counters start over.
+    """
+    COUNTER = struct.Struct('<Q')
+    BUMPED_AT = struct.Struct('<d')
+
+    def __init__(self, shm_name=None):
+        size = self.COUNTER.size * (len(NAMESPACES) + 1) + self.BUMPED_AT.size * len(NAMESPACES)
+        if shm_name:
+            path = shared_memory_path(shm_name)
+            self._buffer = map_file(path, size)
+            self._lock = HostLock(path + '.lock')
+        else:
+            self._buffer = bytearray(size)
+            self._lock = HostLock()
+        with self._lock():
+            if not self.epoch:
+                self.COUNTER.pack_into(self._buffer, 0, int.from_bytes(os.urandom(8), 'little') | 1)
+
+    @property
+    def epoch(self):
+        return self.COUNTER.unpack_from(self._buffer, 0)[0]
+
+    def _offset(self, namespace):
+        return (NAMESPACES.index(namespace) + 1) * self.COUNTER.size
+
+    def _bumped_at_offset(self, namespace):
+        return (len(NAMESPACES) + 1) * self.COUNTER.size + NAMESPACES.index(namespace) * self.BUMPED_AT.size
+
+    def get(self, namespace):
+        return self.COUNTER.unpack_from(self._buffer, self._offset(namespace))[0]
+
+    def bumped_at(self, namespace):
+        return self.BUMPED_AT.unpack_from(self._buffer, self._bumped_at_offset(namespace))[0]
+
+    def bump(self, namespace):
+        with self._lock():
+            offset = self._offset(namespace)
+            value = self.COUNTER.unpack_from(self._buffer, offset)[0] + 1
+            self.COUNTER.pack_into(self._buffer, offset, value)
+            self.BUMPED_AT.pack_into(self._buffer, self._bumped_at_offset(namespace), time.time())
+
+
+class ResponseCache:
+    """
+    LRU cache of serialized GET responses with strong ETags.
+
+    The ETag of a request is derived from the endpoint, its arguments and the
+    version counters it depends on, so it is known before the view runs:
+    a matching If-None-Match is answered with 304 without touching the
+    database, and a cached body is served as long as no write bumped the
+    counters. Bodies are evicted least recently used above `max_bytes`.
+    """
+
+    def __init__(self, app=None):
+        self.max_bytes = 32 * 1024 * 1024
+        self.max_age = 0
+        self.enabled = True
+        self.versions = VersionCounters()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._entries = OrderedDict()  # key -> (etag, body, headers)
+        self._size = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('RESPONSE_CACHE_ENABLED', True)
+        self.max_bytes = app.config.get('RESPONSE_CACHE_MAX_BYTES', self.max_bytes)
+        self.max_age = app.config.get('RESPONSE_CACHE_MAX_AGE', self.max_age)
+        self.versions = VersionCounters(app.config.get('RESPONSE_CACHE_SHM_NAME'))
+        self.clear()
+        app.extensions['response_cache'] = self
+
+    def bump(self, *namespaces):
+        """Invalidate every cached response depending on `namespaces`"""
+        for namespace in namespaces:
+            self.versions.bump(namespace)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'not_modified': self.not_modified}
+
+    def _get(self, key, etag):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def _put(self, key, etag, body, headers):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[1])
+            self._entries[key] = (etag, body, headers)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def _finish(self, response, etag):
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = f'private, max-age={self.max_age}, must-revalidate'
+        return response
+
+    def cached(self, *namespaces, per_user=False, unless=None):
+        """
+        Cache a GET view whose output only changes when `namespaces` are written.
+
+        Put it under @token_required; with per_user=True the caller's user_id
+        is part of the key, for views that only return the caller's own data.
+        Requests for which unless() is true are answered by the view uncached,
+        for modes whose output changes without a write.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if not self.enabled or (unless is not None and unless()):
+                    return f(*args, **kwargs)
+
+                view_args = sorted((k, v) for k, v in kwargs.items() if per_user or k != 'user_id')
+                key = f'{request.endpoint}|{view_args!r}|{sorted(request.args.items(multi=True))!r}|' \
+                      f'{request.headers.get("Accept", "")}'
+                version = ':'.join(str(self.versions.get(namespace)) for namespace in namespaces)
+                version = f'{self.versions.epoch}:{version}'
+                etag = hashlib.sha1(f'{key}|{version}'.encode('utf-8')).hexdigest()
+
+                if etag in request.if_none_match:
+                    with self._lock:
+                        self.not_modified += 1
+                    return self._finish(make_response('', 304), etag)
+
+                entry = self._get(key, etag)
+                if entry is not None:
+                    _, body, headers = entry
+                    return self._finish(make_response(body, 200, headers), etag)
+
+                # The body is stored under the current versions: a read replica must have replayed the
+                # writes behind them (see services/replicas.py), the primary has them all
+                g.db_fresh_after = max(self.versions.bumped_at(namespace) for namespace in namespaces)
+                response = make_response(f(*args, **kwargs))
+                # Streamed bodies are never buffered, so they are not cached either
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                headers = [(name, value) for name, value in response.headers.items() if name not in SKIPPED_HEADERS]
+                self._put(key, etag, response.get_data(), headers)
+                return self._finish(response, etag)
+
+            return decorated
+        return decorator
+
+
+response_cache = ResponseCache()
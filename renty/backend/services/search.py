@@ -0,0 +1,377 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import math
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from types import SimpleNamespace
+from sqlalchemy import bindparam, event, text
+from sqlalchemy.orm import Session
+from extensions import db
+from models.post import Post
+
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Relative weight of a match in each searchable column
+FIELD_WEIGHTS = {"title": 10.0, "brand": 5.0, "description": 1.0}
+
+
+def tokenize(value):
+    """Lowercase word tokens of a string, empty list for None"""
+    if not value:
+        return []
+    return TOKEN_RE.findall(value.lower())
+
+
+class MySQLFullTextBackend:
+    """
+    Uses the FULLTEXT index on posts(title, brand, description).
+
+    InnoDB maintains the index itself on every INSERT/UPDATE/DELETE, so the
+    incremental hooks have nothing to do. Words the index never holds,
+    stopwords and words shorter than innodb_ft_min_token_size, are left out
+    of the query: required with +, any of them would match no post at all.
+    """
+    name = "mysql"
+    maintained_by_database = True
+
+    def __init__(self):
+        self._min_token_size = None  # read from the server on the first search
+        self._stopwords = frozenset()
+
+    def _load_token_rules(self):
+        settings = db.session.execute(text(
+            "SELECT @@innodb_ft_min_token_size, @@innodb_ft_enable_stopword, @@innodb_ft_server_stopword_table"
+        )).one()
+        min_token_size, enable_stopword, stopword_table = settings
+        if enable_stopword:
+            if stopword_table:
+                schema, _, table = stopword_table.partition("/")
+                query = f"SELECT value FROM `{schema}`.`{table}`"
+            else:
+                query = "SELECT value FROM INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD"
+            self._stopwords = frozenset(value.lower() for value in db.session.execute(text(query)).scalars())
+        self._min_token_size = min_token_size
+
+    def _indexed_terms(self, terms):
+        """The terms the FULLTEXT index can hold; the last one, matched as a prefix, is always kept"""
+        if self._min_token_size is None:
+            self._load_token_rules()
+        *required, prefix = terms
+        return [term for term in required
+                if len(term) >= self._min_token_size and term not in self._stopwords] + [prefix]
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def index_posts(self, posts):
+        pass
+
+    def remove_posts(self, post_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, terms, limit, offset):
+        terms = self._indexed_terms(terms)
+        # +term makes every word required, the trailing * gives prefix matching
+        query = " ".join(f"+{term}*" if i == len(terms) - 1 else f"+{term}" for i, term in enumerate(terms))
+        rows = db.session.execute(text(
+            "SELECT id FROM posts "
+            "WHERE MATCH(title, brand, description) AGAINST (:q IN BOOLEAN MODE) "
+            "ORDER BY MATCH(title, brand, description) AGAINST (:q IN BOOLEAN MODE) DESC, id "
+            "LIMIT :limit OFFSET :offset"
+        ), {"q": query, "limit": limit, "offset": offset})
+        return [row[0] for row in rows]
+
+
+class SQLiteFTS5Backend:
+    """
+    Keeps an FTS5 virtual table next to posts, ranked with bm25().
+
+    The table is created and filled by a migration, or by create_tables()
+    when the app creates its own schema; `flask rebuild-search-index` refills
+    it. Writes join the caller's transaction, which commits them with the
+    posts they index.
+    """
+    name = "fts5"
+
+    @staticmethod
+    def create_table():
+        """Create posts_fts if missing, filled from posts when new"""
+        exists = db.session.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'posts_fts'"
+        )).first()
+        if not exists:
+            db.session.execute(text(
+                "CREATE VIRTUAL TABLE posts_fts USING fts5(post_id UNINDEXED, title, brand, description)"
+            ))
+            SQLiteFTS5Backend.rebuild()
+
+    @staticmethod
+    def rebuild():
+        db.session.execute(text("DELETE FROM posts_fts"))
+        db.session.execute(text(
+            "INSERT INTO posts_fts (post_id, title, brand, description) "
+            "SELECT id, title, brand, COALESCE(description, '') FROM posts"
+        ))
+
+    def index_post(self, post):
+        self.index_posts([post])
+
+    def remove_post(self, post_id):
+        self.remove_posts([post_id])
+
+    def index_posts(self, posts):
+        if not posts:
+            return
+        self._delete([post.id for post in posts])
+        db.session.execute(text(
+            "INSERT INTO posts_fts (post_id, title, brand, description) VALUES (:id, :title, :brand, :description)"
+        ), [{"id": post.id, "title": post.title, "brand": post.brand, "description": post.description or ""}
+            for post in posts])
+
+    def remove_posts(self, post_ids):
+        if not post_ids:
+            return
+        self._delete(post_ids)
+
+    def _delete(self, post_ids):
+        # post_id is UNINDEXED, every DELETE scans the table: one per chunk of ids, not one per id
+        post_ids = list(post_ids)
+        statement = text("DELETE FROM posts_fts WHERE post_id IN :ids").bindparams(bindparam("ids", expanding=True))
+        for start in range(0, len(post_ids), 500):
+            db.session.execute(statement, {"ids": post_ids[start:start + 500]})
+
+    def search(self, terms, limit, offset):
+        # Quoting every token keeps user input out of the FTS5 query syntax
+        query = " ".join(f'"{term}"*' if i == len(terms) - 1 else f'"{term}"' for i, term in enumerate(terms))
+        weights = ", ".join(str(FIELD_WEIGHTS[field]) for field in ("title", "brand", "description"))
+        rows = db.session.execute(text(
+            "SELECT post_id FROM posts_fts WHERE posts_fts MATCH :q "
+            f"ORDER BY bm25(posts_fts, 0, {weights}), post_id LIMIT :limit OFFSET :offset"
+        ), {"q": query, "limit": limit, "offset": offset})
+        return [row[0] for row in rows]
+
+
+class InMemoryBackend:
+    """
+    Pure-Python inverted index for databases without a full-text engine.
+
+    The index lives in the worker process and is built from the posts table
+    on first use, so it is meant for local development and tests: it never
+    sees posts written through another process, and SearchIndex.check_workers()
+    refuses it under a server running several. Changes are queued on the
+    database session and applied once it commits, dropped if it does not.
+    """
+    name = "memory"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # token -> {post_id: weighted term frequency}
+        self._docs = {}  # post_id -> tokens indexed for it
+        self._vocabulary = []  # sorted tokens, for prefix lookups
+        self._vocabulary_dirty = False
+        self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._postings.clear()
+            self._docs.clear()
+            self._vocabulary_dirty = True
+            for post in Post.query.with_entities(Post.id, Post.title, Post.brand, Post.description):
+                self._add(post)
+
+    def _add(self, post):
+        weights = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            for token in tokenize(getattr(post, field)):
+                weights[token] += weight
+        for token, weight in weights.items():
+            if token not in self._postings:
+                self._vocabulary_dirty = True
+            self._postings[token][post.id] = weight
+        self._docs[post.id] = list(weights)
+
+    def _remove(self, post_id):
+        for token in self._docs.pop(post_id, ()):
+            postings = self._postings[token]
+            postings.pop(post_id, None)
+            if not postings:
+                del self._postings[token]
+                self._vocabulary_dirty = True
+
+    def _queue(self, changes):
+        db.session.info.setdefault("search_changes", {}).setdefault(self, []).extend(changes)
+
+    def _apply(self, changes):
+        with self._lock:
+            for post_id, post in changes:
+                self._remove(post_id)
+                if post is not None:
+                    self._add(post)
+
+    def index_post(self, post):
+        self.index_posts([post])
+
+    def remove_post(self, post_id):
+        self.remove_posts([post_id])
+
+    def index_posts(self, posts):
+        # The text as it is now: ORM objects are expired by the commit the change waits for
+        self._queue((post.id, SimpleNamespace(id=post.id, title=post.title, brand=post.brand,
+                                              description=post.description)) for post in posts)
+
+    def remove_posts(self, post_ids):
+        self._queue((post_id, None) for post_id in post_ids)
+
+    def _expand_prefix(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            yield self._vocabulary[i]
+            i += 1
+
+    def search(self, terms, limit, offset):
+        with self._lock:
+            n_docs = max(len(self._docs), 1)
+            scores = None
+            for i, term in enumerate(terms):
+                tokens = self._expand_prefix(term) if i == len(terms) - 1 else [term]
+                term_scores = defaultdict(float)
+                for token in tokens:
+                    postings = self._postings.get(token, {})
+                    idf = math.log(1 + n_docs / (1 + len(postings)))
+                    for post_id, weight in postings.items():
+                        term_scores[post_id] = max(term_scores[post_id], weight * idf)
+                # Every term must match, same as the SQL backends
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {post_id: score + term_scores[post_id]
+                              for post_id, score in scores.items() if post_id in term_scores}
+                if not scores:
+                    return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [post_id for post_id, _ in ranked[offset:offset + limit]]
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_committed_changes(session):
+    for backend, changes in session.info.pop("search_changes", {}).items():
+        backend._apply(changes)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_uncommitted_changes(session, transaction):
+    if transaction.parent is None:  # rolled back or closed; a commit has applied them already
+        session.info.pop("search_changes", None)
+
+
+class SearchIndex:
+    """
+    Full-text search over post title, brand and description.
+
+    The backend is picked from the database dialect the first time it is
+    used: MySQL FULLTEXT, SQLite FTS5, or the in-memory inverted index. Set
+    SEARCH_BACKEND to 'mysql', 'fts5' or 'memory' to force one.
+
+    The write methods never commit: call them before the commit of the posts
+    they index, so both land together.
+    """
+
+    def __init__(self, app=None):
+        self._backend = None
+        self._lock = threading.Lock()
+        self._choice = "auto"
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self._choice = app.config.get("SEARCH_BACKEND", "auto")
+        self._backend = None
+        app.extensions["search_index"] = self
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._create_backend()
+        return self._backend
+
+    def _create_backend(self):
+        return self._backend_class()()
+
+    def _backend_class(self):
+        choice = self._choice
+        if choice == "auto":
+            dialect = db.engine.dialect.name
+            if dialect in ("mysql", "mariadb"):
+                choice = "mysql"
+            elif dialect == "sqlite" and _sqlite_has_fts5():
+                choice = "fts5"
+            else:
+                choice = "memory"
+        backends = {"mysql": MySQLFullTextBackend, "fts5": SQLiteFTS5Backend, "memory": InMemoryBackend}
+        return backends[choice]
+
+    def create_tables(self):
+        """Create the index tables the backend keeps outside the models, next to db.create_all()"""
+        if self._backend_class() is SQLiteFTS5Backend:
+            SQLiteFTS5Backend.create_table()
+
+    def rebuild(self):
+        """Reindex every post"""
+        self.backend.rebuild()
+
+    def check_workers(self, workers):
+        """Refuse a backend kept in process memory when `workers` processes serve the app"""
+        if workers > 1 and self._backend_class() is InMemoryBackend:
+            raise RuntimeError(f"The in-memory search index is per process, it cannot serve {workers} workers: "
+                               "use MySQL or SQLite with FTS5, or a single worker")
+
+    @property
+    def needs_documents(self):
+        """Whether index_post() needs the post's text, False when the database indexes it itself"""
+        return not getattr(self.backend, "maintained_by_database", False)
+
+    def index_post(self, post):
+        self.backend.index_post(post)
+
+    def remove_post(self, post_id):
+        self.backend.remove_post(post_id)
+
+    def index_posts(self, posts):
+        """Batch version of index_post, one round trip for the whole list"""
+        self.backend.index_posts(posts)
+
+    def remove_posts(self, post_ids):
+        self.backend.remove_posts(post_ids)
+
+    def search(self, query, page=1, per_page=10):
+        """Return the posts matching every word of query, best match first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        ids = self.backend.search(terms, limit=per_page, offset=(page - 1) * per_page)
+        if not ids:
+            return []
+        posts = {post.id: post for post in Post.query.filter(Post.id.in_(ids))}
+        return [posts[post_id] for post_id in ids if post_id in posts]
+
+
+def _sqlite_has_fts5():
+    options = db.session.execute(text("PRAGMA compile_options")).scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+search_index = SearchIndex()
@@ -0,0 +1,136 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import itertools
+from datetime import datetime
+from flask import current_app, request, stream_with_context
+from models.post import Post
+
+try:
+    import orjson
+except ImportError:  # optional, the stdlib-based Flask encoder is used instead
+    orjson = None
+
+# Same keys, in the same order, as Post.to_dict()
+POST_FIELDS = ("id", "user_id", "instrument_type", "brand", "title", "price", "description",
+               "phone_number", "image", "availability", "status", "location", "latitude", "longitude", "created_at",
+               "updated_at", "version")
+DATETIME_FIELDS = {"created_at", "updated_at"}
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+NDJSON_BATCH_SIZE = 1000  # rows fetched from the server-side cursor and written per chunk
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(value):
+    """Validate a ?fields=title,price sparse fieldset, all fields when missing"""
+    if not value:
+        return POST_FIELDS
+    fields = tuple(dict.fromkeys(field.strip() for field in value.split(",") if field.strip()))
+    unknown = [field for field in fields if field not in POST_FIELDS]
+    if unknown or not fields:
+        raise InvalidFields(f"Unknown fields: {', '.join(unknown)}. Must be among: {', '.join(POST_FIELDS)}")
+    return fields
+
+
+def project_posts(query, fields, extra=()):
+    """
+    Narrow a Post query to plain rows of `fields`.
+
+    Rows are named tuples, so nothing is hydrated into ORM objects or added to
+    the session. `extra` columns (e.g. the pagination key) are selected too
+    but left out of the serialized output.
+    """
+    columns = tuple(dict.fromkeys(fields + tuple(extra)))
+    return query.with_entities(*(getattr(Post, field) for field in columns))
+
+
+def _use_orjson():
+    return orjson is not None and current_app.config.get("USE_ORJSON", True)
+
+
+def rows_to_dicts(rows, fields):
+    """Serialize projected rows, keeping only `fields`"""
+    dates = [] if _use_orjson() else [field for field in fields if field in DATETIME_FIELDS]
+    result = []
+    for row in rows:
+        mapping = row._mapping
+        item = {field: mapping[field] for field in fields}
+        # orjson writes datetimes natively, the same way isoformat() does
+        for field in dates:
+            if item[field] is not None:
+                item[field] = item[field].isoformat()
+        result.append(item)
+    return result
+
+
+def wants_ndjson():
+    """True when the client asked for Accept: application/x-ndjson over plain JSON"""
+    return request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE]) == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, fields, batch_size=NDJSON_BATCH_SIZE):
+    """
+    Stream a projected query as one JSON object per line.
+
+    Rows come from a server-side cursor `batch_size` at a time and each batch
+    is written out before the next one is fetched, so memory stays flat
+    whatever the size of the result. Returns None when the query is empty.
+    """
+    rows = iter(query.yield_per(batch_size))
+    first = next(rows, None)
+    if first is None:
+        return None
+
+    def generate():
+        batch = itertools.chain([first], rows)
+        while True:
+            chunk = list(itertools.islice(batch, batch_size))
+            if not chunk:
+                return
+            yield ndjson_chunk(chunk, fields)
+
+    return current_app.response_class(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+
+def ndjson_chunk(rows, fields):
+    """One batch of projected rows as NDJSON bytes"""
+    encode = _line_encoder()
+    return b"".join(encode(item) for item in rows_to_dicts(rows, fields))
+
+
+def ndjson_items_response(items):
+    """NDJSON body for a list of already serialized dicts"""
+    encode = _line_encoder()
+    return current_app.response_class(b"".join(encode(item) for item in items), mimetype=NDJSON_MIMETYPE)
+
+
+def _line_encoder():
+    if _use_orjson():
+        def encode(item):
+            return orjson.dumps(item, default=_default) + b"\n"
+    else:
+        def encode(item):
+            return current_app.json.dumps(item).encode("utf-8") + b"\n"
+    return encode
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError
+
+
+def json_response(data, status=200, headers=None):
+    """jsonify() replacement that uses orjson when it is installed"""
+    if not _use_orjson():
+        response = current_app.json.response(data)
+    else:
+        response = current_app.response_class(orjson.dumps(data, default=_default), mimetype="application/json")
+    response.status_code = status
+    if headers:
+        response.headers.extend({key: value for key, value in headers.items() if value is not None})
+    return response
@@ -0,0 +1,69 @@
+"""Helpers for state shared by every worker process on the host"""
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows, only in-process locking is available
+    fcntl = None
+
+
+def shared_memory_path(name):
+    """Path of a file backed by memory (/dev/shm) when the OS offers it"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, name)
+
+
+class HostLock:
+    """Thread lock plus an flock on `path`, so writers on every worker are serialized"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600) if path and fcntl else None
+        if self._fd is not None:
+            _host_locks.add(self)
+
+    def _reopen(self):
+        # flock() belongs to the open file description, which a forked worker
+        # shares with its parent: without its own, workers would not exclude each other
+        self._thread_lock = threading.Lock()
+        os.close(self._fd)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+
+    @contextmanager
+    def __call__(self):
+        with self._thread_lock:
+            if self._fd is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if self._fd is not None:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_host_locks = weakref.WeakSet()
+
+
+def _reopen_host_locks():
+    for lock in list(_host_locks):
+        lock._reopen()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reopen_host_locks)
+
+
+def map_file(path, size):
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if os.fstat(fd).st_size < size:
+            os.ftruncate(fd, size)
+        return mmap.mmap(fd, size)
+    finally:
+        os.close(fd)
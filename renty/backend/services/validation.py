@@ -0,0 +1,116 @@
+import math
+import re
+
+
+class Rule:
+    """
+    One field of a Schema. Subclasses build their check once, in compile(),
+    and the Schema calls it per value: it returns an error message or None.
+    A required field that is missing, None or "" fails with its message; an
+    optional one is skipped.
+    """
+
+    def __init__(self, message, required=True):
+        self.message = message
+        self.required = required
+        self.check = self.compile()
+
+    def compile(self):
+        return lambda value: None
+
+
+class Text(Rule):
+    def __init__(self, message, min_length=1, pattern=None, required=True):
+        self.min_length = min_length
+        self.pattern = re.compile(pattern) if pattern else None
+        super().__init__(message, required)
+
+    def compile(self):
+        message, min_length, pattern = self.message, self.min_length, self.pattern
+        if pattern:
+            fullmatch = pattern.fullmatch
+            return lambda value: message if not isinstance(value, str) or not fullmatch(value) else None
+        return lambda value: message if not isinstance(value, str) or len(value) < min_length else None
+
+
+class Number(Rule):
+    """A finite number, or a string float() reads as one; strictly positive with positive=True"""
+
+    def __init__(self, message, positive=False, required=True):
+        self.positive = positive
+        super().__init__(message, required)
+
+    def compile(self):
+        message, positive = self.message, self.positive
+
+        def check(value):
+            # True is an int to float(), "inf" and "nan" are floats to it; none of them is a price
+            if isinstance(value, bool):
+                return message
+            try:
+                value = float(value)
+            except (ValueError, TypeError, OverflowError):
+                return message
+            if not math.isfinite(value):
+                return message
+            return message if positive and not value > 0 else None
+        return check
+
+
+class Choice(Rule):
+    def __init__(self, choices, message, required=True):
+        self.choices = frozenset(choices)
+        super().__init__(message, required)
+
+    def compile(self):
+        message, choices = self.message, self.choices
+        return lambda value: None if isinstance(value, str) and value in choices else message
+
+
+class Check(Rule):
+    """A field checked by a function returning an error message or None"""
+
+    def __init__(self, check, required=True):
+        self._check = check
+        super().__init__(None, required)
+
+    def compile(self):
+        return self._check
+
+
+class Schema:
+    """
+    Declarative validation of a JSON object, built once at import time.
+
+    errors() checks every field and returns {field: message} for all that
+    failed, in declaration order, so the first entry is the first error a
+    field-by-field check would have stopped at. partial() is the same schema
+    for updates: fields left out of the payload are not checked.
+    """
+
+    def __init__(self, rules, partial=False):
+        self.rules = rules
+        self.is_partial = partial
+        # (field, check, required, message) tuples, the hot loop does no attribute lookups
+        self._compiled = tuple((name, rule.check, rule.required, rule.message) for name, rule in rules.items())
+
+    def partial(self):
+        return Schema(self.rules, partial=True)
+
+    def errors(self, data):
+        if not isinstance(data, dict):
+            return {"body": "Body must be a JSON object."}
+        errors = {}
+        get = data.get
+        partial = self.is_partial
+        for name, check, required, message in self._compiled:
+            value = get(name)
+            if value is None or value == "":
+                # Left out of a partial payload is fine, sent empty is not
+                if required and not (partial and value is None):
+                    errors[name] = message or check(value)
+                continue
+            error = check(value)
+            if error:
+                errors[name] = error
+        return errors
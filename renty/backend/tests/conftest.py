@@ -0,0 +1,31 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import importlib
+
+import pytest
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """create_app() on a SQLite database of its own"""
+    monkeypatch.setenv("DEV_DATABASE_URL", f"sqlite:///{tmp_path / 'renty.db'}")
+    monkeypatch.setenv("BCRYPT_ROUNDS", "4")
+    monkeypatch.setenv("ADMISSION_ENABLED", "0")
+    import config
+    importlib.reload(config)  # its classes read the environment when first imported
+    from app import create_app
+    yield create_app()
+    monkeypatch.undo()
+    importlib.reload(config)
+
+
+@pytest.fixture
+def client(app):
+    """Test client signed in as a fresh user, whose id is client.user_id"""
+    client = app.test_client()
+    client.post("/home/register", json={"name": "tester", "email": "tester@example.com", "password": "tester123"})
+    token = client.post("/home/login", json={"email": "tester@example.com", "password": "tester123"}).get_json()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + token["access_token"]
+    client.user_id = token["user_id"]
+    return client
@@ -0,0 +1,57 @@
+"""/posts/bulk updates: partial items, and a post changed between the read and the write"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+from services.geo import geocoder
+
+
+def post(title, **fields):
+    return dict({"instrument_type": "Guitar", "title": title, "brand": "Yamaha", "price": 120,
+                 "description": "A very nice guitar", "phone_number": "12345678", "status": "for rental",
+                 "location": "Tunis"}, **fields)
+
+
+def create(client, count):
+    response = client.post("/posts/bulk", json={"create": [post(f"Guitar number {i}") for i in range(count)]})
+    assert response.status_code == 200
+    return response.get_json()["created"]
+
+
+def fetch(client, post_id):
+    return client.get(f"/home/posts/{post_id}").get_json()
+
+
+def test_update_writes_only_the_fields_sent(client):
+    first, second = create(client, 2)
+    response = client.post("/posts/bulk", json={"update": [{"id": first, "price": 600}, {"id": second, "title": "Renamed"}]})
+    assert response.status_code == 200
+    assert fetch(client, first)["price"] == 600 and fetch(client, first)["title"] == "Guitar number 0"
+    assert fetch(client, second)["title"] == "Renamed" and fetch(client, second)["price"] == 120
+    assert fetch(client, first)["version"] == 2
+
+    invalid = client.post("/posts/bulk", json={"update": [{"id": first, "price": -1, "colour": "red", "title": None}]})
+    assert invalid.status_code == 400
+    assert set(invalid.get_json()["errors"][0]["fields"]) == {"price", "colour", "title"}
+
+
+def test_post_changed_by_another_request_is_a_conflict(app, client, monkeypatch):
+    from extensions import db
+    first, second = create(client, 2)
+    coordinates = geocoder.coordinates
+
+    def concurrent_patch(location):
+        # Runs after the batch read the versions, before it writes
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql("UPDATE posts SET title = 'Changed meanwhile', version = version + 1 "
+                                       "WHERE id = ?", (second,))
+        return coordinates(location)
+    monkeypatch.setattr(geocoder, "coordinates", concurrent_patch)
+
+    response = client.post("/posts/bulk", json={"update": [
+        {"id": first, "title": "Batch title"}, {"id": second, "title": "Batch title", "location": "Sfax"},
+    ]})
+    assert response.status_code == 409
+    assert response.get_json()["conflicts"] == [second]
+    assert fetch(client, first)["title"] == "Guitar number 0"
+    assert fetch(client, second)["title"] == "Changed meanwhile"
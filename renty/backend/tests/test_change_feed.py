@@ -0,0 +1,52 @@
+"""/home/posts/changes tokens against the tombstone retention"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import uuid
+from datetime import datetime, timedelta
+
+from services.changes import decode_token, encode_token
+
+
+def insert_post(app, user_id, updated_at):
+    from extensions import db
+    from models.post import Post
+    post_id = str(uuid.uuid4())
+    with app.app_context():
+        db.session.execute(Post.__table__.insert(), [{
+            "id": post_id, "user_id": user_id, "instrument_type": "Violin", "brand": "Stentor",
+            "title": "Student violin", "price": 150.0, "description": "Full size, with bow and case",
+            "phone_number": "12345678", "image": None, "availability": "available", "status": "for sale",
+            "location": "Sousse", "created_at": updated_at, "updated_at": updated_at,
+        }])
+        db.session.commit()
+    return post_id
+
+
+def test_quiet_catalogue_keeps_the_token_fresh(app, client):
+    days = app.config["CHANGE_FEED_TOMBSTONE_DAYS"]
+    post_id = insert_post(app, client.user_id, datetime.utcnow() - timedelta(days=days + 10))
+
+    first = client.get("/home/posts/changes").get_json()
+    assert [post["id"] for post in first["posts"]] == [post_id]
+    assert not first["has_more"]
+    # The last change is older than the tombstones, the token is not
+    assert decode_token(first["next_token"])[0] > datetime.utcnow() - timedelta(days=1)
+
+    again = client.get("/home/posts/changes", query_string={"since": first["next_token"]})
+    assert again.status_code == 200
+    assert again.get_json()["posts"] == []
+
+
+def test_token_older_than_the_tombstones_expires(app, client):
+    days = app.config["CHANGE_FEED_TOMBSTONE_DAYS"]
+    token = encode_token(datetime.utcnow() - timedelta(days=days + 1), str(uuid.uuid4()))
+    assert client.get("/home/posts/changes", query_string={"since": token}).status_code == 410
+
+
+def test_changes_after_an_empty_answer_are_not_missed(app, client):
+    app.config["CHANGE_FEED_SETTLE_SECONDS"] = 0
+    token = client.get("/home/posts/changes").get_json()["next_token"]
+    post_id = insert_post(app, client.user_id, datetime.utcnow())
+    answer = client.get("/home/posts/changes", query_string={"since": token}).get_json()
+    assert [post["id"] for post in answer["posts"]] == [post_id]
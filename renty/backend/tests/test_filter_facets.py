@@ -0,0 +1,36 @@
+"""/home/filter facet counts follow the active filters"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+
+def create(client, instrument_type, price, status="for sale"):
+    response = client.post("/posts/create", json={
+        "instrument_type": instrument_type, "title": f"{instrument_type} for you", "brand": "Yamaha",
+        "price": price, "description": "Kept in good shape", "phone_number": "12345678",
+        "status": status, "location": "Tunis",
+    })
+    assert response.status_code == 201
+
+
+def test_facets_count_the_filtered_posts(client):
+    create(client, "Guitar", 80)
+    create(client, "Guitar", 300, status="for rental")
+    create(client, "Piano", 1500)
+
+    catalogue = client.get("/home/filter").get_json()["facets"]
+    assert catalogue["instrument_type"]["Guitar"] == 2
+    assert catalogue["instrument_type"]["Piano"] == 1
+
+    guitars = client.get("/home/filter", query_string={"type": "Guitar"}).get_json()
+    assert len(guitars["posts"]) == 2
+    facets = guitars["facets"]
+    assert facets["instrument_type"] == {"Guitar": 2, "Piano": 0, "Violin": 0, "Drums": 0}
+    assert facets["status"] == {"for sale": 1, "for rental": 1}
+    assert facets["price_bucket"]["50-100"] == 1
+    assert facets["price_bucket"]["250-500"] == 1
+    assert facets["price_bucket"]["1000+"] == 0
+
+    cheap = client.get("/home/filter", query_string={"type": "Guitar", "max_price": 100}).get_json()["facets"]
+    assert cheap["status"] == {"for sale": 1, "for rental": 0}
+    assert sum(cheap["price_bucket"].values()) == 1
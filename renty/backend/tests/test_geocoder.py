@@ -0,0 +1,31 @@
+"""Loading a gazetteer CSV with a header and broken rows"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import logging
+
+from flask import Flask
+
+from services.geo import Geocoder
+
+
+def test_header_and_bad_rows_are_skipped(tmp_path, caplog):
+    path = tmp_path / "places.csv"
+    path.write_text("name,latitude,longitude\n"
+                    "Tabarka,36.9544,8.7580\n"
+                    "Douz,not a number,9.0203\n"
+                    "Tozeur,33.9197\n"
+                    "\n"
+                    "Nefta,33.8730,7.8770\n", encoding="utf-8")
+    app = Flask(__name__)
+    app.config.update(GEOCODER="gazetteer", GEOCODER_GAZETTEER_PATH=str(path))
+
+    with caplog.at_level(logging.WARNING, logger="services.geo"):
+        geocoder = Geocoder(app)
+
+    assert geocoder.backend.geocode("Tabarka") == (36.9544, 8.7580)
+    assert geocoder.backend.geocode("Nefta") == (33.8730, 7.8770)
+    assert geocoder.backend.geocode("Douz") is None
+    assert geocoder.backend.geocode("Tunis") is not None
+    skipped = [record.getMessage() for record in caplog.records]
+    assert len(skipped) == 2 and "row 3" in skipped[0] and "row 4" in skipped[1]
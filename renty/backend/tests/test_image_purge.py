@@ -0,0 +1,83 @@
+"""Images of a deleted account against uploads and posts of the same content"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import io
+
+import pytest
+
+from services.background import background_jobs
+from services.media_store import media_store
+
+CONTENT = b"\x89PNG\r\n\x1a\n same bytes for every account"
+
+
+@pytest.fixture
+def uploads(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_store, "root", str(tmp_path / "uploads"))
+    app.config["BACKGROUND_WORKERS"] = 0
+    background_jobs.init_app(app)
+    return media_store
+
+
+def sign_up(app, email):
+    client = app.test_client()
+    client.post("/home/register", json={"name": email.split("@")[0], "email": email, "password": "secret123"})
+    token = client.post("/home/login", json={"email": email, "password": "secret123"}).get_json()
+    client.environ_base["HTTP_AUTHORIZATION"] = "Bearer " + token["access_token"]
+    client.user_id = token["user_id"]
+    return client
+
+
+def upload(client):
+    response = client.post("/upload", data={"file": (io.BytesIO(CONTENT), "photo.png")},
+                           content_type="multipart/form-data")
+    assert response.status_code == 200
+    return response.get_json()["filename"]
+
+
+def create_post(client, image):
+    return client.post("/posts/create", json={
+        "instrument_type": "Guitar", "title": "Classical guitar", "brand": "Alhambra", "price": 300,
+        "description": "Solid cedar top", "phone_number": "12345678", "image": image,
+        "status": "for sale", "location": "Tunis",
+    })
+
+
+def registered(app, name):
+    with app.app_context():
+        return media_store.is_uploaded(name)
+
+
+def test_unreferenced_image_goes_with_the_account(app, uploads):
+    owner = sign_up(app, "owner@example.com")
+    name = upload(owner)
+    assert create_post(owner, name).status_code == 201
+    assert owner.delete(f"/users/user/{owner.user_id}").status_code == 200
+    assert not uploads.exists(name)
+    assert not registered(app, name)
+
+
+def test_image_another_post_uses_is_kept(app, uploads):
+    owner, other = sign_up(app, "owner@example.com"), sign_up(app, "other@example.com")
+    name = upload(owner)
+    assert create_post(owner, name).status_code == 201
+    assert create_post(other, upload(other)).status_code == 201
+    owner.delete(f"/users/user/{owner.user_id}")
+    assert uploads.exists(name)
+    assert registered(app, name)
+
+
+def test_upload_after_a_purge_stores_the_file_again(app, uploads):
+    owner, other = sign_up(app, "owner@example.com"), sign_up(app, "other@example.com")
+    name = upload(owner)
+    assert create_post(owner, name).status_code == 201
+    # Uploaded but not posted yet when the account goes: the purge takes the file
+    assert upload(other) == name
+    owner.delete(f"/users/user/{owner.user_id}")
+    assert not uploads.exists(name)
+    assert create_post(other, name).status_code == 400
+
+    assert upload(other) == name
+    assert uploads.exists(name)
+    assert create_post(other, name).status_code == 201
@@ -0,0 +1,64 @@
+"""
+Accept: application/x-ndjson streams a listing in constant memory.
+
+    python -m pytest tests/test_ndjson_streaming.py
+
+Seeds a 50k-row SQLite table (NDJSON_TEST_ROWS overrides the size) and
+reads /home/category back chunk by chunk, the way a WSGI server does, while
+tracemalloc records the peak of Python allocations. Buffering the rows, or
+the body, costs ten times the limit at that size; a stream stays
+around one batch, and its first rows are out before the last are read.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import json
+import tracemalloc
+import uuid
+from datetime import datetime
+
+import pytest
+
+ROWS = int(os.getenv("NDJSON_TEST_ROWS", "50000"))
+PEAK_LIMIT = 8 * 2 ** 20  # bytes; the stream peaks around 3.5 MB, the JSON listing of 50k rows above 80 MB
+
+
+@pytest.fixture
+def seeded(app, client):
+    from extensions import db
+    from models.post import Post
+    now = datetime.utcnow()
+    with app.app_context():
+        for start in range(0, ROWS, 10000):
+            db.session.execute(Post.__table__.insert(), [{
+                "id": str(uuid.uuid4()), "user_id": client.user_id, "instrument_type": "Drums", "brand": "Pearl",
+                "title": f"Drum kit {i}", "price": 400.0, "description": "Five piece kit with cymbals",
+                "phone_number": "12345678", "image": None, "availability": "available", "status": "for rental",
+                "location": "Sfax", "created_at": now, "updated_at": now,
+            } for i in range(start, min(start + 10000, ROWS))])
+        db.session.commit()
+    return client
+
+
+def test_ndjson_listing_peak_memory_is_bounded(seeded):
+    tracemalloc.start()
+    try:
+        response = seeded.get("/home/category", headers={"Accept": "application/x-ndjson"}, buffered=False)
+        assert response.status_code == 200
+        assert response.is_streamed
+        rows, first_chunk_rows, last = 0, None, None
+        for chunk in response.response:
+            lines = chunk.splitlines()
+            rows += len(lines)
+            if first_chunk_rows is None and lines:
+                first_chunk_rows = rows
+            last = lines[-1] if lines else last
+        response.close()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak < PEAK_LIMIT, f"streaming {ROWS} rows peaked at {peak / 2 ** 20:.1f} MB"
+    assert first_chunk_rows < ROWS, "the whole listing arrived in one chunk"
+    assert rows == ROWS
+    assert json.loads(last)["instrument_type"] == "Drums"
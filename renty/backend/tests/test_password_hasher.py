@@ -0,0 +1,40 @@
+"""PasswordHasher on a process pool: slots and timeouts"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import time
+
+import pytest
+from flask import Flask
+
+from auth.password_hasher import HasherOverloaded, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    app = Flask(__name__)
+    # 2 ** 15 bcrypt rounds take well over the timeout, even with the pool already started
+    app.config.update(BCRYPT_ROUNDS=15, PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_LIMIT=1,
+                      PASSWORD_HASH_TIMEOUT=0.2)
+    hasher = PasswordHasher()
+    hasher.init_app(app)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_timeout_is_overload_and_keeps_the_slot(hasher):
+    with pytest.raises(HasherOverloaded):
+        hasher.hash("correct horse")
+    # The job still runs in the pool and holds the only slot
+    started = time.monotonic()
+    with pytest.raises(HasherOverloaded):
+        hasher.hash("battery staple")
+    assert time.monotonic() - started < 0.1, "refused without waiting"
+
+
+def test_slot_comes_back_when_the_job_is_done(hasher):
+    hasher.timeout = 60
+    hasher.rounds = 4
+    hashed = hasher.hash("correct horse")
+    assert hasher.verify("correct horse", hashed)
+    assert hasher._slots.acquire(blocking=False)
@@ -0,0 +1,30 @@
+"""Post payloads with values of the wrong JSON type"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+import json
+
+import pytest
+
+POST = {"instrument_type": "Guitar", "title": "Classical guitar", "brand": "Alhambra", "price": 300,
+        "description": "Solid cedar top", "phone_number": "12345678", "status": "for sale", "location": "Tunis"}
+
+
+@pytest.mark.parametrize("image", [123, ["a.png"], {"url": "http://example.com/a.png"}, True])
+def test_image_that_is_not_a_string_is_a_field_error(client, image):
+    response = client.post("/posts/create", json=dict(POST, image=image))
+    assert response.status_code == 400
+    assert "image" in response.get_json()["fields"]
+
+
+# Python's JSON parser reads NaN and Infinity, which float() would let through
+@pytest.mark.parametrize("price", ["true", "NaN", "Infinity", "-Infinity", '"nan"', '"inf"', "1e999"])
+def test_price_must_be_a_finite_number(client, price):
+    body = json.dumps(dict(POST, price=0)).replace('"price": 0', f'"price": {price}')
+    response = client.post("/posts/create", data=body, content_type="application/json")
+    assert response.status_code == 400
+    assert "price" in response.get_json()["fields"]
+
+
+def test_price_as_a_numeric_string_is_accepted(client):
+    assert client.post("/posts/create", json=dict(POST, price="250.5")).status_code == 201
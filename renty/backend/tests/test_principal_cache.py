@@ -0,0 +1,59 @@
+"""Principal caches of two workers sharing an eviction log"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import pytest
+from flask import Flask
+
+from auth.principal_cache import PrincipalCache
+from services.shared_memory import shared_memory_path
+
+
+@pytest.fixture
+def workers():
+    name = f"renty_test_principals_{os.getpid()}"
+    app = Flask(__name__)
+    app.config.update(PRINCIPAL_CACHE_SHM_NAME=name, PRINCIPAL_CACHE_EVICTION_SLOTS=4)
+    caches = []
+    for _ in range(2):
+        cache = PrincipalCache()
+        cache.init_app(app)
+        caches.append(cache)
+    yield caches
+    for suffix in ("", ".lock"):
+        try:
+            os.remove(shared_memory_path(name) + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def verified(cache, user_id):
+    # What token_required does after the database found the user
+    if not cache.contains(user_id):
+        cache.add(user_id)
+
+
+def test_invalidate_evicts_only_that_user_everywhere(workers):
+    first, second = workers
+    for user_id in ("alice", "bob"):
+        verified(second, user_id)
+    first.invalidate("alice")
+    assert not second.contains("alice")
+    assert second.contains("bob")
+
+
+def test_user_evicted_during_the_lookup_is_not_cached(workers):
+    first, second = workers
+    assert not second.contains("alice")
+    first.invalidate("alice")  # deleted while the second worker queried it
+    second.add("alice")
+    assert not second.contains("alice")
+
+
+def test_worker_lapped_by_the_ring_starts_over(workers):
+    first, second = workers
+    verified(second, "bob")
+    for index in range(5):
+        first.invalidate(f"user {index}")
+    assert not second.contains("bob")
@@ -0,0 +1,61 @@
+"""Search backends: when the in-memory index changes, which words reach MySQL"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + "/..")
+
+import pytest
+
+from services.search import InMemoryBackend, MySQLFullTextBackend, search_index
+
+
+@pytest.fixture
+def memory_index(app, client):
+    app.config["SEARCH_BACKEND"] = "memory"
+    search_index.init_app(app)
+    return client
+
+
+def titles(client, query):
+    answer = client.get("/home/posts/search", query_string={"q": query}).get_json()
+    return [post["title"] for post in answer] if isinstance(answer, list) else []
+
+
+def test_memory_index_follows_commits_only(app, memory_index):
+    from extensions import db
+    from models.post import Post
+    created = memory_index.post("/posts/create", json={
+        "instrument_type": "Guitar", "title": "Ukulele soprano", "brand": "Kala", "price": 60,
+        "description": "Mahogany body", "phone_number": "12345678", "status": "for sale", "location": "Tunis",
+    })
+    post_id = created.get_json()["post_id"]
+    assert titles(memory_index, "ukulele") == ["Ukulele soprano"]
+
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        post.title = "Mandolin"
+        search_index.index_post(post)
+        db.session.rollback()
+    assert titles(memory_index, "mandolin") == []
+    assert titles(memory_index, "ukulele") == ["Ukulele soprano"]
+
+    with app.app_context():
+        search_index.remove_post(post_id)  # the context ends without a commit
+    assert titles(memory_index, "ukulele") == ["Ukulele soprano"]
+
+    assert memory_index.delete(f"/posts/posts/{post_id}").status_code == 200
+    assert titles(memory_index, "ukulele") == []
+
+
+def test_memory_index_refuses_several_workers(app, memory_index):
+    with app.app_context():
+        assert isinstance(search_index.backend, InMemoryBackend)
+        search_index.check_workers(1)
+        with pytest.raises(RuntimeError):
+            search_index.check_workers(4)
+
+
+def test_mysql_query_leaves_out_words_the_index_cannot_hold():
+    backend = MySQLFullTextBackend()
+    backend._min_token_size = 3
+    backend._stopwords = frozenset({"the", "with"})
+    assert backend._indexed_terms(["the", "yamaha", "p", "piano", "wi"]) == ["yamaha", "piano", "wi"]
@@ -0,0 +1,50 @@
+"""
+Production WSGI entry point.
+
+    flask --app app:create_app db upgrade        # schema, once per deploy
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+The app is built once in the master (preload_app in gunicorn.conf.py) and
+forked into the workers, so they start without importing and configuring
+everything again. Connections opened while building it are closed before
+the fork, and after_fork() throws away the engine pools a worker inherited:
+two processes must never share one database socket. Tables are not created
+here (ProductionConfig.CREATE_TABLES is off), the migrations own the schema;
+run `flask rebuild-facet-counts` once after the first upgrade.
+
+Other servers that fork after importing this module (uWSGI without
+lazy-apps, ...) must call check_workers() before forking and after_fork()
+from their post-fork hook.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('FLASK_ENV', 'production')
+
+from app import create_app
+from extensions import db
+from services.search import search_index
+
+app = create_app()
+
+
+def _dispose_engines(close):
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=close)
+
+
+def check_workers(workers):
+    """Refuse a configuration that only holds in one process, before `workers` of them are forked"""
+    with app.app_context():
+        search_index.check_workers(workers)
+    _dispose_engines(close=True)
+
+
+def after_fork():
+    """Give a freshly forked worker empty pools, leaving the parent's connections to the parent"""
+    _dispose_engines(close=False)
+
+
+# Nothing opened during startup is carried into the workers
+_dispose_engines(close=True)